@@ -0,0 +1,218 @@
+import argparse, json, math, os, sqlite3, threading, time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# La caché está desactivada salvo que se indique ANSWER_CACHE_PATH (p. ej. este valor)
+DEFAULT_ANSWER_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "answer_cache.sqlite")
+# Similitud coseno mínima entre preguntas para reutilizar una respuesta. Preguntas con respuestas
+# distintas pueden tener embeddings muy parecidos ("¿puedo tomarlo embarazada?" / "¿y durante la
+# lactancia?"), así que el valor por defecto es conservador y no está ajustado. Antes de activar la
+# caché conviene calcularlo para el modelo de embeddings en uso con pares de preguntas etiquetados:
+#   python answer_cache.py umbral pares.jsonl
+# que devuelve el menor umbral que no reutiliza la respuesta de ningún par con respuestas distintas
+DEFAULT_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "20000"))
+# Documentos (nregistro, tipo, apartados) cuyas respuestas se mantienen en memoria
+DEFAULT_MAX_LOADED = int(os.getenv("ANSWER_CACHE_MAX_LOADED", "1000"))
+
+
+class CachedAnswer(NamedTuple):
+    id: int
+    fecha: Optional[int]
+    vector: array  # Embedding normalizado de la pregunta
+    question: str
+    answer: str
+
+
+def _normalize(embedding: Sequence[float]) -> array:
+    norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+    return array("f", (x / norm for x in embedding))
+
+
+def _similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _secciones_key(secciones: Sequence[str]) -> str:
+    # Apartados de los que sale la respuesta; "" es el documento completo
+    return ",".join(sorted(set(secciones)))
+
+
+class SemanticAnswerCache:
+    """
+    Caché semántica de respuestas por documento de medicamento.
+    Cada respuesta se guarda con el nregistro, el tipo de documento, los apartados consultados,
+    la fecha del documento y el embedding de la pregunta. Una pregunta nueva sobre los mismos
+    apartados del mismo documento reutiliza la respuesta de la pregunta guardada más parecida si
+    su similitud coseno supera el umbral; dos preguntas parecidas que apuntan a apartados
+    distintos (embarazo frente a posología) nunca comparten respuesta. Las respuestas
+    caducan cuando cambia la fecha del documento y se expulsan por LRU al superar max_entries.
+    En memoria solo se mantienen las respuestas de los max_loaded documentos usados más recientemente.
+    """
+
+    def __init__(self, path: str = DEFAULT_ANSWER_CACHE_PATH, threshold: float = DEFAULT_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, max_loaded: int = DEFAULT_MAX_LOADED):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_loaded = max_loaded
+        self._lock = threading.Lock()
+        # Entradas cargadas en memoria por (nregistro, tipo, secciones) para comparar sin leer de
+        # disco, en orden LRU
+        self._loaded: "OrderedDict[tuple, List[CachedAnswer]]" = OrderedDict()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}
+            if columns and "secciones" not in columns:
+                # Tabla anterior sin los apartados en la clave: sus respuestas se descartan
+                self.conn.execute("DROP TABLE answers")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nregistro TEXT NOT NULL,
+                    tipo INTEGER NOT NULL,
+                    secciones TEXT NOT NULL,
+                    fecha INTEGER,
+                    question TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    answer TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS answers_documento ON answers(nregistro, tipo, secciones);
+                CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used);
+            """)
+
+    def _entries(self, nregistro: str, tipo: int, secciones: str) -> List[CachedAnswer]:
+        key = (nregistro, tipo, secciones)
+        entries = self._loaded.get(key)
+        if entries is not None:
+            self._loaded.move_to_end(key)
+        else:
+            rows = self.conn.execute(
+                "SELECT id, fecha, embedding, question, answer FROM answers WHERE nregistro = ? AND tipo = ? AND secciones = ?",
+                key,
+            ).fetchall()
+            entries = []
+            for id_, fecha, blob, question, answer in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                entries.append(CachedAnswer(id_, fecha, vector, question, answer))
+            self._loaded[key] = entries
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return entries
+
+    def lookup(self, nregistro: str, tipo: Optional[int], fecha: Optional[int],
+               embedding: Sequence[float], secciones: Sequence[str] = ()) -> Optional[CachedAnswer]:
+        """Devuelve la respuesta guardada más parecida, o None si ninguna supera el umbral."""
+        tipo = tipo or 0
+        query = _normalize(embedding)
+        with self._lock, self.conn:
+            key = (nregistro, tipo, _secciones_key(secciones))
+            entries = self._entries(*key)
+            stale = [entry.id for entry in entries if entry.fecha != fecha]
+            if stale:
+                # El documento ha cambiado en CIMA: sus respuestas ya no son válidas
+                self.conn.executemany("DELETE FROM answers WHERE id = ?", [(id_,) for id_ in stale])
+                entries[:] = [entry for entry in entries if entry.fecha == fecha]
+            if not entries:
+                # Documento sin respuestas válidas: no se mantiene en memoria
+                self._loaded.pop(key, None)
+                return None
+
+            best, best_score = None, self.threshold
+            for entry in entries:
+                score = _similarity(query, entry.vector)
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is not None:
+                self.conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), best.id))
+            return best
+
+    def store(self, nregistro: str, tipo: Optional[int], fecha: Optional[int], question: str,
+              embedding: Sequence[float], answer: str, secciones: Sequence[str] = ()) -> None:
+        tipo = tipo or 0
+        key = _secciones_key(secciones)
+        vector = _normalize(embedding)
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO answers (nregistro, tipo, secciones, fecha, question, embedding, answer, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (nregistro, tipo, key, fecha, question, vector.tobytes(), answer, time.time()),
+            )
+            self._entries(nregistro, tipo, key).append(CachedAnswer(cursor.lastrowid, fecha, vector, question, answer))
+            self._evict()
+
+    def _evict(self) -> None:
+        # Expulsión LRU de las respuestas que superan max_entries
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count <= self.max_entries:
+            return
+        rows = self.conn.execute(
+            "SELECT id FROM answers ORDER BY last_used LIMIT ?", (count - self.max_entries,)
+        ).fetchall()
+        evicted = {id_ for (id_,) in rows}
+        self.conn.executemany("DELETE FROM answers WHERE id = ?", [(id_,) for id_ in evicted])
+        for key, entries in list(self._loaded.items()):
+            entries[:] = [entry for entry in entries if entry.id not in evicted]
+            if not entries:
+                del self._loaded[key]
+
+    def invalidate(self, nregistro: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM answers WHERE nregistro = ?", (nregistro,))
+            for key in [key for key in self._loaded if key[0] == nregistro]:
+                del self._loaded[key]
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+_answer_cache = None
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    # Desactivada por defecto: solo se usa si ANSWER_CACHE_PATH indica dónde guardarla
+    global _answer_cache
+    path = os.getenv("ANSWER_CACHE_PATH", "")
+    if _answer_cache is None and path:
+        _answer_cache = SemanticAnswerCache(path)
+    return _answer_cache
+
+
+#================================================================================================
+# Ajuste del umbral
+def tune_threshold(pairs: Iterable[Tuple[Sequence[float], Sequence[float], bool]]) -> Dict[str, Optional[float]]:
+    """
+    A partir de pares (embedding a, embedding b, misma_respuesta) devuelve el menor umbral que no
+    reutilizaría la respuesta de ningún par con respuestas distintas y qué fracción de los pares
+    equivalentes se aprovecharía con él.
+    """
+    iguales, distintos = [], []
+    for a, b, misma_respuesta in pairs:
+        (iguales if misma_respuesta else distintos).append(_similarity(_normalize(a), _normalize(b)))
+    # El umbral se compara con >=, así que debe quedar justo por encima del peor par distinto
+    threshold = math.nextafter(max(distintos), math.inf) if distintos else None
+    aciertos = sum(score >= threshold for score in iguales) / len(iguales) if iguales and threshold is not None else None
+    return {"umbral": threshold, "aciertos": aciertos, "pares_iguales": len(iguales), "pares_distintos": len(distintos)}
+
+
+if __name__ == "__main__":
+    # pares.jsonl: una línea por par, {"a": "...", "b": "...", "misma_respuesta": true}
+    parser = argparse.ArgumentParser(description="Caché semántica de respuestas")
+    parser.add_argument("comando", choices=["umbral"])
+    parser.add_argument("pares", help="JSONL con pares de preguntas etiquetados")
+    args = parser.parse_args()
+
+    from param_extractor import get_engine
+    embedder = get_engine().embedder
+    with open(args.pares, encoding="utf-8") as f:
+        filas = [json.loads(linea) for linea in f if linea.strip()]
+    vectores = embedder.embed_documents([texto for fila in filas for texto in (fila["a"], fila["b"])])
+    pares = [(vectores[2 * i], vectores[2 * i + 1], bool(fila["misma_respuesta"])) for i, fila in enumerate(filas)]
+    print(json.dumps(tune_threshold(pares), ensure_ascii=False, indent=2))
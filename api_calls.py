@@ -1,13 +1,24 @@
-import requests, json, os, sys
-import httpx
+import requests, json, logging, os, sys, time
+from datetime import datetime
 from langchain.pydantic_v1 import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
-from pydantic_api_models import ListaMedicamentos, Medicamento, ListaPresentaciones
+from pydantic_api_models import ListaMedicamentos, Medicamento, ListaPresentaciones, Item
+from cima_client import CIMA_BASE_URL, CIMA_DOCS_BASE_URL, get_default_client
+from fast_decoding import decode, decode_pagina
+from row_views import decode_views
 
-# Base URL for the CIMA API
-CIMA_BASE_URL = "https://cima.aemps.es/cima/rest"
-CIMA_DOCS_BASE_URL = "https://cima.aemps.es/cima/dochtml"
+logger = logging.getLogger(__name__)
+
+# Réplica local opcional del catálogo (ver cima_mirror.CimaMirror). Si está activa, las consultas
+# que puede resolver con sus índices se responden localmente, sin llamar a la API de CIMA
+_mirror = None
+
+
+def set_mirror(mirror) -> None:
+    global _mirror
+    _mirror = mirror
 
 
 class MedicamentosQueryParams(BaseModel):
@@ -40,21 +51,25 @@ class MedicamentosQueryParams(BaseModel):
 # Fetch list of medications based on given conditions 
 #Devuelve una lista de objetos ListaMedicamentos o None si hay un error
 def get_medicamentos(params: MedicamentosQueryParams) -> Optional[List[ListaMedicamentos]]:
+    # Resolver desde la réplica local si está activa y admite todos los filtros
+    if _mirror is not None and _mirror.soporta(params):
+        return _mirror.buscar_medicamentos(params)
+
     # Prepare the query parameters, excluding unset fields
     query_params = params.dict(exclude_unset=True)
     
     try:
         # Make the request to the CIMA API
-        response = requests.get(f"{CIMA_BASE_URL}/medicamentos", params=query_params)
+        response = get_default_client().get(f"{CIMA_BASE_URL}/medicamentos", params=query_params)
         response.raise_for_status()  # Raises an HTTPError if the status is 4xx/5xx
-        response = response.json()  # Return the response in JSON format
-        print(response)
-        resultados = response["resultados"]
-        return [ListaMedicamentos(**med) for med in resultados]
+        # Vistas perezosas: los campos anidados solo se validan si se leen (ver row_views)
+        resultados = decode_views(response.content, ListaMedicamentos)
+        logger.debug("Respuesta de CIMA", extra={"endpoint": "/medicamentos", "resultados": len(resultados)})
+        return resultados
     
-    except requests.exceptions.RequestException as e:
-        # Imprimir el error en caso de una solicitud fallida
-        print(f"Error al hacer la consulta a la API de CIMA: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:  # ValueError: cuerpo vacío o que no se ajusta al modelo
+        # Registrar el error en caso de una solicitud fallida
+        logger.error(f"Error al hacer la consulta a la API de CIMA: {e}")
         return None
 
 #================================================================================================
@@ -66,20 +81,23 @@ class MedicamentosQueryParamsV2(BaseModel):
 
 def get_medicamentos_v2(params: MedicamentosQueryParams) -> Optional[List[ListaMedicamentos]]:
     
+    if _mirror is not None and _mirror.soporta(params):
+        return _mirror.buscar_medicamentos(params)
+
     query_params = params.dict(exclude_unset=True)
     
     try:
         # Make the request to the CIMA API
-        response = requests.get(f"{CIMA_BASE_URL}/medicamentos", params=query_params)
+        response = get_default_client().get(f"{CIMA_BASE_URL}/medicamentos", params=query_params)
         response.raise_for_status()  # Raises an HTTPError if the status is 4xx/5xx
-        response = response.json()  # Return the response in JSON format
-        print(response)
-        resultados = response["resultados"]
-        return [ListaMedicamentos(**med) for med in resultados]
+        # Vistas perezosas: los campos anidados solo se validan si se leen (ver row_views)
+        resultados = decode_views(response.content, ListaMedicamentos)
+        logger.debug("Respuesta de CIMA", extra={"endpoint": "/medicamentos", "resultados": len(resultados)})
+        return resultados
     
-    except requests.exceptions.RequestException as e:
-        # Imprimir el error en caso de una solicitud fallida
-        print(f"Error al hacer la consulta a la API de CIMA: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # Registrar el error en caso de una solicitud fallida
+        logger.error(f"Error al hacer la consulta a la API de CIMA: {e}")
         return None
 
 #================================================================================================
@@ -89,21 +107,25 @@ class MedicamentoQueryParams(BaseModel):
     nregistro: Optional[str] = Field(None, description="Nº de registro")
 
 # Función para hacer la solicitud a la API de CIMA
-def get_medicamento(params: MedicamentoQueryParams):
+def get_medicamento(params: MedicamentoQueryParams, usar_mirror: bool = True):
+    if usar_mirror and _mirror is not None:
+        medicamento = _mirror.get_medicamento(params)
+        if medicamento is not None:
+            return medicamento
+
     # Convertir los parámetros a un diccionario, excluyendo aquellos no proporcionados
     query_params = params.dict(exclude_unset=True)
 
     try:
         # Hacer la solicitud GET a la API de CIMA con los parámetros proporcionados
-        response = requests.get(f"{CIMA_BASE_URL}/medicamento", params=query_params)
+        response = get_default_client().get(f"{CIMA_BASE_URL}/medicamento", params=query_params)
         response.raise_for_status()  # Levantar excepción en caso de un error HTTP (4xx/5xx)
-        response = response.json()  # Devolver la respuesta en formato JSON
-        return Medicamento(**response)  # Convertir el JSON a un objeto Medicamento
+        return decode(response.content, Medicamento)  # Convertir el JSON a un objeto Medicamento
 
 
-    except requests.exceptions.RequestException as e:
-        # Imprimir el error en caso de una solicitud fallida
-        print(f"Error al hacer la consulta a la API de CIMA: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # Registrar el error en caso de una solicitud fallida
+        logger.error(f"Error al hacer la consulta a la API de CIMA: {e}")
         return None
 
 #================================================================================================
@@ -122,18 +144,16 @@ def buscar_en_ficha_tecnica(queries: List[FichaTecnicaQuery]):
 
     try:
         # Hacer la solicitud POST a la API de CIMA
-        response = requests.post(f"{CIMA_BASE_URL}/buscarEnFichaTecnica", json=query_list, headers=headers)
+        response = get_default_client().post(f"{CIMA_BASE_URL}/buscarEnFichaTecnica", json=query_list, headers=headers)
         response.raise_for_status()  # Levantar excepción en caso de error HTTP (4xx/5xx)
-        response = response.json()  # Return the response in JSON format
-        resultados = response["resultados"]
-        return [ListaMedicamentos(**med) for med in resultados]
+        return decode_views(response.content, ListaMedicamentos)
     
 
 
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         # Manejar errores en la solicitud HTTP
-        print(f"Error al hacer la consulta a la API de CIMA: {e}")
+        logger.error(f"Error al hacer la consulta a la API de CIMA: {e}")
         return None
 
 #================================================================================================
@@ -155,16 +175,68 @@ def get_presentaciones(query_params: PresentacionesQueryParams) -> Optional[List
     
     try:
         # Make the GET request to the CIMA API
-        response = requests.get(f"{CIMA_BASE_URL}/presentaciones", params=params)
+        response = get_default_client().get(f"{CIMA_BASE_URL}/presentaciones", params=params)
         response.raise_for_status()
-        response = response.json()
-        resultados = response["resultados"]
-        return [ListaPresentaciones(**med) for med in resultados]  # Convertir a objetos
+        return decode_views(response.content, ListaPresentaciones)  # Convertir a objetos
     
     # ListaPresentaciones
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from CIMA API: {e}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error fetching data from CIMA API: {e}")
         return None
+
+#================================================================================================
+# Iteradores paginados: recorren todas las páginas del resultado de CIMA en lugar de solo la primera
+def _iter_paginas(url: str, query_params: Dict[str, Any], tamanio_pagina: Optional[int] = None, modelo=None) -> Iterator[List[Any]]:
+    """
+    Devuelve las páginas ("resultados") de un endpoint paginado siguiendo pagina/tamanioPagina
+    hasta totalFilas. La página siguiente se descarga en segundo plano mientras se consume la actual.
+    Con modelo (un modelo de pydantic_api_models), cada página se decodifica con fast_decoding en
+    el mismo hilo de la descarga y se entregan objetos tipados en lugar de diccionarios.
+    Los errores HTTP se propagan (requests.exceptions.RequestException) para no truncar resultados en silencio.
+    """
+    def fetch(pagina: int) -> Tuple[List[Any], int, Optional[int]]:
+        params = dict(query_params, pagina=pagina)
+        if tamanio_pagina:
+            params["tamanioPagina"] = tamanio_pagina
+        response = get_default_client().get(url, params=params)
+        response.raise_for_status()
+        if modelo is not None:
+            data = decode_pagina(response.content, modelo)
+            return data.resultados, data.totalFilas or 0, data.tamanioPagina
+        data = response.json()
+        return data.get("resultados") or [], data.get("totalFilas", 0), data.get("tamanioPagina")
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        pagina = 1
+        future = executor.submit(fetch, pagina)
+        while future is not None:
+            resultados, total_filas, tamanio = future.result()
+            tamanio = tamanio or len(resultados)
+
+            # Lanzar la descarga de la siguiente página antes de entregar la actual
+            future = None
+            if resultados and pagina * tamanio < total_filas:
+                pagina += 1
+                future = executor.submit(fetch, pagina)
+
+            yield resultados
+    finally:
+        # Si el consumidor abandona la iteración no se espera a la página precargada
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_medicamentos(params: MedicamentosQueryParams, tamanio_pagina: Optional[int] = None) -> Iterator[ListaMedicamentos]:
+    # Devuelve uno a uno todos los medicamentos que cumplen las condiciones, en memoria acotada
+    for resultados in _iter_paginas(f"{CIMA_BASE_URL}/medicamentos", params.dict(exclude_unset=True), tamanio_pagina, ListaMedicamentos):
+        yield from resultados
+
+
+def iter_presentaciones(params: PresentacionesQueryParams, tamanio_pagina: Optional[int] = None) -> Iterator[ListaPresentaciones]:
+    # Devuelve una a una todas las presentaciones que cumplen las condiciones, en memoria acotada
+    for resultados in _iter_paginas(f"{CIMA_BASE_URL}/presentaciones", params.dict(exclude_unset=True), tamanio_pagina, ListaPresentaciones):
+        yield from resultados
+
 #================================================================================================
 class PresentacionQueryParams(BaseModel):
     codNacional: str = Field(..., description="Código nacional del medicamento")
@@ -172,11 +244,11 @@ class PresentacionQueryParams(BaseModel):
 def get_presentacion(params: PresentacionQueryParams) -> Optional[Dict[str, Any]]:
     #Devuelve la información de una presentación pasando el código nacional
     try:
-        response = requests.get(f"{CIMA_BASE_URL}/presentacion", params=params.dict())
+        response = get_default_client().get(f"{CIMA_BASE_URL}/presentacion", params=params.dict())
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from CIMA API: {e}")
+        logger.error(f"Error fetching data from CIMA API: {e}")
         return None
 
 #================================================================================================
@@ -196,11 +268,11 @@ def get_vmpp(query_params: VmppQueryParams):
     
     try:
         # Make the GET request to the CIMA API
-        response = requests.get(f"{CIMA_BASE_URL}/vmpp", params=params)
+        response = get_default_client().get(f"{CIMA_BASE_URL}/vmpp", params=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from CIMA API: {e}")
+        logger.error(f"Error fetching data from CIMA API: {e}")
         return None
 
 
@@ -221,12 +293,19 @@ def get_maestras(query_params: MaestrasQueryParams) -> dict:
     params = query_params.dict(exclude_unset=True)
     
     try:
-        response = requests.get(f"{CIMA_BASE_URL}/maestras", params=params)
+        response = get_default_client().get(f"{CIMA_BASE_URL}/maestras", params=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from CIMA API: {e}")
+        logger.error(f"Error fetching data from CIMA API: {e}")
         return None
+
+
+def iter_maestras(query_params: MaestrasQueryParams, tamanio_pagina: Optional[int] = None) -> Iterator[Item]:
+    # Devuelve uno a uno todos los elementos de la maestra, recorriendo todas las páginas
+    for resultados in _iter_paginas(f"{CIMA_BASE_URL}/maestras", query_params.dict(exclude_unset=True), tamanio_pagina):
+        for item in resultados:
+            yield Item(**item)
     
 
 #================================================================================================
@@ -240,11 +319,11 @@ def get_registro_cambios(query_params: RegistroCambiosQueryParams) -> dict:
     params = query_params.dict(exclude_unset=True)
     
     try:
-        response = requests.get(f"{CIMA_BASE_URL}/registroCambios", params=params)
+        response = get_default_client().get(f"{CIMA_BASE_URL}/registroCambios", params=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from CIMA API: {e}")
+        logger.error(f"Error fetching data from CIMA API: {e}")
         return None
 
 
@@ -252,13 +331,44 @@ def post_registro_cambios(query_params: RegistroCambiosQueryParams) -> dict:
     params = query_params.dict(exclude_unset=True)
     
     try:
-        response = requests.post(f"{CIMA_BASE_URL}/registroCambios", json=params)
+        response = get_default_client().post(f"{CIMA_BASE_URL}/registroCambios", json=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from CIMA API: {e}")
+        logger.error(f"Error fetching data from CIMA API: {e}")
         return None
 
+
+# Invalidar en la caché de respuestas solo los medicamentos que han cambiado desde la última sincronización.
+# La ejecuta periódicamente server.py; también a mano con: python api_calls.py sincronizar-cache
+def sincronizar_cache() -> Optional[int]:
+    cache = get_default_client().cache
+    if cache is None:
+        return 0
+
+    inicio = time.time()
+    last_sync = cache.get_meta("last_sync")
+    desde = float(last_sync) if last_sync else cache.oldest_entry_time()
+    if desde is None:
+        # Caché vacía: no hay nada que invalidar
+        cache.set_meta("last_sync", str(inicio))
+        return 0
+
+    params = RegistroCambiosQueryParams(fecha=datetime.fromtimestamp(desde).strftime("%d/%m/%Y"))
+    try:
+        nregistros = {
+            cambio["nregistro"]
+            for resultados in _iter_paginas(f"{CIMA_BASE_URL}/registroCambios", params.dict(exclude_unset=True))
+            for cambio in resultados if cambio.get("nregistro")
+        }
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error fetching data from CIMA API: {e}")
+        return None
+
+    eliminadas = cache.invalidate_nregistros(nregistros)
+    cache.set_meta("last_sync", str(inicio))
+    return eliminadas
+
 #================================================================================================
 # Definir una clase Pydantic para los parámetros de consulta del docSegmentado/secciones
 # Pydantic model para los parámetros del documento segmentado secciones
@@ -272,11 +382,11 @@ def get_doc_segmentado_secciones(query_params: DocSegmentadoSeccionesParams) ->
     params = query_params.dict(exclude={"tipoDoc"})  # Excluir tipoDoc del diccionario de parámetros, ya que está en la URL
 
     try:
-        response = requests.get(url, params=params)
+        response = get_default_client().get(url, params=params)
         response.raise_for_status()  # Levantar excepción en caso de error HTTP (4xx/5xx)
         return response.json()  # Devolver la respuesta JSON
     except requests.exceptions.RequestException as e:
-        print(f"Error al obtener las secciones del documento: {e}")
+        logger.error(f"Error al obtener las secciones del documento: {e}")
         return None
 
 #================================================================================================
@@ -289,9 +399,9 @@ class DocSegmentadoContenidoParams(BaseModel):
     seccion: Optional[str] = Field(None, description="ID de la sección a devolver. Si es nulo, devuelve todas las secciones")
 
 # Función para limpiar el marcado HTML usando BeautifulSoup
-def filter_html_text(html_texto: str) -> str:
+def filter_html_text(html_texto: str, separator: str = "") -> str:
     soup = BeautifulSoup(html_texto, "html.parser")
-    return soup.get_text()
+    return soup.get_text(separator)
 
 
 # Función para obtener el contenido del documento segmentado
@@ -301,7 +411,7 @@ def get_doc_segmentado_contenido(query_params: DocSegmentadoContenidoParams, acc
     headers = {"Accept": accept} if accept else {}
 
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = get_default_client().get(url, params=params, headers=headers)
         response.raise_for_status()  # Levantar excepción en caso de error HTTP (4xx/5xx)
         
         # Procesar la respuesta en función del valor de "Accept"
@@ -315,7 +425,7 @@ def get_doc_segmentado_contenido(query_params: DocSegmentadoContenidoParams, acc
             # Si no se especifica un tipo, devolver en formato JSON por defecto
             return response.json()
     except requests.exceptions.RequestException as e:
-        print(f"Error al obtener el contenido del documento: {e}")
+        logger.error(f"Error al obtener el contenido del documento: {e}")
         return None
 #================================================================================================
 
@@ -328,11 +438,11 @@ def get_ficha_tecnica_completa(params: FichaTecnicaCompletaParams) -> Optional[s
     url = f"{CIMA_DOCS_BASE_URL}/ft/{params.nregistro}/FichaTecnica.html"
     
     try:
-        response = requests.get(url)
+        response = get_default_client().get(url)
         response.raise_for_status()  # Verificar si hay errores HTTP
         return response.text  # Devolver el contenido HTML
     except requests.exceptions.RequestException as e:
-        print(f"Error al obtener la ficha técnica completa: {e}")
+        logger.error(f"Error al obtener la ficha técnica completa: {e}")
         return None
 
 #================================================================================================
@@ -346,11 +456,11 @@ def get_ficha_tecnica_seccion(params: FichaTecnicaSeccionParams) -> Optional[str
     url = f"{CIMA_DOCS_BASE_URL}/ft/{params.nregistro}/{params.seccion}/FichaTecnica.html"
     
     try:
-        response = requests.get(url)
+        response = get_default_client().get(url)
         response.raise_for_status()  # Verificar si hay errores HTTP
         return response.text  # Devolver el contenido HTML
     except requests.exceptions.RequestException as e:
-        print(f"Error al obtener la sección {params.seccion} de la ficha técnica: {e}")
+        logger.error(f"Error al obtener la sección {params.seccion} de la ficha técnica: {e}")
         return None
 #================================================================================================
 # Modelo para los parámetros del prospecto completo
@@ -363,11 +473,11 @@ def get_prospecto_completo(params: ProspectoCompletoParams) -> Optional[str]:
     url = f"{CIMA_DOCS_BASE_URL}/p/{params.nregistro}/Prospecto.html"
     
     try:
-        response = requests.get(url)
+        response = get_default_client().get(url)
         response.raise_for_status()  # Verificar si hay errores HTTP
         return filter_html_text(response.text)  # Devolver el contenido HTML filtrado
     except requests.exceptions.RequestException as e:
-        print(f"Error al obtener el prospecto completo: {e}")
+        logger.error(f"Error al obtener el prospecto completo: {e}")
         return None
 
 #================================================================================================
@@ -381,11 +491,11 @@ def get_prospecto_seccion(params: ProspectoSeccionParams) -> Optional[str]:
     url = f"{CIMA_DOCS_BASE_URL}/p/{params.nregistro}/{params.seccion}/Prospecto.html"
     
     try:
-        response = requests.get(url)
+        response = get_default_client().get(url)
         response.raise_for_status()  # Verificar si hay errores HTTP
         return response.text  # Devolver el contenido HTML
     except requests.exceptions.RequestException as e:
-        print(f"Error al obtener la sección {params.seccion} del prospecto: {e}")
+        logger.error(f"Error al obtener la sección {params.seccion} del prospecto: {e}")
         return None
 
 
@@ -398,6 +508,10 @@ def get_prospecto_seccion(params: ProspectoSeccionParams) -> Optional[str]:
 
 #================================================================================================
 if __name__ == "__main__":
+    if sys.argv[1:] == ["sincronizar-cache"]:
+        print(f"Entradas de la caché invalidadas: {sincronizar_cache()}")
+        sys.exit(0)
+
     # Probar todas las funciones aquí
     prueba = "Nada"
    
@@ -0,0 +1,277 @@
+import asyncio, logging
+import httpx
+from typing import List, Optional, Dict, Any, Callable, Awaitable, Iterable, TypeVar
+from pydantic_api_models import ListaMedicamentos, Medicamento, ListaPresentaciones
+from cima_client import (
+    CIMA_BASE_URL, CIMA_DOCS_BASE_URL, DEFAULT_TIMEOUT, ENDPOINT_TIMEOUTS, RETRY_STATUS_CODES, Timeout,
+)
+from api_calls import (
+    MedicamentosQueryParams, MedicamentoQueryParams, FichaTecnicaQuery,
+    PresentacionesQueryParams, PresentacionQueryParams, VmppQueryParams, MaestrasQueryParams,
+    RegistroCambiosQueryParams, DocSegmentadoSeccionesParams, DocSegmentadoContenidoParams,
+    FichaTecnicaCompletaParams, FichaTecnicaSeccionParams, ProspectoCompletoParams, ProspectoSeccionParams,
+    filter_html_text,
+)
+from fast_decoding import decode
+from row_views import decode_views
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _decode_or_none(decoder: Callable[[bytes, Any], R], content: bytes, modelo: Any) -> Optional[R]:
+    # Cuerpo vacío (p. ej. CN desconocido) o que no se ajusta al modelo: None, como un error HTTP
+    try:
+        return decoder(content, modelo)
+    except ValueError as e:
+        logger.error(f"Respuesta de CIMA no válida para {modelo.__name__}: {e}")
+        return None
+
+
+def _httpx_timeout(timeout: Timeout) -> httpx.Timeout:
+    # Convertir el formato (conexión, lectura) de requests al de httpx
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+class AsyncCimaClient:
+    """
+    Versión asíncrona (httpx) de las funciones de api_calls.
+    Cada método equivale a la función homónima del módulo síncrono y devuelve None si la
+    consulta falla. Los métodos gather_* lanzan muchas consultas a la vez con un límite de
+    concurrencia, de forma que un único worker puede mantener cientos de consultas en vuelo.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        max_concurrency: int = 20,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        default_timeout: Timeout = DEFAULT_TIMEOUT,
+        timeouts: Optional[Dict[str, Timeout]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.default_timeout = default_timeout
+        self.timeouts = dict(ENDPOINT_TIMEOUTS if timeouts is None else timeouts)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    #================================================================================================
+    # Peticiones HTTP con timeouts por endpoint y reintentos con backoff en 5xx/429
+    def timeout_for(self, url: str) -> Timeout:
+        matches = [fragment for fragment in self.timeouts if fragment in url]
+        if not matches:
+            return self.default_timeout
+        return self.timeouts[max(matches, key=len)]
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        # Respetar la cabecera Retry-After si el servidor la envía
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return float(response.headers["Retry-After"])
+        return self.backoff_factor * (2 ** attempt)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        with span("cima_http", method=method, url=url) as current:
+            response = await self._request(method, url, **kwargs)
+            current.set(status=response.status_code)
+            return response
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        kwargs.setdefault("timeout", _httpx_timeout(self.timeout_for(url)))
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def _get_json(self, url: str, params: Optional[Dict[str, Any]] = None, error_msg: str = "Error fetching data from CIMA API") -> Optional[Any]:
+        try:
+            response = await self.get(url, params=params)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:  # ValueError: cuerpo vacío o que no es JSON
+            logger.error(f"{error_msg}: {e}")
+            return None
+
+    async def _get_content(self, url: str, params: Optional[Dict[str, Any]] = None, error_msg: str = "Error fetching data from CIMA API") -> Optional[bytes]:
+        # Bytes de la respuesta, para decodificarlos con fast_decoding sin pasar por json
+        try:
+            response = await self.get(url, params=params)
+            response.raise_for_status()
+            return response.content
+        except httpx.HTTPError as e:
+            logger.error(f"{error_msg}: {e}")
+            return None
+
+    async def _get_text(self, url: str, error_msg: str) -> Optional[str]:
+        try:
+            response = await self.get(url)
+            response.raise_for_status()
+            return response.text
+        except httpx.HTTPError as e:
+            logger.error(f"{error_msg}: {e}")
+            return None
+
+    #================================================================================================
+    # Endpoints de la API de CIMA
+    async def get_medicamentos(self, params: MedicamentosQueryParams) -> Optional[List[ListaMedicamentos]]:
+        content = await self._get_content(f"{CIMA_BASE_URL}/medicamentos", params.dict(exclude_unset=True), "Error al hacer la consulta a la API de CIMA")
+        if content is None:
+            return None
+        return _decode_or_none(decode_views, content, ListaMedicamentos)
+
+    async def get_medicamentos_v2(self, params: MedicamentosQueryParams) -> Optional[List[ListaMedicamentos]]:
+        return await self.get_medicamentos(params)
+
+    async def get_medicamento(self, params: MedicamentoQueryParams) -> Optional[Medicamento]:
+        content = await self._get_content(f"{CIMA_BASE_URL}/medicamento", params.dict(exclude_unset=True), "Error al hacer la consulta a la API de CIMA")
+        if content is None:
+            return None
+        return _decode_or_none(decode, content, Medicamento)
+
+    async def buscar_en_ficha_tecnica(self, queries: List[FichaTecnicaQuery]) -> Optional[List[ListaMedicamentos]]:
+        query_list = [query.dict() for query in queries]
+        try:
+            response = await self.post(f"{CIMA_BASE_URL}/buscarEnFichaTecnica", json=query_list)
+            response.raise_for_status()
+            return decode_views(response.content, ListaMedicamentos)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error al hacer la consulta a la API de CIMA: {e}")
+            return None
+
+    async def get_presentaciones(self, query_params: PresentacionesQueryParams) -> Optional[List[ListaPresentaciones]]:
+        content = await self._get_content(f"{CIMA_BASE_URL}/presentaciones", query_params.dict(exclude_unset=True))
+        if content is None:
+            return None
+        return _decode_or_none(decode_views, content, ListaPresentaciones)
+
+    async def get_presentacion(self, params: PresentacionQueryParams) -> Optional[Dict[str, Any]]:
+        return await self._get_json(f"{CIMA_BASE_URL}/presentacion", params.dict())
+
+    async def get_vmpp(self, query_params: VmppQueryParams):
+        return await self._get_json(f"{CIMA_BASE_URL}/vmpp", query_params.dict(exclude_unset=True))
+
+    async def get_maestras(self, query_params: MaestrasQueryParams) -> dict:
+        return await self._get_json(f"{CIMA_BASE_URL}/maestras", query_params.dict(exclude_unset=True))
+
+    async def get_registro_cambios(self, query_params: RegistroCambiosQueryParams) -> dict:
+        return await self._get_json(f"{CIMA_BASE_URL}/registroCambios", query_params.dict(exclude_unset=True))
+
+    async def post_registro_cambios(self, query_params: RegistroCambiosQueryParams) -> dict:
+        try:
+            response = await self.post(f"{CIMA_BASE_URL}/registroCambios", json=query_params.dict(exclude_unset=True))
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error fetching data from CIMA API: {e}")
+            return None
+
+    async def get_doc_segmentado_secciones(self, query_params: DocSegmentadoSeccionesParams) -> Optional[Dict[str, Any]]:
+        url = f"{CIMA_BASE_URL}/docSegmentado/secciones/{query_params.tipoDoc}"
+        return await self._get_json(url, query_params.dict(exclude={"tipoDoc"}), "Error al obtener las secciones del documento")
+
+    async def get_doc_segmentado_contenido(self, query_params: DocSegmentadoContenidoParams, accept: Optional[str] = None) -> Optional[Any]:
+        url = f"{CIMA_BASE_URL}/docSegmentado/contenido/{query_params.tipoDoc}"
+        params = query_params.dict(exclude={"tipoDoc"})
+        headers = {"Accept": accept} if accept else {}
+
+        try:
+            response = await self.get(url, params=params, headers=headers)
+            response.raise_for_status()
+            if accept in ("text/plain", "text/html"):
+                return response.text
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error al obtener el contenido del documento: {e}")
+            return None
+
+    async def get_ficha_tecnica_completa(self, params: FichaTecnicaCompletaParams) -> Optional[str]:
+        url = f"{CIMA_DOCS_BASE_URL}/ft/{params.nregistro}/FichaTecnica.html"
+        return await self._get_text(url, "Error al obtener la ficha técnica completa")
+
+    async def get_ficha_tecnica_seccion(self, params: FichaTecnicaSeccionParams) -> Optional[str]:
+        url = f"{CIMA_DOCS_BASE_URL}/ft/{params.nregistro}/{params.seccion}/FichaTecnica.html"
+        return await self._get_text(url, f"Error al obtener la sección {params.seccion} de la ficha técnica")
+
+    async def get_prospecto_completo(self, params: ProspectoCompletoParams) -> Optional[str]:
+        url = f"{CIMA_DOCS_BASE_URL}/p/{params.nregistro}/Prospecto.html"
+        html = await self._get_text(url, "Error al obtener el prospecto completo")
+        return filter_html_text(html) if html is not None else None
+
+    async def get_prospecto_seccion(self, params: ProspectoSeccionParams) -> Optional[str]:
+        url = f"{CIMA_DOCS_BASE_URL}/p/{params.nregistro}/{params.seccion}/Prospecto.html"
+        return await self._get_text(url, f"Error al obtener la sección {params.seccion} del prospecto")
+
+    #================================================================================================
+    # Consultas concurrentes con un límite de peticiones simultáneas
+    async def gather(self, fn: Callable[[T], Awaitable[R]], items: Iterable[T], max_concurrency: Optional[int] = None) -> List[Optional[R]]:
+        """
+        Ejecuta fn sobre cada elemento con, como mucho, max_concurrency peticiones en vuelo.
+        Devuelve los resultados en el mismo orden que los elementos de entrada; los elementos
+        cuya consulta lanza una excepción dan None, sin cancelar el resto.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def bounded(item: T) -> Optional[R]:
+            async with semaphore:
+                try:
+                    return await fn(item)
+                except Exception as e:
+                    logger.error(f"Error en la consulta concurrente de {item!r}: {e}")
+                    return None
+
+        return await asyncio.gather(*(bounded(item) for item in items))
+
+    async def gather_medicamentos(self, params_list: Iterable[MedicamentoQueryParams], max_concurrency: Optional[int] = None) -> List[Optional[Medicamento]]:
+        return await self.gather(self.get_medicamento, params_list, max_concurrency)
+
+    async def gather_presentaciones(self, params_list: Iterable[PresentacionesQueryParams], max_concurrency: Optional[int] = None) -> List[Optional[List[ListaPresentaciones]]]:
+        return await self.gather(self.get_presentaciones, params_list, max_concurrency)
+
+    async def gather_doc_segmentado_contenido(self, params_list: Iterable[DocSegmentadoContenidoParams], accept: Optional[str] = None, max_concurrency: Optional[int] = None) -> List[Optional[Any]]:
+        return await self.gather(lambda params: self.get_doc_segmentado_contenido(params, accept), params_list, max_concurrency)
+
+
+#================================================================================================
+if __name__ == "__main__":
+    async def main():
+        async with AsyncCimaClient() as client:
+            params = [MedicamentoQueryParams(cn=cn) for cn in ("765692", "765699", "726684")]
+            for medicamento in await client.gather_medicamentos(params):
+                print(medicamento.nombre if medicamento else None)
+
+    asyncio.run(main())
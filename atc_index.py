@@ -0,0 +1,243 @@
+import argparse, json, os, pickle, re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from api_calls import MaestrasQueryParams, iter_maestras
+from text_normalization import fold_text
+
+DEFAULT_ATC_INDEX_PATH = os.getenv(
+    "ATC_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "atc_index.pkl")
+)
+
+# Maestra de CIMA con los códigos ATC
+MAESTRA_ATC = 7
+
+# Campos de las entradas de DICCIONARIO_ATC.xml del nomenclátor (ver pruebas/files_loader.py)
+CAMPO_CODIGO = "codigoatc"
+CAMPO_NOMBRE = "descatc"
+
+# Longitud del código en cada uno de los 5 niveles: grupo anatómico (N), terapéutico (N02),
+# farmacológico (N02B), químico (N02BE) y principio activo (N02BE01)
+LONGITUDES_NIVEL = (1, 3, 4, 5, 7)
+
+_CODIGO = re.compile(r"^[A-Z](?:\d{2}(?:[A-Z](?:[A-Z](?:\d{2})?)?)?)?$")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Longitud mínima de las palabras del texto para buscarlas como prefijo de las de los nombres
+MIN_LONGITUD_PREFIJO = 4
+
+
+def nivel(codigo: str) -> Optional[int]:
+    # Nivel (1-5) de un código ATC bien formado; None si no lo es
+    codigo = codigo.strip().upper()
+    if not _CODIGO.match(codigo):
+        return None
+    return LONGITUDES_NIVEL.index(len(codigo)) + 1
+
+
+def padre(codigo: str) -> Optional[str]:
+    n = nivel(codigo)
+    return codigo[:LONGITUDES_NIVEL[n - 2]] if n and n > 1 else None
+
+
+def _clave(nombre: str) -> str:
+    return " ".join(_TOKEN.findall(fold_text(nombre)))
+
+
+class AtcIndex:
+    """
+    Jerarquía ATC en memoria: un trie de 5 niveles en el que cada nodo es un código y sus hijos
+    los códigos del nivel siguiente que lo extienden (N02 -> N02A, N02B...). Permite expandir un
+    grupo a todos sus descendientes y resolver nombres ("analgésicos") a códigos sin red ni LLM.
+    Los códigos intermedios que falten en la fuente se crean sin nombre para no romper el árbol.
+    """
+
+    def __init__(self):
+        self.nombres: Dict[str, str] = {}  # código -> nombre
+        self.hijos: Dict[str, List[str]] = {"": []}  # código -> códigos hijos ("" es la raíz)
+        self.por_nombre: Dict[str, List[str]] = {}  # nombre normalizado -> códigos
+        self.max_palabras = 0  # Palabras del nombre más largo (para find)
+
+    #================================================================================================
+    # Construcción
+    def add(self, codigo: str, nombre: Optional[str] = None) -> None:
+        codigo = codigo.strip().upper()
+        if nivel(codigo) is None:
+            return
+        if nombre:
+            self.nombres[codigo] = nombre.strip()
+        if codigo in self.hijos:
+            return
+        self.hijos[codigo] = []
+        ancestro = padre(codigo)
+        if ancestro is not None and ancestro not in self.hijos:
+            self.add(ancestro)
+        self.hijos[ancestro or ""].append(codigo)
+
+    def compile(self) -> "AtcIndex":
+        for hijos in self.hijos.values():
+            hijos.sort()
+        self.por_nombre = {}
+        for codigo, nombre in sorted(self.nombres.items()):
+            clave = _clave(nombre)
+            if clave:
+                self.por_nombre.setdefault(clave, []).append(codigo)
+        self.max_palabras = max((len(clave.split()) for clave in self.por_nombre), default=0)
+        return self
+
+    @classmethod
+    def build(cls, entradas: Iterable[Tuple[str, Optional[str]]]) -> "AtcIndex":
+        index = cls()
+        for codigo, nombre in entradas:
+            if codigo:
+                index.add(codigo, nombre)
+        return index.compile()
+
+    @classmethod
+    def build_from_cima(cls) -> "AtcIndex":
+        return cls.build((item.codigo, item.nombre) for item in iter_maestras(MaestrasQueryParams(maestra=MAESTRA_ATC)))
+
+    @classmethod
+    def build_from_nomenclator(cls, path: str) -> "AtcIndex":
+        # DICCIONARIO_ATC en XML o en el JSONL que genera pruebas/files_loader.py
+        if path.endswith(".jsonl"):
+            def registros() -> Iterator[dict]:
+                with open(path, encoding="utf-8") as f:
+                    for linea in f:
+                        if linea.strip():
+                            yield json.loads(linea)
+        else:
+            from pruebas.files_loader import iter_registros
+            registros = lambda: iter_registros(path)
+        return cls.build((r.get(CAMPO_CODIGO), r.get(CAMPO_NOMBRE)) for r in registros())
+
+    def save(self, path: str = DEFAULT_ATC_INDEX_PATH) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_ATC_INDEX_PATH) -> "AtcIndex":
+        index = cls()
+        with open(path, "rb") as f:
+            index.__dict__.update(pickle.load(f))
+        return index
+
+    #================================================================================================
+    # Consultas
+    def __contains__(self, codigo: str) -> bool:
+        return codigo.strip().upper() in self.hijos
+
+    def nombre(self, codigo: str) -> Optional[str]:
+        return self.nombres.get(codigo.strip().upper())
+
+    def ancestros(self, codigo: str) -> List[str]:
+        # Del grupo anatómico al padre directo
+        resultado = []
+        codigo = padre(codigo.strip().upper())
+        while codigo is not None:
+            resultado.append(codigo)
+            codigo = padre(codigo)
+        return resultado[::-1]
+
+    def descendientes(self, codigo: str, nivel_max: Optional[int] = None) -> List[str]:
+        """Códigos del subárbol (sin incluir el propio), en orden; con nivel_max, solo hasta ese nivel."""
+        resultado = []
+        pendientes = list(reversed(self.hijos.get(codigo.strip().upper(), [])))
+        while pendientes:
+            actual = pendientes.pop()
+            if nivel_max is not None and nivel(actual) > nivel_max:
+                continue
+            resultado.append(actual)
+            pendientes.extend(reversed(self.hijos.get(actual, [])))
+        return resultado
+
+    def principios_activos(self, codigo: str) -> List[str]:
+        # Códigos de nivel 5 bajo un grupo (o el propio código si ya es de nivel 5)
+        codigo = codigo.strip().upper()
+        if nivel(codigo) == 5:
+            return [codigo] if codigo in self.hijos else []
+        return [c for c in self.descendientes(codigo) if nivel(c) == 5]
+
+    def codigos(self, nombre: str) -> List[str]:
+        # Códigos cuyo nombre coincide exactamente (sin acentos ni mayúsculas)
+        return list(self.por_nombre.get(_clave(nombre), []))
+
+    def resolver(self, texto: str) -> List[str]:
+        """
+        Códigos a los que se refiere un valor del filtro atc: el propio código si lo es, los
+        nombres que coinciden exactamente o, si no hay ninguno, los nombres en los que cada
+        palabra del texto es el principio de una palabra ("analgesico" -> N02). Las palabras de
+        menos de MIN_LONGITUD_PREFIJO letras no se buscan así ("a" no resuelve a nada). Se
+        devuelven solo los grupos más generales: los descendientes de un código ya incluido
+        están cubiertos por él.
+        """
+        codigo = texto.strip().upper()
+        if codigo in self.hijos and codigo:
+            return [codigo]
+        encontrados = self.codigos(texto)
+        if not encontrados:
+            prefijos = [p for p in _TOKEN.findall(fold_text(texto)) if len(p) >= MIN_LONGITUD_PREFIJO]
+            if not prefijos:
+                return []
+            encontrados = [
+                c for nombre, codigos in self.por_nombre.items()
+                if all(any(palabra.startswith(p) for palabra in nombre.split()) for p in prefijos)
+                for c in codigos
+            ]
+        encontrados = sorted(set(encontrados), key=lambda c: (len(c), c))
+        return [c for c in encontrados if not any(c.startswith(g) for g in encontrados if g != c and len(g) < len(c))]
+
+    def find(self, query: str) -> List[str]:
+        # Códigos de los nombres ATC mencionados en una consulta, prefiriendo los más largos
+        tokens = _TOKEN.findall(fold_text(query))
+        resultado, i = [], 0
+        while i < len(tokens):
+            for n in range(min(self.max_palabras, len(tokens) - i), 0, -1):
+                codigos = self.por_nombre.get(" ".join(tokens[i:i + n]))
+                if codigos:
+                    resultado.extend(c for c in codigos if c not in resultado)
+                    i += n
+                    break
+            else:
+                i += 1
+        return resultado
+
+
+#================================================================================================
+_atc_index = None
+
+
+def get_atc_index(path: str = DEFAULT_ATC_INDEX_PATH) -> Optional[AtcIndex]:
+    # Cargar el índice persistido; None si aún no se ha construido
+    global _atc_index
+    if _atc_index is None and os.path.exists(path):
+        _atc_index = AtcIndex.load(path)
+    return _atc_index
+
+
+def resolve_atc(texto: str) -> List[str]:
+    index = get_atc_index()
+    return index.resolver(texto) if index is not None else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice jerárquico de códigos ATC")
+    parser.add_argument("comando", choices=["build", "resolver", "expandir"])
+    parser.add_argument("valor", nargs="?", default="")
+    parser.add_argument("--path", default=DEFAULT_ATC_INDEX_PATH)
+    parser.add_argument("--nomenclator", default=None, help="DICCIONARIO_ATC.xml o su JSONL (por defecto, la maestra de CIMA)")
+    args = parser.parse_args()
+
+    if args.comando == "build":
+        index = AtcIndex.build_from_nomenclator(args.nomenclator) if args.nomenclator else AtcIndex.build_from_cima()
+        index.save(args.path)
+        print(f"Índice ATC con {len(index.hijos) - 1} códigos guardado en {args.path}")
+    elif args.comando == "resolver":
+        index = AtcIndex.load(args.path)
+        for codigo in index.resolver(args.valor):
+            print(f"{codigo}  {index.nombre(codigo) or ''}")
+    else:
+        index = AtcIndex.load(args.path)
+        for codigo in index.descendientes(args.valor):
+            print(f"{'  ' * (nivel(codigo) - 1)}{codigo}  {index.nombre(codigo) or ''}")
@@ -0,0 +1,132 @@
+import argparse, json, os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+# Servidor HTTP local que reproduce respuestas grabadas de la API de CIMA.
+# Cada ruta del fichero de fixtures tiene un path, parámetros opcionales y la respuesta (json o
+# text). Se sirve la primera ruta con el mismo path cuyos parámetros estén todos en la petición,
+# probando antes las más específicas; una ruta sin parámetros responde a cualquier consulta.
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cima.json")
+CIMA_ORIGIN = "https://cima.aemps.es"
+
+# Peticiones que se graban con "record" (path y parámetros)
+RECORD_REQUESTS = [
+    ("/cima/rest/medicamento", {"cn": "726684"}),
+    ("/cima/rest/medicamentos", {"nombre": "aspirina"}),
+    ("/cima/rest/presentaciones", {"cn": "726684"}),
+]
+
+
+class CimaStub:
+    def __init__(self, fixtures_path: str = DEFAULT_FIXTURES, latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        with open(fixtures_path, encoding="utf-8") as f:
+            routes = json.load(f)["routes"]
+        self.routes: Dict[str, List[Dict[str, Any]]] = {}
+        for route in sorted(routes, key=lambda r: -len(r.get("query", {}))):
+            self.routes.setdefault(route["path"], []).append(route)
+        self.latency = latency  # Latencia añadida a cada respuesta (segundos)
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def origin(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def match(self, path: str, query: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        folded = {k: v.lower() for k, v in query.items()}
+        for route in self.routes.get(path, []):
+            if all(folded.get(k) == str(v).lower() for k, v in route.get("query", {}).items()):
+                return route
+        return None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como CIMA
+
+            def _respond(self):
+                url = urlsplit(self.path)
+                route = stub.match(url.path, dict(parse_qsl(url.query)))
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                if route is None:
+                    body, status, content_type = b'{"error": "no fixture"}', 404, "application/json"
+                elif "json" in route:
+                    body = json.dumps(route["json"], ensure_ascii=False).encode("utf-8")
+                    status, content_type = route.get("status", 200), "application/json;charset=UTF-8"
+                else:
+                    body = route["text"].encode("utf-8")
+                    status, content_type = route.get("status", 200), route.get("content_type", "text/plain; charset=utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _respond
+            do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "CimaStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def environ(self) -> Dict[str, str]:
+        # Variables de entorno que redirigen cima_client a este servidor
+        return {
+            "CIMA_BASE_URL": f"{self.origin}/cima/rest",
+            "CIMA_DOCS_BASE_URL": f"{self.origin}/cima/dochtml",
+        }
+
+
+def record(fixtures_path: str = DEFAULT_FIXTURES) -> None:
+    # Grabar respuestas reales de CIMA (requiere red) y añadirlas a las fixtures
+    with open(fixtures_path, encoding="utf-8") as f:
+        fixtures = json.load(f)
+    for path, query in RECORD_REQUESTS:
+        request = Request(f"{CIMA_ORIGIN}{path}?{urlencode(query)}", headers={"Accept": "application/json"})
+        with urlopen(request, timeout=30) as response:
+            body = json.loads(response.read().decode("utf-8"))
+        fixtures["routes"] = [r for r in fixtures["routes"] if not (r["path"] == path and r.get("query") == query)]
+        fixtures["routes"].insert(0, {"path": path, "query": query, "json": body})
+        print(f"Grabado {path} {query}")
+    with open(fixtures_path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Réplica local de la API de CIMA para los benchmarks")
+    parser.add_argument("comando", choices=["serve", "record"])
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.comando == "record":
+        record(args.fixtures)
+    else:
+        stub = CimaStub(args.fixtures, args.latency, port=args.port)
+        print(f"Sirviendo fixtures de CIMA en {stub.origin}/cima/rest")
+        stub.server.serve_forever()
@@ -0,0 +1,83 @@
+import hashlib, json, math, re, time
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+# Sustitutos deterministas de OllamaLLM y OllamaEmbeddings para los benchmarks.
+# Simulan la latencia de Ollama (prefill + tiempo por token) sin necesitar GPU ni red, y devuelven
+# siempre la misma salida para la misma entrada.
+
+# Principios activos que el extractor falso reconoce en las consultas
+KNOWN_PRACTIVOS = ("acido acetilsalicilico", "aspirina", "ibuprofeno", "paracetamol", "omeprazol")
+
+_CN = re.compile(r"(?<!\d)(\d{6})(?!\d)")
+_WORD = re.compile(r"\S+\s*")
+
+
+class FakeLLM(LLM):
+    model: str = "fake"
+    format: str = ""
+    temperature: Optional[float] = None
+    latency: float = 0.05  # Segundos hasta el primer token
+    token_latency: float = 0.005  # Segundos por token generado
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _respond(self, prompt: str) -> str:
+        if self.format == "json":
+            if "running_summary" in prompt:
+                return json.dumps({"running_summary": "Resumen de la conversación de prueba.", "medicamentos": []})
+            consulta = prompt.rsplit("CONSULTA:", 1)[-1].lower()
+            match = _CN.search(consulta)
+            if match:
+                return json.dumps({"cn": match.group(1)})
+            for practivo in KNOWN_PRACTIVOS:
+                if practivo in consulta:
+                    return json.dumps({"practiv1": practivo})
+            return "{}"
+        # Respuesta RAG: las primeras palabras del contexto
+        contexto = prompt.split("Contexto:", 1)[-1].split("Respuesta:", 1)[0]
+        return "Según la ficha técnica, " + " ".join(contexto.split()[:40])
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        response = self._respond(prompt)
+        time.sleep(self.latency + self.token_latency * len(_WORD.findall(response)))
+        return response
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        time.sleep(self.latency)
+        for word in _WORD.findall(self._respond(prompt)):
+            time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(word)
+            yield GenerationChunk(text=word)
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings por hashing de palabras: textos con palabras comunes tienen vectores parecidos."""
+
+    def __init__(self, size: int = 384, latency: float = 0.005):
+        self.size = size
+        self.latency = latency  # Segundos por llamada
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
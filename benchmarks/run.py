@@ -0,0 +1,175 @@
+import argparse, json, math, os, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+# Benchmarks sin red: CIMA se sustituye por la réplica local (cima_stub) y Ollama por modelos
+# falsos con latencia configurable (fakes). Cada escenario lanza un nº fijo de peticiones con una
+# concurrencia fija e informa de p50/p95/p99 y peticiones por segundo, comparando con una línea base.
+#
+#   python benchmarks/run.py --save-baseline           # guardar la línea base
+#   python benchmarks/run.py                           # comparar con ella (sale con 1 si hay regresión)
+#
+# Si alguna petición falla la ejecución sale con 1 y no guarda la línea base: una petición que
+# falla pronto mejora las latencias y ocultaría una regresión.
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from cima_stub import CimaStub
+
+# Preguntas de los escenarios (los CN y nombres existen en las fixtures)
+PREGUNTAS = [
+    "¿Es el medicamento con codigo nacional 726684 apto para mujeres embarazadas?",
+    "¿Qué reacciones adversas puede tener el medicamento con código nacional 726684?",
+    "¿Cuál es la posología del medicamento con codigo nacional 726684?",
+    "¿Se puede tomar ibuprofeno con alcohol?",
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    # Percentil por rango más cercano
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_scenario(fn: Callable[[int], object], requests: int, concurrency: int, warmup: int) -> Dict[str, float]:
+    for i in range(warmup):
+        fn(i)
+
+    def timed(i: int):
+        start = time.perf_counter()
+        try:
+            fn(i)
+            return time.perf_counter() - start, False
+        except Exception:
+            return time.perf_counter() - start, True
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(error for _, error in results),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "rps": requests / elapsed,
+    }
+
+
+def build_scenarios() -> Dict[str, Callable[[int], object]]:
+    # Importar el código del repositorio solo después de configurar el entorno
+    from api_calls import (
+        DocSegmentadoSeccionesParams, MedicamentoQueryParams, MedicamentosQueryParamsV2, PresentacionesQueryParams,
+        get_doc_segmentado_secciones, get_medicamento, get_medicamentos_v2, get_presentaciones,
+    )
+    from param_extractor import EndpointMedicamentoTool, EndpointMedicamentosTool, answer_question
+
+    api_calls = [
+        lambda: get_medicamento(MedicamentoQueryParams(cn="726684")),
+        lambda: get_medicamentos_v2(MedicamentosQueryParamsV2(nombre="ibuprofeno")),
+        lambda: get_presentaciones(PresentacionesQueryParams(cn="726684")),
+        lambda: get_doc_segmentado_secciones(DocSegmentadoSeccionesParams(tipoDoc=1, nregistro="62917")),
+    ]
+    tools = [
+        lambda: EndpointMedicamentoTool()._run("Quiero información sobre el medicamento con código nacional 726684"),
+        lambda: EndpointMedicamentosTool()._run("Quiero información sobre el ibuprofeno"),
+    ]
+    return {
+        "api_calls": lambda i: api_calls[i % len(api_calls)](),
+        "tools": lambda i: tools[i % len(tools)](),
+        "answer_question": lambda i: answer_question(PREGUNTAS[i % len(PREGUNTAS)]),
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> bool:
+    regression = False
+    print(f"\nComparación con la línea base (tolerancia {tolerance:.0%})")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"  {name:<16} sin línea base")
+            continue
+        p95_change = result["p95"] / base["p95"] - 1 if base["p95"] else 0.0
+        rps_change = result["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        worse = p95_change > tolerance or rps_change < -tolerance
+        regression |= worse
+        print(f"  {name:<16} p95 {p95_change:+.1%}  req/s {rps_change:+.1%}  {'REGRESIÓN' if worse else 'ok'}")
+    return regression
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline sin red")
+    parser.add_argument("--scenario", action="append", choices=["api_calls", "tools", "answer_question"],
+                        help="Escenario a ejecutar (por defecto, todos)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--cima-latency", type=float, default=0.02, help="Latencia de la réplica de CIMA (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Latencia hasta el primer token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Latencia por token (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.005, help="Latencia por llamada de embeddings (s)")
+    parser.add_argument("--cima-cache", action="store_true", help="Activar la caché de respuestas de CIMA")
+    parser.add_argument("--answer-cache", action="store_true", help="Activar la caché semántica de respuestas")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub = CimaStub(latency=args.cima_latency).start()
+    workdir = tempfile.mkdtemp(prefix="searchmed_bench_")
+    os.environ.update(stub.environ())
+    os.environ.update({
+        "CIMA_CACHE_PATH": os.path.join(workdir, "cima_cache.sqlite") if args.cima_cache else "",
+        "ANSWER_CACHE_PATH": os.path.join(workdir, "answer_cache.sqlite") if args.answer_cache else "",
+        "VECTOR_STORE_DIR": os.path.join(workdir, "vectorstore"),
+        "GAZETTEER_PATH": os.path.join(workdir, "gazetteer.pkl"),
+        "CIMA_POOL_MAXSIZE": str(max(20, args.concurrency)),
+    })
+
+    from fakes import FakeEmbeddings, FakeLLM
+    from param_extractor import PipelineEngine, set_engine
+    set_engine(PipelineEngine(
+        llm_factory=lambda **options: FakeLLM(latency=args.llm_latency, token_latency=args.token_latency, **options),
+        embedder=FakeEmbeddings(latency=args.embed_latency),
+    ))
+
+    scenarios = build_scenarios()
+    results = {}
+    try:
+        for name in args.scenario or list(scenarios):
+            results[name] = run_scenario(scenarios[name], args.requests, args.concurrency, args.warmup)
+    finally:
+        stub.stop()
+
+    print(f"{'escenario':<16}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'req/s':>10}{'errores':>9}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['p50'] * 1000:>10.1f}{result['p95'] * 1000:>10.1f}"
+              f"{result['p99'] * 1000:>10.1f}{result['rps']:>10.1f}{result['errors']:>9}")
+
+    fallidos = [name for name, result in results.items() if result["errors"]]
+    if fallidos:
+        print(f"\nPeticiones con error en: {', '.join(fallidos)}")
+        return 1
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nLínea base guardada en {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            return 1 if compare(results, json.load(f), args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
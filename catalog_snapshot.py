@@ -0,0 +1,346 @@
+import argparse, json, os, shutil, time
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from text_normalization import fold_text
+
+# Instantánea columnar del catálogo para analítica (problemas de suministro por laboratorio,
+# comercialización por ATC...). Cada tabla es un directorio con una columna por fichero .npy:
+#   - texto: códigos int32 (-1 = nulo) en <columna>.npy y valores distintos en <columna>.dict.npy
+#   - booleanos: bool; enteros (fechas en ms): int64 con NULO para los ausentes
+# Al cargar, las columnas se abren con mmap (np.load(mmap_mode="r")): no se copian a memoria y
+# los filtros se resuelven de forma vectorizada sobre los códigos, comparando solo el
+# diccionario de valores distintos (unos miles) en lugar de cada fila.
+#
+#   python catalog_snapshot.py exportar               # desde la réplica local (cima_mirror)
+#   python catalog_snapshot.py exportar --desde-api   # recorriendo la API de CIMA
+#   python catalog_snapshot.py resumen
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "catalogo_snapshot")
+
+NULO = -1  # Valor de las columnas enteras y de los códigos de texto cuando falta el dato
+
+TIPOS = {"str": np.int32, "bool": np.bool_, "int": np.int64}
+
+
+def _ruta(ruta: str) -> Callable[[Any], Any]:
+    # Lector de un atributo, admitiendo anidados ("estado.aut") que pueden ser None
+    partes = ruta.split(".")
+
+    def leer(obj: Any) -> Any:
+        for parte in partes:
+            if obj is None:
+                return None
+            obj = getattr(obj, parte, None)
+        return obj
+    return leer
+
+
+# Columnas de cada tabla: (nombre, tipo, lector). Sirven para ListaMedicamentos/ListaPresentaciones
+# de pydantic_api_models, sus espejos de fast_decoding o las vistas de row_views
+Columna = Tuple[str, str, Callable[[Any], Any]]
+
+COLUMNAS_MEDICAMENTOS: List[Columna] = [
+    (nombre, tipo, _ruta(ruta)) for nombre, tipo, ruta in [
+        ("nregistro", "str", "nregistro"),
+        ("nombre", "str", "nombre"),
+        ("labtitular", "str", "labtitular"),
+        ("cpresc", "str", "cpresc"),
+        ("comerc", "bool", "comerc"),
+        ("receta", "bool", "receta"),
+        ("conduc", "bool", "conduc"),
+        ("triangulo", "bool", "triangulo"),
+        ("huerfano", "bool", "huerfano"),
+        ("biosimilar", "bool", "biosimilar"),
+        ("psum", "bool", "psum"),
+        ("ema", "bool", "ema"),
+        ("notas", "bool", "notas"),
+        ("materialesInf", "bool", "materialesInf"),
+        ("aut", "int", "estado.aut"),
+        ("susp", "int", "estado.susp"),
+        ("rev", "int", "estado.rev"),
+        ("formaFarmaceutica", "str", "formaFarmaceutica.nombre"),
+        ("formaFarmaceuticaSimplificada", "str", "formaFarmaceuticaSimplificada.nombre"),
+        ("nosustituible", "str", "nosustituible.nombre"),
+        ("dosis", "str", "dosis"),
+    ]
+]
+
+COLUMNAS_PRESENTACIONES: List[Columna] = [
+    (nombre, tipo, _ruta(ruta)) for nombre, tipo, ruta in [
+        ("cn", "str", "cn"),
+        ("nregistro", "str", "nregistro"),
+        ("nombre", "str", "nombre"),
+        ("pactivos", "str", "pactivos"),
+        ("labtitular", "str", "labtitular"),
+        ("cpresc", "str", "cpresc"),
+        ("comerc", "bool", "comerc"),
+        ("conduc", "bool", "conduc"),
+        ("triangulo", "bool", "triangulo"),
+        ("huerfano", "bool", "huerfano"),
+        ("ema", "bool", "ema"),
+        ("psum", "bool", "psum"),
+        ("notas", "bool", "notas"),
+        ("aut", "int", "estado.aut"),
+        ("susp", "int", "estado.susp"),
+        ("rev", "int", "estado.rev"),
+    ]
+]
+
+
+#================================================================================================
+# Exportación
+class _Escritor:
+    # Acumula una columna mientras se recorren las filas y la guarda como .npy
+    def __init__(self, nombre: str, tipo: str):
+        self.nombre = nombre
+        self.tipo = tipo
+        self.valores: List[Any] = []
+        self.diccionario: Dict[str, int] = {}  # Solo texto: valor -> código
+
+    def append(self, valor: Any) -> None:
+        if self.tipo == "str":
+            self.valores.append(NULO if valor is None else self.diccionario.setdefault(str(valor), len(self.diccionario)))
+        elif self.tipo == "bool":
+            self.valores.append(bool(valor))
+        else:
+            self.valores.append(NULO if valor is None else int(valor))
+
+    def save(self, directorio: str) -> None:
+        np.save(os.path.join(directorio, f"{self.nombre}.npy"), np.asarray(self.valores, dtype=TIPOS[self.tipo]))
+        if self.tipo == "str":
+            np.save(os.path.join(directorio, f"{self.nombre}.dict.npy"), np.array(list(self.diccionario), dtype=str))
+
+
+def _escribir_tabla(directorio: str, filas: Iterable[Any], columnas: Sequence[Columna]) -> Dict[str, Any]:
+    os.makedirs(directorio)
+    escritores = [(_Escritor(nombre, tipo), leer) for nombre, tipo, leer in columnas]
+    n = 0
+    for fila in filas:
+        for escritor, leer in escritores:
+            escritor.append(leer(fila))
+        n += 1
+    for escritor, _ in escritores:
+        escritor.save(directorio)
+    return {"filas": n, "columnas": {nombre: tipo for nombre, tipo, _ in columnas}}
+
+
+def export_snapshot(path: str, medicamentos: Iterable[Any], presentaciones: Iterable[Any] = (),
+                    atcs: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """
+    Escribe la instantánea a partir de flujos de medicamentos y presentaciones (se recorren una
+    sola vez). atcs (nregistro -> código ATC) añade la columna "atc" a los medicamentos, que
+    ListaMedicamentos no incluye. La instantánea anterior se sustituye solo al terminar.
+    """
+    columnas_medicamentos = list(COLUMNAS_MEDICAMENTOS)
+    if atcs is not None:
+        columnas_medicamentos.append(("atc", "str", lambda med: atcs.get(med.nregistro)))
+
+    tmp = f"{path}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    meta = {
+        "creado": time.time(),
+        "tablas": {
+            "medicamentos": _escribir_tabla(os.path.join(tmp, "medicamentos"), medicamentos, columnas_medicamentos),
+            "presentaciones": _escribir_tabla(os.path.join(tmp, "presentaciones"), presentaciones, COLUMNAS_PRESENTACIONES),
+        },
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return meta
+
+
+def export_from_mirror(mirror, path: str = DEFAULT_SNAPSHOT_PATH) -> Dict[str, Any]:
+    # Desde la réplica local: incluye el ATC de cada medicamento (de su detalle)
+    return export_snapshot(path, mirror.recorrer_medicamentos(), mirror.recorrer_presentaciones(), mirror.atc_por_nregistro())
+
+
+def export_from_api(path: str = DEFAULT_SNAPSHOT_PATH) -> Dict[str, Any]:
+    # Recorriendo la API de CIMA página a página (sin ATC: requeriría el detalle de cada medicamento)
+    from api_calls import MedicamentosQueryParams, PresentacionesQueryParams, iter_medicamentos, iter_presentaciones
+    return export_snapshot(path, iter_medicamentos(MedicamentosQueryParams()), iter_presentaciones(PresentacionesQueryParams()))
+
+
+#================================================================================================
+# Carga y consultas
+class DictColumn:
+    """Columna de texto codificada con diccionario: códigos (mmap) y valores distintos."""
+
+    def __init__(self, codes: np.ndarray, valores: np.ndarray):
+        self.codes = codes
+        self._valores = valores
+        self._lista: Optional[List[str]] = None
+        self._indice: Optional[Dict[str, int]] = None
+        self._folded: Optional[List[str]] = None
+
+    @property
+    def valores(self) -> List[str]:
+        if self._lista is None:
+            self._lista = self._valores.tolist()
+        return self._lista
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        # Un índice devuelve el valor; un slice, máscara o array de índices, la lista de valores
+        codes = self.codes[index]
+        if np.ndim(codes) == 0:
+            return None if codes == NULO else self.valores[codes]
+        return [None if code == NULO else self.valores[code] for code in codes.tolist()]
+
+    def code(self, valor: str) -> Optional[int]:
+        if self._indice is None:
+            self._indice = {v: i for i, v in enumerate(self.valores)}
+        return self._indice.get(valor)
+
+    def _mascara_codigos(self, codigos: Iterable[int]) -> np.ndarray:
+        codigos = np.fromiter(codigos, dtype=self.codes.dtype)
+        if len(codigos) == 1:
+            return self.codes == codigos[0]
+        return np.isin(self.codes, codigos)
+
+    def eq(self, valor: Optional[str]) -> np.ndarray:
+        if valor is None:
+            return self.codes == NULO
+        code = self.code(valor)
+        return self.codes == code if code is not None else np.zeros(len(self.codes), dtype=bool)
+
+    def isin(self, valores: Iterable[str]) -> np.ndarray:
+        return self._mascara_codigos(code for code in map(self.code, valores) if code is not None)
+
+    def match(self, predicado: Callable[[str], bool]) -> np.ndarray:
+        # El predicado se evalúa sobre el diccionario, no sobre cada fila
+        return self._mascara_codigos(i for i, valor in enumerate(self.valores) if predicado(valor))
+
+    def contains(self, texto: str) -> np.ndarray:
+        # Coincidencia parcial sin acentos ni mayúsculas, como las búsquedas de CIMA
+        if self._folded is None:
+            self._folded = [fold_text(valor) for valor in self.valores]
+        texto = fold_text(texto)
+        return self._mascara_codigos(i for i, valor in enumerate(self._folded) if texto in valor)
+
+    def startswith(self, prefijo: str) -> np.ndarray:
+        # P. ej. todos los códigos ATC de un grupo ("N02")
+        return self.match(lambda valor: valor.startswith(prefijo))
+
+    def value_counts(self, mask: Optional[np.ndarray] = None, key: Optional[Callable[[str], str]] = None) -> Dict[str, int]:
+        """Nº de filas por valor (opcionalmente agrupando los valores con key), de mayor a menor."""
+        codes = self.codes if mask is None else self.codes[mask]
+        counts = np.bincount(codes[codes != NULO], minlength=len(self.valores))
+        resultado: Dict[str, int] = {}
+        for code in np.flatnonzero(counts).tolist():
+            valor = self.valores[code] if key is None else key(self.valores[code])
+            resultado[valor] = resultado.get(valor, 0) + int(counts[code])
+        return dict(sorted(resultado.items(), key=lambda item: -item[1]))
+
+
+class SnapshotTable:
+    def __init__(self, directorio: str, meta: Dict[str, Any]):
+        self.filas: int = meta["filas"]
+        self.tipos: Dict[str, str] = meta["columnas"]
+        self.columnas: Dict[str, Any] = {}
+        for nombre, tipo in self.tipos.items():
+            datos = np.load(os.path.join(directorio, f"{nombre}.npy"), mmap_mode="r")
+            if tipo == "str":
+                datos = DictColumn(datos, np.load(os.path.join(directorio, f"{nombre}.dict.npy"), mmap_mode="r"))
+            self.columnas[nombre] = datos
+
+    def __len__(self) -> int:
+        return self.filas
+
+    def __getitem__(self, nombre: str):
+        return self.columnas[nombre]
+
+    def where(self, **condiciones: Any) -> np.ndarray:
+        """
+        Máscara de las filas que cumplen todas las condiciones: columna=valor, o columna=[valores]
+        para cualquiera de ellos. Ej.: where(psum=True, labtitular="Cinfa S.A.")
+        """
+        mask = np.ones(self.filas, dtype=bool)
+        for nombre, valor in condiciones.items():
+            columna = self.columnas[nombre]
+            if isinstance(columna, DictColumn):
+                mask &= columna.isin(valor) if isinstance(valor, (list, tuple, set)) else columna.eq(valor)
+            elif isinstance(valor, (list, tuple, set)):
+                mask &= np.isin(columna, list(valor))
+            else:
+                mask &= columna == valor
+        return mask
+
+    def count_by(self, nombre: str, mask: Optional[np.ndarray] = None, key: Optional[Callable[[str], str]] = None) -> Dict[str, int]:
+        columna = self.columnas[nombre]
+        if isinstance(columna, DictColumn):
+            return columna.value_counts(mask, key)
+        valores, counts = np.unique(columna if mask is None else columna[mask], return_counts=True)
+        return {valor: int(count) for valor, count in sorted(zip(valores.tolist(), counts.tolist()), key=lambda item: -item[1])}
+
+    def rows(self, mask: Optional[np.ndarray] = None, columnas: Optional[Sequence[str]] = None,
+             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        # Materializa como diccionarios solo las filas seleccionadas
+        indices = np.flatnonzero(mask) if mask is not None else np.arange(self.filas)
+        if limit is not None:
+            indices = indices[:limit]
+        salida = {}
+        for nombre in columnas or self.tipos:
+            columna = self.columnas[nombre]
+            if isinstance(columna, DictColumn):
+                salida[nombre] = columna[indices]
+            else:
+                valores = columna[indices].tolist()
+                salida[nombre] = [None if v == NULO else v for v in valores] if self.tipos[nombre] == "int" else valores
+        return [dict(zip(salida, fila)) for fila in zip(*salida.values())]
+
+
+class CatalogSnapshot:
+    """Instantánea cargada con mmap: tablas medicamentos y presentaciones."""
+
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_PATH):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.creado: float = self.meta["creado"]
+        tablas = self.meta["tablas"]
+        self.medicamentos = SnapshotTable(os.path.join(path, "medicamentos"), tablas["medicamentos"])
+        self.presentaciones = SnapshotTable(os.path.join(path, "presentaciones"), tablas["presentaciones"])
+
+
+def load_snapshot(path: str = DEFAULT_SNAPSHOT_PATH) -> CatalogSnapshot:
+    return CatalogSnapshot(path)
+
+
+#================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Instantánea columnar del catálogo de CIMA")
+    parser.add_argument("comando", choices=["exportar", "resumen"])
+    parser.add_argument("--path", default=os.getenv("CATALOG_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH))
+    parser.add_argument("--mirror", default=None, help="Ruta de la réplica local (por defecto la de cima_mirror)")
+    parser.add_argument("--desde-api", action="store_true", help="Exportar recorriendo la API de CIMA en lugar de la réplica")
+    args = parser.parse_args()
+
+    if args.comando == "exportar":
+        inicio = time.perf_counter()
+        if args.desde_api:
+            meta = export_from_api(args.path)
+        else:
+            from cima_mirror import DEFAULT_MIRROR_PATH, CimaMirror
+            meta = export_from_mirror(CimaMirror(args.mirror or os.getenv("CIMA_MIRROR_PATH", DEFAULT_MIRROR_PATH)), args.path)
+        filas = {tabla: info["filas"] for tabla, info in meta["tablas"].items()}
+        print(f"Instantánea escrita en {args.path} ({filas}) en {time.perf_counter() - inicio:.1f} s")
+    else:
+        inicio = time.perf_counter()
+        snapshot = load_snapshot(args.path)
+        medicamentos = snapshot.medicamentos
+        psum = medicamentos.count_by("labtitular", medicamentos["psum"])
+        print(f"Medicamentos: {len(medicamentos)}  Presentaciones: {len(snapshot.presentaciones)}")
+        print("Problemas de suministro por laboratorio:")
+        for laboratorio, n in list(psum.items())[:10]:
+            print(f"  {n:>6}  {laboratorio}")
+        if "atc" in medicamentos.columnas:
+            comerc = medicamentos.count_by("atc", medicamentos["comerc"], key=lambda codigo: codigo[:1])
+            total = medicamentos.count_by("atc", key=lambda codigo: codigo[:1])
+            print("Comercializados por grupo ATC:")
+            for grupo, n in sorted(total.items()):
+                print(f"  {grupo}  {comerc.get(grupo, 0):>6} / {n}")
+        print(f"({(time.perf_counter() - inicio) * 1000:.1f} ms)")
@@ -1,20 +1,49 @@
 # Pendiente acabar de implementar
 
-from langchain.schema import AIMessage, HumanMessage
+import os
 import gradio as gr
 from langchain_ollama.chat_models import ChatOllama
+from cima_mirror import activar_mirror_desde_entorno
+from conversation_memory import ConversationMemory
+from param_extractor import OLLAMA_BASE_URL, get_engine, stream_answer_question
+from tracing import configure_logging
 
-llm = ChatOllama(model="gemma2:2b", base_url="http://ollama:11434")
-def predict(message, history):
-    history_langchain_format = []
-    for human, ai in history:
-        history_langchain_format.append(HumanMessage(content=human))
-        history_langchain_format.append(AIMessage(content=ai))
-    history_langchain_format.append(HumanMessage(content=message))
-    gpt_response = llm.invoke(history_langchain_format)
-    return gpt_response.content
+configure_logging()
+# Réplica local del catálogo, solo si se indica CIMA_MIRROR_PATH
+activar_mirror_desde_entorno()
 
-gr.ChatInterface(predict).launch(server_name="0.0.0.0", server_port=9012) # Inicializar en el puerto 9012
+llm = ChatOllama(model="gemma2:2b", base_url=OLLAMA_BASE_URL)
+# Historial limitado por presupuesto de tokens; los turnos antiguos se resumen con el modelo pequeño
+memory = ConversationMemory(
+    get_engine().tiers[0].json_llm,
+    token_budget=int(os.getenv("CHAT_TOKEN_BUDGET", "2048")),
+    keep_turns=int(os.getenv("CHAT_KEEP_TURNS", "4")),
+)
+
+def chat(message, history, session_id):
+    # Conversación general cuando la consulta no trata sobre un medicamento concreto
+    history_langchain_format = memory.messages(session_id, history, message)
+    respuesta = ""
+    for chunk in llm.stream(history_langchain_format):
+        respuesta += chunk.content
+        yield respuesta
 
+def predict(message, history, request: gr.Request):
+    # Generador: Gradio muestra cada valor emitido, así que el estado de las etapas lentas y los
+    # tokens de la respuesta aparecen según se producen
+    respuesta = ""
+    for event in stream_answer_question(message):
+        if event.tipo == "status":
+            yield f"_{event.texto}..._"
+        elif event.tipo == "token":
+            respuesta += event.texto
+            yield respuesta
+        elif event.tipo == "sin_medicamento":
+            # El resumen de la conversación se guarda por sesión de Gradio
+            yield from chat(message, history, request.session_hash if request else "default")
+            return
 
-    
\ No newline at end of file
+# Precargar los modelos en Ollama para que la primera consulta no pague su tiempo de carga
+get_engine().warmup()
+
+gr.ChatInterface(predict).launch(server_name="0.0.0.0", server_port=9012) # Inicializar en el puerto 9012
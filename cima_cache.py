@@ -0,0 +1,216 @@
+import hashlib, json, os, re, sqlite3, threading, time
+from typing import Optional, Dict, Any, Iterable, NamedTuple, Set
+
+# Tiempo de vida (segundos) de las respuestas cacheadas por endpoint. 0 = no cachear.
+# Las consultas puntuales se invalidan con precisión mediante registroCambios, por lo que
+# pueden vivir más que las búsquedas, que pueden ganar resultados nuevos sin que se invaliden.
+DIA = 24 * 60 * 60
+DEFAULT_TTLS: Dict[str, int] = {
+    "/medicamento": 7 * DIA,
+    "/medicamentos": DIA,
+    "/buscarEnFichaTecnica": DIA,
+    "/presentacion": 7 * DIA,
+    "/presentaciones": DIA,
+    "/vmpp": 7 * DIA,
+    "/maestras": 7 * DIA,
+    "/registroCambios": 0,
+    "/docSegmentado/": 7 * DIA,
+    "/dochtml/": 7 * DIA,
+}
+
+# Nº de registro en las URLs de documentos: /dochtml/ft/{nregistro}/... o /dochtml/p/{nregistro}/...
+_DOCHTML_NREGISTRO = re.compile(r"/dochtml/(?:ft|p)/([^/]+)/")
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    content_type: str
+    encoding: Optional[str]
+    fresh: bool  # False si ha superado su TTL (se puede servir si CIMA no responde)
+
+
+class CimaCache:
+    """
+    Caché persistente (SQLite) de las respuestas de la API de CIMA.
+    Las entradas se indexan por endpoint y parámetros normalizados, caducan según el TTL del
+    endpoint y se expulsan por LRU al superar max_entries o max_bytes. Cada entrada guarda los
+    nregistro a los que hace referencia para poder invalidar solo los medicamentos que cambian.
+    """
+
+    def __init__(self, path: str, ttls: Optional[Dict[str, int]] = None, default_ttl: int = DIA,
+                 max_entries: int = 50_000, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    content_type TEXT,
+                    encoding TEXT,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+                CREATE TABLE IF NOT EXISTS entry_nregistro (
+                    key TEXT NOT NULL,
+                    nregistro TEXT NOT NULL,
+                    PRIMARY KEY (key, nregistro)
+                );
+                CREATE INDEX IF NOT EXISTS entry_nregistro_nregistro ON entry_nregistro(nregistro);
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+    #================================================================================================
+    # Claves y TTL
+    def ttl_for(self, url: str) -> int:
+        matches = [fragment for fragment in self.ttls if fragment in url]
+        if not matches:
+            return self.default_ttl
+        return self.ttls[max(matches, key=len)]
+
+    def cacheable(self, url: str) -> bool:
+        return self.ttl_for(url) > 0
+
+    @staticmethod
+    def _normalize(value: Any) -> Any:
+        # Las búsquedas de CIMA no distinguen mayúsculas ni espacios sobrantes
+        if isinstance(value, str):
+            return value.strip().lower()
+        if isinstance(value, dict):
+            return {k: CimaCache._normalize(v) for k, v in value.items() if v is not None}
+        if isinstance(value, (list, tuple)):
+            return [CimaCache._normalize(v) for v in value]
+        return value
+
+    def make_key(self, method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                 json_body: Any = None, headers: Optional[Dict[str, str]] = None) -> str:
+        accept = (headers or {}).get("Accept")
+        raw = json.dumps(
+            [method.upper(), url, self._normalize(params or {}), self._normalize(json_body), accept],
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    #================================================================================================
+    # Lectura y escritura
+    def get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT url, body, content_type, encoding, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        url, body, content_type, encoding, created = row
+        return CacheEntry(body, content_type, encoding, now - created < self.ttl_for(url))
+
+    def put(self, key: str, url: str, body: bytes, content_type: Optional[str], encoding: Optional[str],
+            params: Optional[Dict[str, Any]] = None) -> None:
+        now = time.time()
+        nregistros = self._extract_nregistros(url, body, content_type, params)
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, url, body, content_type, encoding, created, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, body, content_type, encoding, now, now, len(body)),
+            )
+            self.conn.execute("DELETE FROM entry_nregistro WHERE key = ?", (key,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO entry_nregistro (key, nregistro) VALUES (?, ?)",
+                [(key, nregistro) for nregistro in nregistros],
+            )
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= 100:
+                self._puts_since_evict = 0
+                self._evict_lru()
+
+    @staticmethod
+    def _extract_nregistros(url: str, body: bytes, content_type: Optional[str],
+                            params: Optional[Dict[str, Any]]) -> Set[str]:
+        # Nº de registro de los parámetros, de la URL y de la propia respuesta (incluidos listados)
+        nregistros = set()
+        if params and params.get("nregistro"):
+            nregistros.add(str(params["nregistro"]))
+        match = _DOCHTML_NREGISTRO.search(url)
+        if match:
+            nregistros.add(match.group(1))
+        if content_type and "json" in content_type:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                rows = data.get("resultados") if isinstance(data.get("resultados"), list) else [data]
+                nregistros.update(str(row["nregistro"]) for row in rows if isinstance(row, dict) and row.get("nregistro"))
+        return nregistros
+
+    def _evict_lru(self) -> None:
+        # Expulsar las entradas menos usadas recientemente hasta respetar los límites
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        excess = max(count - self.max_entries, 0)
+        freed, victims = 0, []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if len(victims) >= excess and total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self.conn.executemany("DELETE FROM entry_nregistro WHERE key = ?", victims)
+
+    #================================================================================================
+    # Invalidación
+    def invalidate_nregistros(self, nregistros: Iterable[str]) -> int:
+        # Eliminar todas las entradas que hacen referencia a alguno de los nregistro indicados
+        nregistros = list(set(nregistros))
+        if not nregistros:
+            return 0
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS changed (nregistro TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM changed")
+            self.conn.executemany("INSERT OR IGNORE INTO changed (nregistro) VALUES (?)", [(n,) for n in nregistros])
+            keys = [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT key FROM entry_nregistro WHERE nregistro IN (SELECT nregistro FROM changed)"
+            )]
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in keys])
+            self.conn.executemany("DELETE FROM entry_nregistro WHERE key = ?", [(k,) for k in keys])
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM entry_nregistro")
+
+    def oldest_entry_time(self) -> Optional[float]:
+        with self._lock:
+            return self.conn.execute("SELECT MIN(created) FROM entries").fetchone()[0]
+
+    def get_meta(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name: str, value: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def close(self) -> None:
+        self.conn.close()
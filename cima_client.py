@@ -0,0 +1,171 @@
+import os, threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, Tuple, Union
+from cima_cache import CimaCache, CacheEntry
+from tracing import record_cache, span
+
+# Base URL for the CIMA API (configurable para apuntar a una réplica local, p. ej. en los benchmarks)
+CIMA_BASE_URL = os.getenv("CIMA_BASE_URL", "https://cima.aemps.es/cima/rest")
+CIMA_DOCS_BASE_URL = os.getenv("CIMA_DOCS_BASE_URL", "https://cima.aemps.es/cima/dochtml")
+
+# Timeouts (conexión, lectura) en segundos
+Timeout = Union[float, Tuple[float, float]]
+DEFAULT_TIMEOUT: Timeout = (3.05, 15)
+
+# Timeouts por endpoint. Se busca el fragmento de la URL; gana el más largo que coincida
+ENDPOINT_TIMEOUTS: Dict[str, Timeout] = {
+    "/medicamento": (3.05, 10),
+    "/medicamentos": (3.05, 20),
+    "/buscarEnFichaTecnica": (3.05, 30),
+    "/presentacion": (3.05, 10),
+    "/presentaciones": (3.05, 20),
+    "/vmpp": (3.05, 20),
+    "/maestras": (3.05, 30),
+    "/registroCambios": (3.05, 30),
+    "/docSegmentado/": (3.05, 20),
+    "/dochtml/": (3.05, 30),
+}
+
+# Códigos de estado que se reintentan con backoff exponencial
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CimaClient:
+    """
+    Cliente HTTP para la API de CIMA.
+    Mantiene una sesión con un pool de conexiones keep-alive hacia cima.aemps.es, de forma que
+    las consultas reutilizan la conexión TCP+TLS en lugar de abrir una nueva en cada llamada.
+    Aplica timeouts por endpoint, reintentos con backoff en 5xx/429 y compresión gzip.
+    Si se proporciona una CimaCache, las respuestas se sirven desde disco mientras estén vigentes
+    y, si CIMA falla o no responde, se recurre a la copia caducada.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 20,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        default_timeout: Timeout = DEFAULT_TIMEOUT,
+        timeouts: Optional[Dict[str, Timeout]] = None,
+        cache: Optional[CimaCache] = None,
+    ):
+        self.cache = cache
+        self.default_timeout = default_timeout
+        self.timeouts = dict(ENDPOINT_TIMEOUTS if timeouts is None else timeouts)
+
+        # Las consultas POST de CIMA (buscarEnFichaTecnica, registroCambios) son de solo lectura,
+        # por lo que también se pueden reintentar
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Devolver la última respuesta para que raise_for_status() la gestione
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+    def timeout_for(self, url: str) -> Timeout:
+        # Elegir el timeout del fragmento de URL más específico que coincida
+        matches = [fragment for fragment in self.timeouts if fragment in url]
+        if not matches:
+            return self.default_timeout
+        return self.timeouts[max(matches, key=len)]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        with span("cima_http", method=method, url=url) as current:
+            response = self._request(method, url, **kwargs)
+            current.set(status=response.status_code)
+            return response
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout_for(url))
+        if self.cache is None or not self.cache.cacheable(url):
+            return self.session.request(method, url, **kwargs)
+
+        key = self.cache.make_key(method, url, kwargs.get("params"), kwargs.get("json"), kwargs.get("headers"))
+        entry = self.cache.get(key)
+        record_cache("cima", entry is not None and entry.fresh)
+        if entry is not None and entry.fresh:
+            return _cached_response(url, entry)
+
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            # CIMA no responde: servir la copia caducada si existe
+            if entry is not None:
+                return _cached_response(url, entry)
+            raise
+
+        if response.status_code == 200:
+            self.cache.put(key, url, response.content, response.headers.get("Content-Type"), response.encoding, kwargs.get("params"))
+        elif entry is not None and response.status_code in RETRY_STATUS_CODES:
+            return _cached_response(url, entry)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _cached_response(url: str, entry: CacheEntry) -> requests.Response:
+    # Reconstruir una respuesta de requests a partir de la entrada de la caché
+    response = requests.Response()
+    response.status_code = 200
+    response._content = entry.body
+    response.headers["Content-Type"] = entry.content_type or ""
+    response.encoding = entry.encoding
+    response.url = url
+    return response
+
+
+#================================================================================================
+# Instancia compartida utilizada por las funciones de api_calls.
+# La caché en disco se desactiva con CIMA_CACHE_PATH="" (vacío).
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "cima_cache.sqlite")
+_default_client: Optional[CimaClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> CimaClient:
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                cache_path = os.getenv("CIMA_CACHE_PATH", DEFAULT_CACHE_PATH)
+                _default_client = CimaClient(
+                    pool_maxsize=int(os.getenv("CIMA_POOL_MAXSIZE", "20")),
+                    max_retries=int(os.getenv("CIMA_MAX_RETRIES", "3")),
+                    cache=CimaCache(cache_path) if cache_path else None,
+                )
+    return _default_client
+
+
+def set_default_client(client: CimaClient) -> None:
+    # Sustituir la instancia compartida (p. ej. para configurar otro tamaño de pool)
+    global _default_client
+    with _default_client_lock:
+        previous, _default_client = _default_client, client
+    if previous is not None and previous is not client:
+        previous.close()
@@ -0,0 +1,352 @@
+import argparse, json, os, sqlite3, threading, time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Iterable
+import api_calls
+from api_calls import (
+    MedicamentosQueryParams, MedicamentoQueryParams, PresentacionesQueryParams, RegistroCambiosQueryParams,
+    iter_medicamentos, iter_presentaciones, get_medicamento, _iter_paginas,
+)
+from cima_client import CIMA_BASE_URL, get_default_client
+from atc_index import resolve_atc
+from fast_decoding import decode
+from row_views import view_class, views_from_rows
+from pydantic_api_models import ListaMedicamentos, Medicamento, ListaPresentaciones, RegistroCambios
+from text_normalization import fold_text
+
+# La réplica solo se activa al arrancar (activar_mirror_desde_entorno) si se indica CIMA_MIRROR_PATH
+DEFAULT_MIRROR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "cima_mirror.sqlite")
+
+# Filtros de MedicamentosQueryParams que se pueden resolver con los índices locales.
+# Si una consulta usa cualquier otro (vmp, sust, idpractiv1...), se envía a la API de CIMA
+FILTROS_LOCALES = {
+    "nombre", "laboratorio", "practiv1", "practiv2", "cn", "atc", "nregistro",
+    "npactiv", "triangulo", "huerfano", "biosimilar", "comerc", "receta",
+}
+
+# Cambios de registroCambios que afectan a las presentaciones de un medicamento
+CAMBIOS_PRESENTACIONES = {"estado", "comerc", "psum", "otros"}
+
+# Tareas enviadas al pool por cada hilo en cada tanda de la sincronización
+TAREAS_POR_WORKER = 4
+
+
+def _map_por_tandas(fn: Callable, items: Iterable, max_workers: int) -> None:
+    # executor.map consume el iterable completo antes de devolver el primer resultado (con
+    # iter_medicamentos, todo el catálogo en memoria). Se envía por tandas de max_workers *
+    # TAREAS_POR_WORKER y se consumen los resultados para que los errores no se pierdan
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            tanda = list(islice(items, max_workers * TAREAS_POR_WORKER))
+            if not tanda:
+                return
+            for _ in executor.map(fn, tanda):
+                pass
+
+
+class CimaMirror:
+    """
+    Réplica local (SQLite) del catálogo de medicamentos y presentaciones de CIMA.
+    Se carga una vez con sync_completo() y después se mantiene al día con sync_incremental(),
+    que aplica los cambios de registroCambios (tipoCambio 1: nuevo, 2: baja, 3: modificado).
+    Las bajas no se borran: CIMA sigue devolviendo los medicamentos revocados, así que se
+    conservan marcados con baja = 1. Con la réplica activa (activar_mirror) get_medicamentos/
+    get_medicamento se responden desde los índices locales sin salir a la red.
+    """
+
+    def __init__(self, path: str = DEFAULT_MIRROR_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS medicamentos (
+                    nregistro TEXT PRIMARY KEY,
+                    nombre TEXT NOT NULL,
+                    laboratorio TEXT,
+                    comerc INTEGER,
+                    receta INTEGER,
+                    triangulo INTEGER,
+                    huerfano INTEGER,
+                    biosimilar INTEGER,
+                    npactiv INTEGER,
+                    lista_json TEXT NOT NULL,
+                    detalle_json TEXT,
+                    baja INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS medicamentos_nombre ON medicamentos(nombre);
+                CREATE INDEX IF NOT EXISTS medicamentos_laboratorio ON medicamentos(laboratorio);
+                CREATE TABLE IF NOT EXISTS principios_activos (
+                    nregistro TEXT NOT NULL,
+                    nombre TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS principios_activos_nombre ON principios_activos(nombre);
+                CREATE INDEX IF NOT EXISTS principios_activos_nregistro ON principios_activos(nregistro);
+                CREATE TABLE IF NOT EXISTS atcs (
+                    nregistro TEXT NOT NULL,
+                    codigo TEXT NOT NULL,
+                    nombre TEXT
+                );
+                CREATE INDEX IF NOT EXISTS atcs_codigo ON atcs(codigo);
+                CREATE INDEX IF NOT EXISTS atcs_nregistro ON atcs(nregistro);
+                CREATE TABLE IF NOT EXISTS presentaciones (
+                    cn TEXT PRIMARY KEY,
+                    nregistro TEXT NOT NULL,
+                    json TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS presentaciones_nregistro ON presentaciones(nregistro);
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+            columnas = {row[1] for row in self.conn.execute("PRAGMA table_info(medicamentos)")}
+            if "baja" not in columnas:
+                # Réplicas creadas antes de conservar las bajas
+                self.conn.execute("ALTER TABLE medicamentos ADD COLUMN baja INTEGER NOT NULL DEFAULT 0")
+
+    #================================================================================================
+    # Escritura
+    def _guardar_medicamento(self, lista: ListaMedicamentos, detalle: Optional[Medicamento]) -> None:
+        principios = [fold_text(pa.nombre) for pa in (detalle.principiosActivos if detalle else []) if pa.nombre]
+        atcs = [(atc.codigo.upper(), fold_text(atc.nombre or "")) for atc in (detalle.atcs if detalle else []) if atc.codigo]
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO medicamentos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    lista.nregistro, fold_text(lista.nombre), fold_text(lista.labtitular or ""),
+                    int(lista.comerc), int(lista.receta), int(lista.triangulo), int(lista.huerfano),
+                    int(lista.biosimilar), len(principios) if detalle else None,
+                    lista.json(), detalle.json() if detalle else None,
+                    int(bool(lista.estado and lista.estado.rev)),
+                ),
+            )
+            self.conn.execute("DELETE FROM principios_activos WHERE nregistro = ?", (lista.nregistro,))
+            self.conn.executemany("INSERT INTO principios_activos VALUES (?, ?)", [(lista.nregistro, pa) for pa in principios])
+            self.conn.execute("DELETE FROM atcs WHERE nregistro = ?", (lista.nregistro,))
+            self.conn.executemany("INSERT INTO atcs VALUES (?, ?, ?)", [(lista.nregistro, c, n) for c, n in atcs])
+
+    def _guardar_presentaciones(self, presentaciones: Iterable[ListaPresentaciones]) -> None:
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO presentaciones VALUES (?, ?, ?)",
+                [(pres.cn, pres.nregistro, pres.json()) for pres in presentaciones],
+            )
+
+    def _marcar_baja(self, nregistro: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE medicamentos SET baja = 1 WHERE nregistro = ?", (nregistro,))
+
+    def _set_meta(self, name: str, value: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, value))
+
+    def _get_meta(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    #================================================================================================
+    # Sincronización
+    def _cargar_medicamento(self, lista: ListaMedicamentos) -> None:
+        # El listado no incluye principios activos ni ATC: se completan con el detalle del medicamento
+        detalle = get_medicamento(MedicamentoQueryParams(nregistro=lista.nregistro), usar_mirror=False)
+        self._guardar_medicamento(lista, detalle)
+
+    def sync_completo(self, max_workers: int = 8) -> None:
+        """Carga todo el catálogo de medicamentos y presentaciones de CIMA."""
+        inicio = time.time()
+        _map_por_tandas(self._cargar_medicamento, iter_medicamentos(MedicamentosQueryParams()), max_workers)
+
+        lote = []
+        for pres in iter_presentaciones(PresentacionesQueryParams()):
+            lote.append(pres)
+            if len(lote) >= 1000:
+                self._guardar_presentaciones(lote)
+                lote = []
+        self._guardar_presentaciones(lote)
+        self._set_meta("last_sync", str(inicio))
+
+    def _actualizar_medicamento(self, cambio: RegistroCambios) -> None:
+        # Consultar directamente a CIMA (iter_medicamentos nunca pasa por la réplica). En una baja
+        # se refrescan también los datos, que pasan a incluir la fecha de revocación
+        listado = iter_medicamentos(MedicamentosQueryParams(nregistro=cambio.nregistro))
+        lista = next((med for med in listado if med.nregistro == cambio.nregistro), None)
+        if lista is not None:
+            self._cargar_medicamento(lista)
+        if cambio.tipoCambio == 2:
+            # Se conserva la fila (y sus presentaciones), marcada como baja
+            self._marcar_baja(cambio.nregistro)
+            return
+        if lista is None:
+            return
+
+        if cambio.tipoCambio == 1 or CAMBIOS_PRESENTACIONES & set(cambio.cambios):
+            with self._lock, self.conn:
+                self.conn.execute("DELETE FROM presentaciones WHERE nregistro = ?", (cambio.nregistro,))
+            self._guardar_presentaciones(iter_presentaciones(PresentacionesQueryParams(nregistro=cambio.nregistro)))
+
+    def sync_incremental(self, max_workers: int = 8) -> int:
+        """Aplica los cambios publicados en registroCambios desde la última sincronización."""
+        last_sync = self._get_meta("last_sync")
+        if last_sync is None:
+            self.sync_completo(max_workers)
+            return 0
+
+        inicio = time.time()
+        params = RegistroCambiosQueryParams(fecha=datetime.fromtimestamp(float(last_sync)).strftime("%d/%m/%Y"))
+        cambios = [
+            cambio
+            for resultados in _iter_paginas(f"{CIMA_BASE_URL}/registroCambios", params.dict(exclude_unset=True), modelo=RegistroCambios)
+            for cambio in resultados
+        ]
+        cambios = [cambio for cambio in cambios if cambio.nregistro]
+
+        # Las respuestas cacheadas de estos medicamentos ya no son válidas
+        cache = get_default_client().cache
+        if cache is not None:
+            cache.invalidate_nregistros(cambio.nregistro for cambio in cambios)
+
+        _map_por_tandas(self._actualizar_medicamento, cambios, max_workers)
+        self._set_meta("last_sync", str(inicio))
+        return len(cambios)
+
+    def sincronizada(self) -> bool:
+        # Cargada al menos una vez (hasta entonces todas las consultas van a CIMA)
+        return self._get_meta("last_sync") is not None
+
+    #================================================================================================
+    # Consultas locales
+    def soporta(self, params: MedicamentosQueryParams) -> bool:
+        filtros = {k for k, v in params.dict(exclude_unset=True).items() if v is not None}
+        return filtros <= FILTROS_LOCALES and self.sincronizada()
+
+    def buscar_medicamentos(self, params: MedicamentosQueryParams) -> List[ListaMedicamentos]:
+        filtros = {k: v for k, v in params.dict(exclude_unset=True).items() if v is not None}
+        where, args = [], []
+
+        # Texto: coincidencia parcial sin acentos ni mayúsculas, como en CIMA
+        if "nombre" in filtros:
+            where.append("m.nombre LIKE ?")
+            args.append(f"%{fold_text(filtros['nombre'])}%")
+        if "laboratorio" in filtros:
+            where.append("m.laboratorio LIKE ?")
+            args.append(f"%{fold_text(filtros['laboratorio'])}%")
+        for key in ("practiv1", "practiv2"):
+            if key in filtros:
+                where.append("m.nregistro IN (SELECT nregistro FROM principios_activos WHERE nombre LIKE ?)")
+                args.append(f"%{fold_text(filtros[key])}%")
+        if "atc" in filtros:
+            # Código ATC (prefijo del nivel jerárquico) o descripción. Con el índice ATC, la
+            # descripción de un grupo ("analgésicos") se resuelve a sus códigos (N02)
+            grupos = resolve_atc(filtros["atc"])
+            if grupos:
+                where.append("m.nregistro IN (SELECT nregistro FROM atcs WHERE " + " OR ".join(["codigo LIKE ?"] * len(grupos)) + ")")
+                args.extend(f"{codigo}%" for codigo in grupos)
+            else:
+                where.append("m.nregistro IN (SELECT nregistro FROM atcs WHERE codigo LIKE ? OR nombre LIKE ?)")
+                args.extend([f"{filtros['atc'].strip().upper()}%", f"%{fold_text(filtros['atc'])}%"])
+
+        # Identificadores exactos
+        if "nregistro" in filtros:
+            where.append("m.nregistro = ?")
+            args.append(filtros["nregistro"])
+        if "cn" in filtros:
+            where.append("m.nregistro IN (SELECT nregistro FROM presentaciones WHERE cn = ?)")
+            args.append(filtros["cn"])
+
+        # Indicadores
+        for key in ("comerc", "receta", "triangulo", "huerfano", "biosimilar", "npactiv"):
+            if key in filtros:
+                where.append(f"m.{key} = ?")
+                args.append(int(filtros[key]))
+
+        sql = "SELECT m.lista_json FROM medicamentos m"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY m.nombre"
+        with self._lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        return views_from_rows([row[0] for row in rows], ListaMedicamentos)
+
+    def get_medicamento(self, params: MedicamentoQueryParams) -> Optional[Medicamento]:
+        # Devuelve None si el medicamento no está en la réplica, para que se consulte a CIMA
+        with self._lock:
+            if params.nregistro:
+                row = self.conn.execute("SELECT detalle_json FROM medicamentos WHERE nregistro = ?", (params.nregistro,)).fetchone()
+            elif params.cn:
+                row = self.conn.execute(
+                    "SELECT m.detalle_json FROM medicamentos m JOIN presentaciones p ON p.nregistro = m.nregistro WHERE p.cn = ?",
+                    (params.cn,),
+                ).fetchone()
+            else:
+                row = None
+        if row is None or row[0] is None:
+            return None
+        return decode(row[0], Medicamento)
+
+    def get_presentaciones(self, nregistro: str) -> List[ListaPresentaciones]:
+        with self._lock:
+            rows = self.conn.execute("SELECT json FROM presentaciones WHERE nregistro = ?", (nregistro,)).fetchall()
+        return views_from_rows([row[0] for row in rows], ListaPresentaciones)
+
+    #================================================================================================
+    # Recorrido completo (p. ej. para catalog_snapshot). Usa una conexión propia de solo lectura
+    # para no bloquear las consultas mientras se recorre la réplica
+    def _recorrer(self, sql: str) -> Iterator[str]:
+        conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True)
+        try:
+            for (fila,) in conn.execute(sql):
+                yield fila
+        finally:
+            conn.close()
+
+    def recorrer_medicamentos(self) -> Iterator[ListaMedicamentos]:
+        cls = view_class(ListaMedicamentos)
+        return (cls(json.loads(fila)) for fila in self._recorrer("SELECT lista_json FROM medicamentos ORDER BY nregistro"))
+
+    def recorrer_presentaciones(self) -> Iterator[ListaPresentaciones]:
+        cls = view_class(ListaPresentaciones)
+        return (cls(json.loads(fila)) for fila in self._recorrer("SELECT json FROM presentaciones ORDER BY nregistro, cn"))
+
+    def atc_por_nregistro(self) -> Dict[str, str]:
+        # Código ATC más específico (el más largo) de cada medicamento
+        with self._lock:
+            rows = self.conn.execute("SELECT nregistro, MAX(LENGTH(codigo)), codigo FROM atcs GROUP BY nregistro").fetchall()
+        return {nregistro: codigo for nregistro, _, codigo in rows}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def activar_mirror(path: str = DEFAULT_MIRROR_PATH) -> CimaMirror:
+    # Abrir la réplica y hacer que api_calls responda desde ella las consultas que admite
+    mirror = CimaMirror(path)
+    api_calls.set_mirror(mirror)
+    return mirror
+
+
+def activar_mirror_desde_entorno() -> Optional[CimaMirror]:
+    # Activación opcional al arrancar el servicio: solo si CIMA_MIRROR_PATH indica la réplica
+    path = os.getenv("CIMA_MIRROR_PATH", "")
+    return activar_mirror(path) if path else None
+
+
+#================================================================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Réplica local del catálogo de CIMA")
+    parser.add_argument("comando", choices=["sync", "full-sync"], help="sync: incremental (completa si no existe), full-sync: recarga completa")
+    parser.add_argument("--path", default=os.getenv("CIMA_MIRROR_PATH", DEFAULT_MIRROR_PATH))
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    mirror = CimaMirror(args.path)
+    if args.comando == "full-sync":
+        mirror.sync_completo(args.workers)
+        print("Catálogo cargado")
+    else:
+        print(f"Cambios aplicados: {mirror.sync_incremental(args.workers)}")
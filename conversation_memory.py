@@ -0,0 +1,155 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+from langchain.pydantic_v1 import BaseModel, Field
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.language_models import BaseLLM
+from langchain_core.prompts import ChatPromptTemplate
+from structured_extraction import StructuredExtractor
+from text_normalization import estimate_tokens
+
+# Memoria de conversación con presupuesto de tokens.
+# Los últimos turnos se envían tal cual y los anteriores se resumen en un resumen acumulado que se
+# actualiza de forma incremental (como RSummarizer en pruebas/pruebas.py): cada actualización
+# solo procesa los turnos que han salido de la ventana desde la anterior. El estado se guarda por
+# sesión para no recalcularlo en cada turno. El resumen tiene su propio límite de tokens: si lo
+# supera se vuelve a condensar y, si aun así no cabe, se recorta.
+
+DEFAULT_TOKEN_BUDGET = 2048
+DEFAULT_KEEP_TURNS = 4
+DEFAULT_MAX_SESSIONS = 1000
+# Fracción del presupuesto que puede ocupar el resumen
+DEFAULT_SUMMARY_SHARE = 0.25
+
+
+class ConversationSummary(BaseModel):
+    running_summary: str = Field("", description="Resumen de la conversación hasta ahora. No lo reemplaces; solo actualízalo")
+    medicamentos: List[str] = Field([], description="Medicamentos sobre los que ha preguntado el usuario")
+
+
+summary_prompt = ChatPromptTemplate.from_template(
+    "Estás manteniendo un resumen de una conversación entre un usuario y el asistente SearchMed. "
+    "Conserva toda la información del resumen actual y añade la de los nuevos turnos, de forma breve y densa."
+    "\n\nResponde únicamente con un objeto JSON con estos campos:\n{schema}"
+    "\n\n{input}"
+)
+
+compact_prompt = ChatPromptTemplate.from_template(
+    "El resumen de una conversación entre un usuario y el asistente SearchMed se ha hecho demasiado largo. "
+    "Condénsalo conservando los medicamentos consultados y lo imprescindible para entender las próximas preguntas."
+    "\n\nResponde únicamente con un objeto JSON con estos campos:\n{schema}"
+    "\n\n{input}"
+)
+
+
+def _turn_tokens(turn: Tuple[str, str]) -> int:
+    return estimate_tokens(turn[0]) + estimate_tokens(turn[1] or "")
+
+
+class SessionState:
+    def __init__(self):
+        self.summary = ConversationSummary()
+        self.summarized_turns = 0  # Nº de turnos del historial ya incorporados al resumen
+        self.lock = threading.Lock()
+
+
+class ConversationMemory:
+    """
+    Construye los mensajes de cada turno respetando token_budget: hasta keep_turns turnos
+    recientes literales (menos si no caben) y un mensaje de sistema con el resumen del resto,
+    que nunca supera max_summary_tokens (por defecto, una cuarta parte del presupuesto).
+    """
+
+    def __init__(self, llm: BaseLLM, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 keep_turns: int = DEFAULT_KEEP_TURNS, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 max_summary_tokens: Optional[int] = None):
+        self.summarizer = StructuredExtractor(ConversationSummary, llm, summary_prompt)
+        self.compactor = StructuredExtractor(ConversationSummary, llm, compact_prompt)
+        self.token_budget = token_budget
+        self.max_summary_tokens = max_summary_tokens or int(token_budget * DEFAULT_SUMMARY_SHARE)
+        self.keep_turns = keep_turns
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session(self, session_id: str) -> SessionState:
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = SessionState()
+                self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return state
+
+    def _summary_text(self, summary: ConversationSummary) -> str:
+        if not summary.running_summary:
+            return ""
+        text = f"Resumen de la conversación anterior: {summary.running_summary}"
+        if summary.medicamentos:
+            text += f"\nMedicamentos consultados: {', '.join(summary.medicamentos)}"
+        return text
+
+    def _fold(self, state: SessionState, turns: Sequence[Tuple[str, str]]) -> None:
+        # Incorporar al resumen solo los turnos nuevos
+        dialogo = "\n".join(f"Usuario: {human}\nAsistente: {ai}" for human, ai in turns)
+        result = self.summarizer.extract(f"Resumen actual: {state.summary.json()}\n\nNuevos turnos:\n{dialogo}")
+        if result.knowledge.running_summary:
+            state.summary = result.knowledge
+        if estimate_tokens(self._summary_text(state.summary)) > self.max_summary_tokens:
+            self._compact(state)
+
+    def _compact(self, state: SessionState) -> None:
+        # Volver a condensar el resumen que supera su límite; si el modelo no lo consigue, recortarlo
+        limite = self.max_summary_tokens
+        result = self.compactor.extract(f"Límite: unas {limite * 3 // 4} palabras.\n\nResumen actual: {state.summary.json()}")
+        summary = result.knowledge
+        if not summary.running_summary or estimate_tokens(summary.running_summary) >= estimate_tokens(state.summary.running_summary):
+            summary = state.summary
+        summary = summary.copy(update={"medicamentos": summary.medicamentos or state.summary.medicamentos})
+        exceso = estimate_tokens(self._summary_text(summary)) - limite
+        if exceso > 0:
+            # Recortar por el principio: lo más reciente es lo más útil para el siguiente turno
+            summary.running_summary = "…" + summary.running_summary[exceso * 4 + 1:]
+        state.summary = summary
+
+    def _window_start(self, state: SessionState, history: Sequence[Tuple[str, str]], message: str) -> int:
+        # Primer turno de la ventana literal con el resumen actual
+        budget = self.token_budget - estimate_tokens(message) - estimate_tokens(self._summary_text(state.summary))
+        start = len(history)
+        while start > max(0, len(history) - self.keep_turns, state.summarized_turns):
+            cost = _turn_tokens(history[start - 1])
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+        return start
+
+    def messages(self, session_id: str, history: Sequence[Tuple[str, str]], message: str) -> List[BaseMessage]:
+        state = self._session(session_id)
+        with state.lock:
+            if len(history) < state.summarized_turns:
+                # Historial reiniciado (p. ej. el usuario ha borrado el chat)
+                state.summary, state.summarized_turns = ConversationSummary(), 0
+
+            # Ventana literal: últimos keep_turns turnos que quepan en el presupuesto junto al
+            # mensaje actual y el resumen. Al resumir los turnos que no caben el resumen crece, así
+            # que la ventana se recalcula con el nuevo resumen hasta que todo cabe
+            while True:
+                start = self._window_start(state, history, message)
+                if start <= state.summarized_turns:
+                    break
+                self._fold(state, history[state.summarized_turns:start])
+                state.summarized_turns = start
+            summary_text = self._summary_text(state.summary)
+            recent = history[state.summarized_turns:]
+
+        messages: List[BaseMessage] = []
+        if summary_text:
+            messages.append(SystemMessage(content=summary_text))
+        for human, ai in recent:
+            messages.append(HumanMessage(content=human))
+            messages.append(AIMessage(content=ai or ""))
+        messages.append(HumanMessage(content=message))
+        return messages
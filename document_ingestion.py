@@ -0,0 +1,91 @@
+import logging
+from typing import Any, List, Optional
+from langchain_core.documents import Document
+from langchain_community.document_loaders import OnlinePDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from api_calls import DocSegmentadoContenidoParams, get_doc_segmentado_contenido, filter_html_text
+from pydantic_api_models import Documento, Seccion
+from section_targeting import apartado
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Tipos de documento disponibles en docSegmentado (1: Ficha técnica, 2: Prospecto)
+TIPOS_DOC_SEGMENTADO = {1, 2}
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1200,
+    chunk_overlap=100,
+    separators=["\n\n", "\n", ".", ";", ",", " ", ""],
+)
+
+
+def _parse_secciones(contenido: Any) -> List[Seccion]:
+    # docSegmentado/contenido devuelve una lista de secciones (o una sola si se pide una sección)
+    if contenido is None:
+        return []
+    if isinstance(contenido, dict):
+        contenido = [contenido]
+    return [Seccion(**seccion) for seccion in contenido]
+
+
+def secciones_to_documents(nregistro: str, tipo: int, secciones: List[Seccion]) -> List[Document]:
+    """
+    Convierte las secciones HTML de CIMA en fragmentos de texto. Cada fragmento conserva el
+    número, título y orden de su sección, y las secciones largas se dividen sin mezclarse entre sí.
+    """
+    documents = []
+    for seccion in secciones:
+        texto = filter_html_text(seccion.contenido or "", separator="\n").strip()
+        if not texto:
+            continue
+        encabezado = " ".join(part for part in (seccion.seccion, seccion.titulo) if part)
+        documents.append(Document(
+            page_content=f"{encabezado}\n{texto}" if encabezado else texto,
+            metadata={
+                "nregistro": nregistro,
+                "tipo": tipo,
+                "seccion": seccion.seccion or "",
+                "apartado": apartado(seccion.seccion or ""),
+                "titulo": seccion.titulo or "",
+                "orden": seccion.orden if seccion.orden is not None else -1,
+            },
+        ))
+    with span("splitting", secciones=len(documents)) as current:
+        chunks = text_splitter.split_documents(documents)
+        current.set(chunks=len(chunks))
+    return chunks
+
+
+def load_secciones(nregistro: str, tipo: int, secciones: Optional[List[str]] = None) -> List[Document]:
+    # Descargar el documento completo o solo las secciones indicadas
+    with span("section_load", nregistro=nregistro, tipo=tipo, secciones=secciones or "*"):
+        if secciones is None:
+            contenido = _parse_secciones(get_doc_segmentado_contenido(DocSegmentadoContenidoParams(tipoDoc=tipo, nregistro=nregistro)))
+        else:
+            contenido = []
+            for seccion in secciones:
+                params = DocSegmentadoContenidoParams(tipoDoc=tipo, nregistro=nregistro, seccion=seccion)
+                contenido.extend(_parse_secciones(get_doc_segmentado_contenido(params)))
+    return secciones_to_documents(nregistro, tipo, contenido)
+
+
+def load_pdf(documento: Documento) -> List[Document]:
+    with span("pdf_load", url=documento.url) as current:
+        documents = OnlinePDFLoader(file_path=documento.url).load_and_split()
+        current.set(chunks=len(documents))
+    logger.info("Documento cargado y dividido", extra={"url": documento.url, "chunks": len(documents)})
+    return documents
+
+
+def load_document(nregistro: str, documento: Documento) -> List[Document]:
+    """
+    Carga un documento de un medicamento como fragmentos para el índice vectorial.
+    Usa las secciones de docSegmentado si el documento está disponible por secciones
+    (Documento.secc) y recurre al PDF solo en caso contrario.
+    """
+    if documento.secc and documento.tipo in TIPOS_DOC_SEGMENTADO:
+        documents = load_secciones(nregistro, documento.tipo)
+        if documents:
+            return documents
+    return load_pdf(documento)
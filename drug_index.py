@@ -0,0 +1,243 @@
+import hashlib, json, os, re, threading, time
+from collections import Counter, defaultdict, OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import chromadb
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from pydantic_api_models import Documento
+from tracing import span
+
+DEFAULT_INDEX_DIR = os.getenv(
+    "VECTOR_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "vectorstore")
+)
+# Límite de fragmentos indexados en total (aproximación de la memoria que ocupan los índices)
+DEFAULT_MAX_CHUNKS = int(os.getenv("VECTOR_STORE_MAX_CHUNKS", "200000"))
+DEFAULT_MAX_COLLECTIONS = int(os.getenv("VECTOR_STORE_MAX_COLLECTIONS", "2000"))
+# Documentos sin fecha de modificación: sin forma de saber si han cambiado, se reindexan tras este tiempo (s)
+DEFAULT_UNDATED_TTL = int(os.getenv("VECTOR_STORE_UNDATED_TTL", str(7 * 24 * 3600)))
+# Intervalo mínimo (s) entre escrituras del manifiesto cuando solo cambia last_used
+MANIFEST_SAVE_INTERVAL = 30
+
+# Versión del formato de los índices; al cambiarla las colecciones existentes se reconstruyen.
+# 2: colecciones con distancia coseno (antes L2, que daba relevancias fuera de [0, 1])
+INDEX_VERSION = 2
+COLLECTION_METADATA = {"hnsw:space": "cosine"}
+
+
+def chunk_id(nregistro: str, tipo: Optional[int], document: Document) -> str:
+    # Identificador por contenido: el mismo fragmento siempre tiene el mismo ID
+    raw = f"{nregistro}|{tipo or 0}|{document.metadata.get('seccion', '')}|{document.page_content}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def search_by_vector(vectorstore: Chroma, embedding: Sequence[float], k: int = 4,
+                     filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+    # Recuperación con el embedding de la pregunta ya calculado: (fragmento, relevancia 0-1).
+    # Con distancia coseno la relevancia es 1 - distancia; se acota por si hay vectores opuestos
+    results = vectorstore.similarity_search_by_vector_with_relevance_scores(list(embedding), k=k, filter=filter)
+    return [(document, min(1.0, max(0.0, 1.0 - distance))) for document, distance in results]
+
+
+class DrugIndexStore:
+    """
+    Índice vectorial persistente con una colección por documento de cada medicamento.
+    Las colecciones se identifican por nregistro y tipo de documento, y se guarda la fecha de
+    modificación del documento (Documento.fecha) con la que se construyeron. Las preguntas
+    posteriores sobre el mismo medicamento van directamente a la recuperación; solo se vuelve a
+    descargar y embeber el documento cuando CIMA publica una fecha más reciente.
+
+    Los fragmentos se guardan con IDs derivados de su contenido y se insertan con upsert, por lo
+    que nunca se duplican. Cuando el total de fragmentos o de colecciones supera el límite se
+    eliminan las colecciones usadas menos recientemente, salvo las que están en uso (in_use).
+    """
+
+    def __init__(self, embedder: Embeddings, persist_directory: str = DEFAULT_INDEX_DIR,
+                 max_chunks: int = DEFAULT_MAX_CHUNKS, max_collections: int = DEFAULT_MAX_COLLECTIONS,
+                 undated_ttl: int = DEFAULT_UNDATED_TTL):
+        self.embedder = embedder
+        self.persist_directory = persist_directory
+        self.max_chunks = max_chunks
+        self.max_collections = max_collections
+        self.undated_ttl = undated_ttl
+        os.makedirs(persist_directory, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=persist_directory)
+
+        # manifest: nombre de colección -> {"fecha", "indexed_at", "secciones" ("*" = completo), "chunks", "last_used"}
+        self.manifest_path = os.path.join(persist_directory, "manifest.json")
+        self.manifest: Dict[str, Dict] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") == INDEX_VERSION:
+                self.manifest = saved["colecciones"]
+            else:
+                self._drop_outdated(saved.get("colecciones", saved))
+
+        self._handles: "OrderedDict[str, Chroma]" = OrderedDict()  # LRU de como mucho max_collections
+        self._in_use: Counter = Counter()  # Colecciones que no se pueden expulsar -> nº de usuarios
+        self._last_save = 0.0
+        self._lock = threading.Lock()
+        self._key_locks = defaultdict(threading.Lock)  # Evita ingerir dos veces el mismo documento a la vez
+
+    @staticmethod
+    def collection_name(nregistro: str, tipo: Optional[int]) -> str:
+        # Chroma solo admite [a-zA-Z0-9._-] en los nombres de colección
+        return f"drug_{re.sub(r'[^a-zA-Z0-9_-]', '_', nregistro)}_{tipo or 0}"
+
+    def _save_manifest(self) -> None:
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "colecciones": self.manifest}, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._last_save = time.time()
+
+    def _drop_outdated(self, colecciones: Dict[str, Dict]) -> None:
+        # Índices de una versión anterior: se eliminan y se reconstruyen según se vuelvan a consultar
+        for name in colecciones:
+            try:
+                self.client.delete_collection(name)
+            except ValueError:
+                pass  # La colección ya no existía
+        self._save_manifest()
+
+    def _open(self, name: str) -> Chroma:
+        with self._lock:
+            vectorstore = self._handles.get(name)
+            if vectorstore is None:
+                vectorstore = Chroma(client=self.client, collection_name=name, embedding_function=self.embedder,
+                                     collection_metadata=COLLECTION_METADATA)
+                self._handles[name] = vectorstore
+                while len(self._handles) > self.max_collections:
+                    self._handles.popitem(last=False)
+            self._handles.move_to_end(name)
+            if name in self.manifest:
+                # El orden LRU debe sobrevivir a los reinicios, pero sin escribir el manifiesto en cada consulta
+                self.manifest[name]["last_used"] = time.time()
+                if time.time() - self._last_save >= MANIFEST_SAVE_INTERVAL:
+                    self._save_manifest()
+            return vectorstore
+
+    @contextmanager
+    def in_use(self, nregistro: str, tipo: Optional[int]) -> Iterator[None]:
+        """Mientras dura, la colección del documento no se expulsa (p. ej. entre la ingesta y la recuperación)."""
+        name = self.collection_name(nregistro, tipo)
+        with self._lock:
+            self._in_use[name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use[name] -= 1
+                if not self._in_use[name]:
+                    del self._in_use[name]
+
+    def _same_version(self, entry: Dict, documento: Documento) -> bool:
+        # Indexado con la fecha vigente; si CIMA no da fecha, solo durante undated_ttl desde la indexación
+        if documento.fecha is None:
+            return entry.get("fecha") is None and time.time() - entry.get("indexed_at", 0) < self.undated_ttl
+        return entry.get("fecha") == documento.fecha
+
+    def is_current(self, nregistro: str, documento: Documento) -> bool:
+        # Documento completo indexado con la versión vigente
+        entry = self.manifest.get(self.collection_name(nregistro, documento.tipo))
+        return entry is not None and self._same_version(entry, documento) and entry.get("secciones", "*") == "*"
+
+    def upsert(self, nregistro: str, documento: Documento, documents: List[Document]) -> List[str]:
+        """Inserta o actualiza fragmentos en la colección del documento, sin duplicados."""
+        name = self.collection_name(nregistro, documento.tipo)
+        vectorstore = self._open(name)
+        unique: Dict[str, Document] = {}
+        for document in documents:
+            document.metadata.update({"nregistro": nregistro, "tipo": documento.tipo or 0})
+            unique.setdefault(chunk_id(nregistro, documento.tipo, document), document)
+        if unique:
+            with span("embedding", chunks=len(unique)):
+                vectorstore.add_documents(list(unique.values()), ids=list(unique.keys()))
+        return list(unique.keys())
+
+    def get_vectorstore(self, nregistro: str, documento: Documento, loader: Callable[[], List[Document]]) -> Chroma:
+        """
+        Devuelve la colección del documento, ingiriéndolo con loader() solo si no existe o si
+        la fecha de modificación del documento ha cambiado.
+        """
+        name = self.collection_name(nregistro, documento.tipo)
+        with self._lock:
+            key_lock = self._key_locks[name]
+
+        with key_lock:
+            vectorstore = self._open(name)
+            if self.is_current(nregistro, documento):
+                return vectorstore
+
+            # Documento nuevo o actualizado en CIMA: upsert de los fragmentos actuales y
+            # eliminación de los que ya no aparecen en el documento
+            new_ids = set(self.upsert(nregistro, documento, loader()))
+            stale_ids = set(vectorstore.get(include=[])["ids"]) - new_ids
+            if stale_ids:
+                vectorstore.delete(ids=list(stale_ids))
+
+            with self._lock:
+                self.manifest[name] = {"fecha": documento.fecha, "indexed_at": time.time(), "secciones": "*",
+                                       "chunks": len(new_ids), "last_used": time.time()}
+                self._evict(keep=name)
+                self._save_manifest()
+            return vectorstore
+
+    def get_vectorstore_secciones(self, nregistro: str, documento: Documento, secciones: List[str],
+                                  loader: Callable[[List[str]], List[Document]]) -> Chroma:
+        """
+        Devuelve la colección del documento asegurando que contiene los apartados indicados.
+        Solo se descargan y embeben, con loader(apartados), los que aún no se habían indexado.
+        """
+        name = self.collection_name(nregistro, documento.tipo)
+        with self._lock:
+            key_lock = self._key_locks[name]
+
+        with key_lock:
+            vectorstore = self._open(name)
+            entry = self.manifest.get(name)
+            if entry is not None and not self._same_version(entry, documento):
+                # Documento actualizado en CIMA: descartar los fragmentos de la versión anterior
+                old_ids = vectorstore.get(include=[])["ids"]
+                if old_ids:
+                    vectorstore.delete(ids=old_ids)
+                entry = None
+            if entry is None:
+                entry = {"fecha": documento.fecha, "indexed_at": time.time(), "secciones": [], "chunks": 0}
+
+            indexed = entry.get("secciones", "*")
+            if indexed == "*":
+                return vectorstore
+            missing = [seccion for seccion in secciones if seccion not in indexed]
+            if not missing:
+                return vectorstore
+
+            self.upsert(nregistro, documento, loader(missing))
+            with self._lock:
+                entry.update({
+                    "secciones": indexed + missing,
+                    "chunks": len(vectorstore.get(include=[])["ids"]),
+                    "last_used": time.time(),
+                })
+                self.manifest[name] = entry
+                self._evict(keep=name)
+                self._save_manifest()
+            return vectorstore
+
+    def _evict(self, keep: str) -> None:
+        # Eliminar las colecciones usadas menos recientemente hasta respetar los límites
+        total_chunks = sum(entry.get("chunks", 0) for entry in self.manifest.values())
+        # Las colecciones en uso se saltan: si hace falta, se expulsarán en la siguiente ingesta
+        candidates = sorted((n for n in self.manifest if n != keep and n not in self._in_use),
+                            key=lambda n: self.manifest[n].get("last_used", 0))
+        for name in candidates:
+            if total_chunks <= self.max_chunks and len(self.manifest) <= self.max_collections:
+                break
+            total_chunks -= self.manifest.pop(name).get("chunks", 0)
+            self._handles.pop(name, None)
+            try:
+                self.client.delete_collection(name)
+            except ValueError:
+                pass  # La colección ya no existía
@@ -0,0 +1,125 @@
+import typing
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type, Union
+import pydantic
+from pydantic import ConfigDict, TypeAdapter
+from langchain.pydantic_v1 import BaseModel as BaseModelV1
+from tracing import span
+
+# Decodificación rápida de las respuestas de CIMA con el núcleo compilado de pydantic v2.
+# Los modelos de pydantic_api_models siguen siendo pydantic v1 (los usa el output parser de
+# LangChain), pero validarlos campo a campo desde un dict es lento para listados de cientos de
+# medicamentos. Aquí se genera para cada modelo v1 un modelo v2 "espejo" con los mismos campos,
+# tipos y valores por defecto, y los bytes de la respuesta se validan directamente con
+# validate_json, sin pasar por json.loads ni por dicts intermedios.
+#
+# Los objetos espejo mantienen la interfaz de v1 que usa el resto del código (.dict(), .json(),
+# parse_obj, parse_raw) y to_v1() devuelve el modelo v1 original cuando hace falta uno de verdad.
+
+
+class CompatModel(pydantic.BaseModel):
+    """Base de los modelos espejo: modelo pydantic v2 con la interfaz de pydantic v1."""
+
+    # Como v1, aceptar números en campos de texto (p. ej. códigos que CIMA devuelve como enteros)
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    def dict(self, *, include=None, exclude=None, by_alias: bool = False, exclude_unset: bool = False,
+             exclude_defaults: bool = False, exclude_none: bool = False) -> Dict[str, Any]:
+        return self.model_dump(include=include, exclude=exclude, by_alias=by_alias, exclude_unset=exclude_unset,
+                               exclude_defaults=exclude_defaults, exclude_none=exclude_none)
+
+    def json(self, *, include=None, exclude=None, by_alias: bool = False, exclude_unset: bool = False,
+             exclude_defaults: bool = False, exclude_none: bool = False) -> str:
+        return self.model_dump_json(include=include, exclude=exclude, by_alias=by_alias, exclude_unset=exclude_unset,
+                                    exclude_defaults=exclude_defaults, exclude_none=exclude_none)
+
+    @classmethod
+    def parse_obj(cls, obj: Any) -> "CompatModel":
+        return cls.model_validate(obj)
+
+    @classmethod
+    def parse_raw(cls, data: Union[str, bytes]) -> "CompatModel":
+        return cls.model_validate_json(data)
+
+    def to_v1(self) -> BaseModelV1:
+        # Modelo v1 equivalente (para el output parser de LangChain o código que compruebe el tipo)
+        return _MODELOS_V1[type(self)].parse_obj(self.model_dump())
+
+
+# Modelo espejo -> modelo v1 del que se generó
+_MODELOS_V1: Dict[type, Type[BaseModelV1]] = {}
+
+
+def traducir_tipo(tipo: Any) -> Any:
+    """Sustituye los modelos v1 por sus espejos dentro de una anotación (List[...], Optional[...])."""
+    if isinstance(tipo, type) and issubclass(tipo, BaseModelV1):
+        return espejo(tipo)
+    origen, args = typing.get_origin(tipo), typing.get_args(tipo)
+    if origen is None or not args:
+        return tipo
+    args = tuple(traducir_tipo(arg) for arg in args)
+    return Union[args] if origen is Union else origen[args]
+
+
+@lru_cache(maxsize=None)
+def espejo(modelo: Type[BaseModelV1]) -> Type[CompatModel]:
+    """Devuelve (y memoiza) el modelo pydantic v2 equivalente a un modelo pydantic v1."""
+    campos = {}
+    for nombre, field in modelo.__fields__.items():
+        anotacion = traducir_tipo(field.annotation)
+        # En v1 un campo con valor por defecto None admite None aunque no se anote como Optional
+        if field.allow_none and type(None) not in typing.get_args(anotacion):
+            anotacion = Optional[anotacion]
+        default = ... if field.required else field.default
+        campos[nombre] = (anotacion, pydantic.Field(default, description=field.field_info.description))
+
+    modelo_v2 = pydantic.create_model(modelo.__name__, __base__=CompatModel, __module__=__name__, **campos)
+    modelo_v2.__doc__ = modelo.__doc__
+    _MODELOS_V1[modelo_v2] = modelo
+    return modelo_v2
+
+
+@lru_cache(maxsize=None)
+def _modelo_pagina(modelo: Type[BaseModelV1]) -> Type[CompatModel]:
+    # Página de un endpoint paginado de CIMA; el resto de claves de la respuesta se ignoran
+    return pydantic.create_model(
+        f"Pagina{modelo.__name__}", __base__=CompatModel, __module__=__name__,
+        resultados=(List[espejo(modelo)], []),
+        totalFilas=(Optional[int], None),
+        pagina=(Optional[int], None),
+        tamanioPagina=(Optional[int], None),
+    )
+
+
+@lru_cache(maxsize=None)
+def _adaptador_lista(modelo: Type[BaseModelV1]) -> TypeAdapter:
+    return TypeAdapter(List[espejo(modelo)])
+
+
+#================================================================================================
+# Decodificación. Aceptan los bytes de la respuesta (response.content) o texto JSON y lanzan
+# pydantic.ValidationError (subclase de ValueError) si el contenido está vacío, no es JSON o no
+# se ajusta al modelo: CIMA responde con el cuerpo vacío, p. ej., a un CN desconocido.
+def decode(data: Union[str, bytes], modelo: Type[BaseModelV1]) -> CompatModel:
+    """Decodifica un objeto JSON (p. ej. /medicamento) como el espejo del modelo indicado."""
+    with span("decoding", modelo=modelo.__name__):
+        return espejo(modelo).model_validate_json(data)
+
+
+def decode_list(data: Union[str, bytes], modelo: Type[BaseModelV1]) -> List[CompatModel]:
+    """Decodifica un array JSON de objetos del modelo indicado en una sola pasada."""
+    with span("decoding", modelo=modelo.__name__):
+        return _adaptador_lista(modelo).validate_json(data)
+
+
+def decode_pagina(data: Union[str, bytes], modelo: Type[BaseModelV1]) -> CompatModel:
+    """Decodifica una página de CIMA ({"resultados": [...], "totalFilas": ...}) con resultados tipados."""
+    with span("decoding", modelo=modelo.__name__) as current:
+        pagina = _modelo_pagina(modelo).model_validate_json(data)
+        current.set(resultados=len(pagina.resultados))
+        return pagina
+
+
+def decode_resultados(data: Union[str, bytes], modelo: Type[BaseModelV1]) -> List[CompatModel]:
+    # Atajo para los endpoints que solo se leen en su primera página
+    return decode_pagina(data, modelo).resultados
@@ -0,0 +1,108 @@
+import re
+from typing import List, Optional, Tuple
+from api_calls import MedicamentoQueryParams, MedicamentosQueryParamsV2
+from text_normalization import fold_text
+
+# Extracción de parámetros por reglas, sin LLM.
+# Cubre los casos deterministas (código nacional, nº de registro, "laboratorio X") y devuelve
+# None cuando la consulta contiene información que las reglas no saben interpretar, para que
+# se recurra al extractor basado en LLM.
+
+# Código nacional: 6 dígitos, opcionalmente seguidos del dígito de control ("726684.8" o "7266848")
+_CN = re.compile(r"(?<![\d.])(\d{6})(?:[.\-]?(\d))?(?![\d])")
+_CN_KEYWORD = re.compile(r"\b(?:codigo\s+nacional|c\.?\s?n\.?|cn)\s*:?\s*(\d{6})(?:[.\-]?(\d))?(?!\d)")
+_NREGISTRO_KEYWORD = re.compile(
+    r"\b(?:n(?:umero|o|º)?\.?\s*(?:de\s+)?registro|nregistro|registro)\s*:?\s*(?:n(?:umero|o|º)?\.?\s*)?(\d{5,10})(?!\d)"
+)
+
+# Palabras que pueden acompañar a los datos extraídos sin aportar otros parámetros
+_FILLER_WORDS = {
+    "quiero", "querria", "quisiera", "necesito", "dame", "dime", "busca", "buscar", "buscame", "obtener",
+    "saber", "conocer", "ver", "mostrar", "muestrame", "informacion", "info", "datos", "detalles", "general",
+    "generales", "sobre", "acerca", "del", "de", "la", "las", "el", "los", "lo", "un", "una", "unos", "unas",
+    "al", "a", "con", "que", "y", "o", "por", "para", "en", "me", "mi", "es", "son", "hay", "todos", "todas",
+    "medicamento", "medicamentos", "farmaco", "farmacos", "codigo", "nacional", "cn", "numero", "n", "no",
+    "registro", "nregistro", "laboratorio", "laboratorios", "fabricados", "fabricado", "fabrica", "comercializados",
+    "comercializado", "via", "oral", "topica", "cutanea", "intravenosa", "rectal", "oftalmica", "nasal",
+    "inhalatoria", "vaginal", "subcutanea", "intramuscular", "administracion", "por", "favor", "cual", "cuales",
+    "existen", "tiene", "tienen", "puedes", "podrias",
+}
+
+# Fin del nombre de un laboratorio
+_LAB_STOP_WORDS = {"via", "con", "y", "o", "para", "en", "que", "sin", "de", "del", "por", "medicamento", "medicamentos"}
+
+_WORD = re.compile(r"[^\W_]+(?:[.&\-][^\W_]+)*\.?", re.UNICODE)
+
+
+def cn_check_digit(cn: str) -> int:
+    # Dígito de control del código nacional: EAN-13 del código 847000 + CN
+    digits = [int(d) for d in "847000" + cn]
+    total = sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return (10 - total % 10) % 10
+
+
+def _valid_cn(cn: str, check: Optional[str]) -> bool:
+    return check is None or int(check) == cn_check_digit(cn)
+
+
+def _tokens(query: str) -> List[Tuple[str, str]]:
+    # Palabras de la consulta como (original, normalizada)
+    return [(m.group(0).rstrip("."), fold_text(m.group(0).rstrip("."))) for m in _WORD.finditer(query)]
+
+
+def _covered(folded: str, values: List[str]) -> bool:
+    # La consulta está cubierta si, quitando los valores extraídos, solo quedan palabras de relleno
+    remaining = folded
+    for value in values:
+        remaining = remaining.replace(fold_text(value), " ")
+    words = re.findall(r"[a-z]+", remaining)
+    return all(word in _FILLER_WORDS for word in words)
+
+
+def extract_medicamento_params(query: str) -> Optional[MedicamentoQueryParams]:
+    """
+    Extrae el código nacional o el nº de registro de la consulta.
+    Devuelve None si no hay exactamente un identificador válido.
+    """
+    folded = fold_text(query)
+
+    nregistros = {m.group(1) for m in _NREGISTRO_KEYWORD.finditer(folded)}
+    cns = {m.group(1) for m in _CN_KEYWORD.finditer(folded) if _valid_cn(m.group(1), m.group(2))}
+    if not cns and not nregistros:
+        # Número de 6 dígitos sin palabra clave: solo puede ser un código nacional
+        cns = {m.group(1) for m in _CN.finditer(folded) if _valid_cn(m.group(1), m.group(2))}
+    cns -= nregistros
+
+    if len(cns) + len(nregistros) != 1:
+        return None
+    if cns:
+        return MedicamentoQueryParams(cn=cns.pop())
+    return MedicamentoQueryParams(nregistro=nregistros.pop())
+
+
+def extract_medicamentos_params(query: str) -> Optional[MedicamentosQueryParamsV2]:
+    """
+    Extrae el laboratorio de frases como "del laboratorio Cinfa" o "laboratorios Normon".
+    Las menciones a la vía de administración se aceptan, aunque no son un parámetro de búsqueda.
+    Devuelve None si la consulta contiene algo más (p. ej. el nombre de un medicamento).
+    """
+    tokens = _tokens(query)
+    laboratorio = None
+    for i, (_, folded_word) in enumerate(tokens):
+        if folded_word in ("laboratorio", "laboratorios"):
+            words = []
+            for original, folded_next in tokens[i + 1:]:
+                if folded_next in _LAB_STOP_WORDS and words:
+                    break
+                if folded_next in _LAB_STOP_WORDS:
+                    continue  # "laboratorio de ..."
+                words.append(original)
+                if len(words) == 3:
+                    break
+            if words:
+                laboratorio = " ".join(words)
+            break
+
+    if laboratorio is None or not _covered(fold_text(query), [laboratorio]):
+        return None
+    return MedicamentosQueryParamsV2(laboratorio=laboratorio)
@@ -0,0 +1,254 @@
+import argparse, os, pickle, re
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from api_calls import (
+    MaestrasQueryParams, MedicamentosQueryParams, MedicamentosQueryParamsV2, iter_maestras, iter_medicamentos,
+)
+from text_normalization import fold_text
+
+DEFAULT_GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "gazetteer.pkl")
+)
+
+# Maestras de CIMA utilizadas para construir el diccionario
+MAESTRA_PRINCIPIOS_ACTIVOS = 1
+MAESTRA_LABORATORIOS = 6
+
+# Campo de MedicamentosQueryParamsV2 que rellena cada categoría, por orden de preferencia
+# cuando dos entradas cubren exactamente el mismo texto
+CATEGORIAS = ("practiv1", "nombre", "laboratorio")
+
+# Palabras societarias que se eliminan para crear el alias corto de un laboratorio
+_LAB_WORDS = {"laboratorio", "laboratorios", "lab", "labs", "s", "a", "l", "u", "sa", "sl", "slu", "sau"}
+
+# Longitud mínima de palabra para la corrección de erratas: en palabras más cortas una errata
+# suele dejar varias palabras del diccionario a la misma distancia
+MIN_TYPO_LENGTH = 6
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class Mention(NamedTuple):
+    categoria: str
+    valor: str
+    start: int  # Posición (en palabras) de la mención en la consulta
+    end: int
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold_text(text))
+
+
+def _deletes(token: str) -> List[str]:
+    return [token[:i] + token[i + 1:] for i in range(len(token))]
+
+
+def _distance(a: str, b: str) -> int:
+    # Distancia de edición con transposición de letras contiguas (Damerau-Levenshtein restringida)
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def brand_name(nombre: str) -> str:
+    # Parte comercial del nombre de un medicamento: lo que precede a la dosis ("IBUPROFENO CINFA 600 mg ...")
+    words = []
+    for word in nombre.split():
+        if any(ch.isdigit() for ch in word) or len(words) == 4:
+            break
+        words.append(word)
+    return " ".join(words)
+
+
+class Gazetteer:
+    """
+    Diccionario de nombres de medicamentos, principios activos y laboratorios.
+    Los nombres normalizados (sin acentos ni mayúsculas, como normalize_query) se compilan en un
+    autómata Aho-Corasick sobre palabras que encuentra todas las menciones de una consulta en una
+    sola pasada. Las palabras desconocidas se corrigen si están a una errata (una letra de más,
+    de menos o cambiada) de una palabra del diccionario.
+    """
+
+    def __init__(self):
+        self.token_ids: Dict[str, int] = {}
+        self.goto: List[Dict[int, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        self.entries: List[Tuple[str, str, int]] = []  # (categoría, valor, nº de palabras)
+        self.deletes: Dict[str, List[str]] = {}
+        self._seen = set()
+
+    #================================================================================================
+    # Construcción
+    def add(self, categoria: str, nombre: str, valor: Optional[str] = None) -> None:
+        tokens = _tokenize(nombre)
+        if not tokens or (categoria, tuple(tokens)) in self._seen:
+            return
+        self._seen.add((categoria, tuple(tokens)))
+
+        node = 0
+        for token in tokens:
+            token_id = self.token_ids.setdefault(token, len(self.token_ids))
+            next_node = self.goto[node].get(token_id)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][token_id] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = next_node
+        self.output[node].append(len(self.entries))
+        self.entries.append((categoria, valor or nombre, len(tokens)))
+
+    def compile(self) -> "Gazetteer":
+        # Enlaces de fallo del autómata (recorrido en anchura)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token_id, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and token_id not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(token_id, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+        # Índice de borrados para corregir erratas (SymSpell con distancia 1)
+        self.deletes = {}
+        for token in self.token_ids:
+            if len(token) >= MIN_TYPO_LENGTH and not token.isdigit():
+                for deleted in _deletes(token):
+                    self.deletes.setdefault(deleted, []).append(token)
+        self._seen = set()
+        return self
+
+    @classmethod
+    def build(cls, principios_activos: Iterable[str], laboratorios: Iterable[str], nombres: Iterable[str]) -> "Gazetteer":
+        gazetteer = cls()
+        for nombre in principios_activos:
+            gazetteer.add("practiv1", nombre)
+        for nombre in laboratorios:
+            gazetteer.add("laboratorio", nombre)
+            alias = " ".join(w for w in nombre.split() if not set(_tokenize(w)) <= _LAB_WORDS)
+            if len(alias) >= 4 and alias != nombre:
+                gazetteer.add("laboratorio", alias, nombre)
+        for nombre in nombres:
+            brand = brand_name(nombre)
+            if brand:
+                gazetteer.add("nombre", brand)
+        return gazetteer.compile()
+
+    @classmethod
+    def build_from_cima(cls) -> "Gazetteer":
+        principios = (item.nombre for item in iter_maestras(MaestrasQueryParams(maestra=MAESTRA_PRINCIPIOS_ACTIVOS)) if item.nombre)
+        laboratorios = (item.nombre for item in iter_maestras(MaestrasQueryParams(maestra=MAESTRA_LABORATORIOS)) if item.nombre)
+        nombres = (med.nombre for med in iter_medicamentos(MedicamentosQueryParams()))
+        return cls.build(principios, laboratorios, nombres)
+
+    def save(self, path: str = DEFAULT_GAZETTEER_PATH) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_GAZETTEER_PATH) -> "Gazetteer":
+        gazetteer = cls()
+        with open(path, "rb") as f:
+            gazetteer.__dict__.update(pickle.load(f))
+        return gazetteer
+
+    #================================================================================================
+    # Búsqueda
+    def _correct(self, token: str) -> Optional[str]:
+        if len(token) < MIN_TYPO_LENGTH or token.isdigit():
+            return None
+        candidates = set(self.deletes.get(token, []))  # Falta una letra
+        for deleted in _deletes(token):
+            if deleted in self.token_ids and len(deleted) >= MIN_TYPO_LENGTH:
+                candidates.add(deleted)  # Sobra una letra
+            candidates.update(self.deletes.get(deleted, []))  # Letra cambiada
+        if not candidates:
+            return None
+        # Solo se corrige si la palabra más cercana es única; si hay empate no se adivina y
+        # la consulta sigue por el extractor con LLM
+        distances = {candidate: _distance(token, candidate) for candidate in candidates}
+        best = min(distances.values())
+        closest = [candidate for candidate, distance in distances.items() if distance == best]
+        return closest[0] if len(closest) == 1 else None
+
+    def find(self, query: str) -> List[Mention]:
+        """Devuelve las menciones de la consulta sin solapamientos, prefiriendo las más largas."""
+        mentions = []
+        state = 0
+        for i, token in enumerate(_tokenize(query)):
+            token_id = self.token_ids.get(token)
+            if token_id is None:
+                corrected = self._correct(token)
+                token_id = self.token_ids.get(corrected) if corrected else None
+            if token_id is None:
+                state = 0
+                continue
+            while state and token_id not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token_id, 0)
+            for entry_id in self.output[state]:
+                categoria, valor, length = self.entries[entry_id]
+                mentions.append(Mention(categoria, valor, i - length + 1, i + 1))
+
+        mentions.sort(key=lambda m: (m.start - m.end, CATEGORIAS.index(m.categoria), m.start))
+        selected, used = [], set()
+        for mention in mentions:
+            span = set(range(mention.start, mention.end))
+            if not span & used:
+                selected.append(mention)
+                used |= span
+        return sorted(selected, key=lambda m: m.start)
+
+    def extract_params(self, query: str) -> Optional[MedicamentosQueryParamsV2]:
+        # Primera mención de cada categoría; None si la consulta no menciona nada conocido
+        values = {}
+        for mention in self.find(query):
+            values.setdefault(mention.categoria, mention.valor)
+        if not values:
+            return None
+        return MedicamentosQueryParamsV2(**values)
+
+
+#================================================================================================
+_gazetteer = None
+
+
+def get_gazetteer(path: str = DEFAULT_GAZETTEER_PATH) -> Optional[Gazetteer]:
+    # Cargar el diccionario persistido; None si aún no se ha construido
+    global _gazetteer
+    if _gazetteer is None and os.path.exists(path):
+        _gazetteer = Gazetteer.load(path)
+    return _gazetteer
+
+
+def extract_params(query: str) -> Optional[MedicamentosQueryParamsV2]:
+    gazetteer = get_gazetteer()
+    return gazetteer.extract_params(query) if gazetteer is not None else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diccionario de nombres para la extracción de parámetros")
+    parser.add_argument("comando", choices=["build", "find"])
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--path", default=DEFAULT_GAZETTEER_PATH)
+    args = parser.parse_args()
+
+    if args.comando == "build":
+        Gazetteer.build_from_cima().save(args.path)
+        print(f"Diccionario guardado en {args.path}")
+    else:
+        print(Gazetteer.load(args.path).find(args.query))
@@ -2,105 +2,76 @@
 from api_calls import (
     MedicamentoQueryParams, get_medicamento,
     MedicamentosQueryParamsV2, get_medicamentos_v2,
+    DocSegmentadoSeccionesParams, get_doc_segmentado_secciones,
 )
 from pydantic_api_models import (
-    Medicamento, ListaMedicamentos
+    Medicamento, ListaMedicamentos, Seccion
 
 )
 from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.output_parsers import PydanticOutputParser
-from langchain.schema.runnable import RunnableBranch, RunnablePassthrough
-from langchain.schema.runnable.passthrough import RunnableAssign
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import OnlinePDFLoader
-from langchain_community.embeddings import OllamaEmbeddings
+from drug_index import DrugIndexStore, search_by_vector
+from document_ingestion import load_document, load_secciones, TIPOS_DOC_SEGMENTADO
+from section_targeting import SectionTarget, target_sections
+from fast_extractor import extract_medicamento_params, extract_medicamentos_params
+from gazetteer import extract_params as gazetteer_extract_params
+from structured_extraction import StructuredExtractor
+from answer_cache import get_answer_cache
+from tracing import Trace, activate, configure_logging, finish_trace, record_cache, record_tokens, span
+from langchain_ollama import OllamaEmbeddings
 from langchain_ollama.llms import OllamaLLM
-from typing import List
-from langchain.schema import StrOutputParser
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnableBranch
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional
+from functools import partial
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseLLM
 from langchain_core.tools import BaseTool
-import unicodedata
-import string
-
-## Definition of RExtract
-def RExtract(pydantic_class, llm, prompt):
-    '''
-    Runnable Extraction module
-    Returns a knowledge dictionary populated by slot-filling extraction
-    '''
-    parser = PydanticOutputParser(pydantic_object=pydantic_class)
-    instruct_merge = RunnableAssign({'format_instructions' : lambda x: parser.get_format_instructions()})
-    def preparse(string):
-        if '{' not in string: string = '{' + string
-        if '}' not in string: string = string + '}'
-        string = (string
-            .replace("\\_", "_")
-            .replace("\n", " ")
-            .replace("\]", "]")
-            .replace("\[", "[")
-        )
-        print(string)  ## Good for diagnostics
-        return string
-    return instruct_merge | prompt | llm | preparse | parser
+from text_normalization import estimate_tokens, fold_text
+import logging, os, string, threading, time
+import requests
 
+logger = logging.getLogger(__name__)
 
-def parameter_extractor(pydantic_class, user_query):
-    instruct_llm = OllamaLLM(model="gemma2:9b", base_url="http://ollama:11434")# "gemma2:2b" o "gemma2:9b"
+# Configuración de los modelos servidos por Ollama
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
+INSTRUCT_MODEL = os.getenv("INSTRUCT_MODEL", "gemma2:9b")
+# Modelo pequeño que atiende primero cada petición; vacío para usar siempre INSTRUCT_MODEL
+SMALL_INSTRUCT_MODEL = os.getenv("SMALL_INSTRUCT_MODEL", "gemma2:2b")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-minilm")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # Tiempo que Ollama mantiene los modelos cargados
+# Relevancia de recuperación por debajo de la cual un "no lo sé" del modelo pequeño se escala al grande
+ESCALATION_MIN_RELEVANCE = float(os.getenv("ESCALATION_MIN_RELEVANCE", "0.5"))
 
-    parser_prompt = ChatPromptTemplate.from_template(
-        "Eres un asistente virtual especializado en la búsqueda de información de medicamentos para el servicio SearchMed. "
-        "Tu objetivo es extraer información relevante de la conversación actual del usuario de manera precisa y concisa. "
-        "Debes completar el esquema con base en la información proporcionada en el mensaje del usuario, sin agregar detalles adicionales o inventar datos que no estén explícitamente mencionados."
-        "\n\n{format_instructions}"
-        "\n\nMENSAJE DEL USUARIO: {input}"
-        "\n\nCONTEXTUALIZACIÓN: Usa solo la información proporcionada para completar el esquema. No utilices datos externos ni supongas detalles no mencionados explícitamente por el usuario."
-    )
-    extractor = RExtract(
-        pydantic_class, 
-        instruct_llm, 
-        parser_prompt
-    )
+# Respuestas del modelo que indican que no ha encontrado la respuesta en el contexto
+_NO_ANSWER_MARKERS = ("no lo se", "no se la respuesta", "no tengo informacion", "no puedo responder")
 
-    knowledge = extractor.invoke({'input' : user_query})
 
-    return knowledge
+def is_no_answer(response: str) -> bool:
+    folded = fold_text(response)
+    return not folded or any(marker in folded for marker in _NO_ANSWER_MARKERS)
 
 
-def format_docs(docs):
-    return "\n\n".join(doc.page_content for doc in docs)
+class ModelTier(NamedTuple):
+    nombre: str  # "small" o "large"
+    modelo: str
+    llm: OllamaLLM
+    json_llm: OllamaLLM  # Mismo modelo con salida JSON restringida para la extracción de parámetros
+    rag_chain: Any
 
 
-def search_queries_about_drug(drug_info: ListaMedicamentos, user_query: str):
+class PipelineEngine:
     """
-    Searches for queries related to a specific drug.
-    Args:
-        drug_info (ListaMedicamentos): Information about the drug, including documents.
-        user_query (str): The user's query.
-    Returns:
-        list: URLs of the documents related to the drug.
+    Reúne los modelos, prompts y cadenas del pipeline para construirlos una sola vez por proceso.
+    Los clientes de Ollama (y sus conexiones HTTP) se comparten entre peticiones, los extractores
+    estructurados se compilan una vez por clase pydantic y warmup() precarga los modelos en Ollama
+    para que la primera consulta no pague el tiempo de carga.
+
+    Extracción y respuesta funcionan en cascada: primero responde el modelo pequeño y solo se
+    escala al grande cuando la extracción no valida o queda vacía, o cuando la respuesta es un
+    "no lo sé" con una recuperación poco relevante.
     """
-  
-    documents_urls = [doc.url for doc in drug_info.docs]
-
-    # Load only the first document for testing purposes
-    documents_urls = documents_urls[:1]
 
-    loaded_documents = []
-    for url in documents_urls:
-        doc = OnlinePDFLoader(file_path=url).load_and_split()
-        loaded_documents.extend(doc)
-        print(f"Documento cargado y dividido desde {url}")
-    
-    # Inicializar el embebido y almacenamiento vectorial
-    embedder = OllamaEmbeddings(model="all-minilm", base_url="http://ollama:11434")
-    vectorstore = Chroma("langchain_store", embedder)
-    vectorstore.add_documents(loaded_documents)
-    
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
-    prompt = ChatPromptTemplate.from_template("""
+    rag_prompt = ChatPromptTemplate.from_template("""
         Eres un asistente para tareas de respuesta a preguntas.
         Utiliza los siguientes fragmentos de contexto obtenidos para responder a la pregunta.
         Si no conoces la respuesta, simplemente di que no lo sabes.
@@ -113,18 +84,256 @@ def search_queries_about_drug(drug_info: ListaMedicamentos, user_query: str):
         Respuesta:
     """)
 
-    llm = OllamaLLM(model="gemma2:9b", base_url="http://ollama:11434")
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, instruct_model: str = INSTRUCT_MODEL,
+                 embedding_model: str = EMBEDDING_MODEL, keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 small_instruct_model: Optional[str] = SMALL_INSTRUCT_MODEL,
+                 escalation_min_relevance: float = ESCALATION_MIN_RELEVANCE,
+                 llm_factory: Optional[Callable[..., BaseLLM]] = None, embedder: Optional[Embeddings] = None):
+        # llm_factory(model=..., **opciones) y embedder permiten sustituir los clientes de Ollama (p. ej. en los benchmarks)
+        self.base_url = base_url
+        self.llm_factory = llm_factory or partial(OllamaLLM, base_url=base_url, keep_alive=keep_alive)
+        self.embedding_model = embedding_model
+        self.keep_alive = keep_alive
+        self.escalation_min_relevance = escalation_min_relevance
+
+        # Niveles de la cascada, del más barato al más caro
+        self.tiers = []
+        if small_instruct_model and small_instruct_model != instruct_model:
+            self.tiers.append(self._tier("small", small_instruct_model))
+        self.tiers.append(self._tier("large", instruct_model))
+        self.embedder = embedder or OllamaEmbeddings(model=embedding_model, base_url=base_url)
+
+        self._extractors = {}
+        self._lock = threading.Lock()
+
+    def _tier(self, nombre: str, modelo: str) -> ModelTier:
+        llm = self.llm_factory(model=modelo)
+        json_llm = self.llm_factory(model=modelo, format="json", temperature=0)
+        return ModelTier(nombre, modelo, llm, json_llm, self.rag_prompt | llm | StrOutputParser())
+
+    def extractor(self, pydantic_class, tier: ModelTier) -> StructuredExtractor:
+        # Cadena de extracción compilada una sola vez por clase pydantic y nivel
+        key = (pydantic_class, tier.nombre)
+        extractor = self._extractors.get(key)
+        if extractor is None:
+            with self._lock:
+                extractor = self._extractors.get(key)
+                if extractor is None:
+                    extractor = StructuredExtractor(pydantic_class, tier.json_llm)
+                    self._extractors[key] = extractor
+        return extractor
+
+    def extract(self, pydantic_class, user_query: str):
+        with span("llm_extraction", clase=pydantic_class.__name__) as current:
+            for tier in self.tiers:
+                last = tier is self.tiers[-1]
+                # El modelo pequeño no repite la pregunta: si falla se escala directamente
+                result = self.extractor(pydantic_class, tier).extract(user_query, reask=last)
+                if last or (not result.errors and result.knowledge.dict(exclude_none=True)):
+                    current.set(tier=tier.nombre)
+                    logger.info("Extracción atendida", extra={"clase": pydantic_class.__name__, "tier": tier.nombre, "modelo": tier.modelo})
+                    return result.knowledge
+                logger.info("Extracción escalada", extra={"clase": pydantic_class.__name__, "modelo": tier.modelo, "errores": result.errors})
+
+    def answer(self, context: str, question: str, relevance: Optional[float] = None) -> str:
+        """
+        relevance es la mayor relevancia (0-1) de los fragmentos recuperados; si es baja, un
+        "no lo sé" del modelo pequeño se reintenta con el grande.
+        """
+        with span("generation"):
+            response = "".join(self.stream_answer(context, question, relevance))
+            record_tokens("generation", estimate_tokens(context + question), estimate_tokens(response))
+            return response
+
+    def stream_answer(self, context: str, question: str, relevance: Optional[float] = None) -> Iterator[str]:
+        """
+        Versión en streaming de answer(). La escalada solo es posible con relevancia baja, así que
+        en el caso habitual los tokens del modelo pequeño se emiten según se generan; con
+        relevancia baja se espera a su respuesta completa para decidir si se escala.
+        """
+        inputs = {"context": context, "question": question}
+        for tier in self.tiers:
+            last = tier is self.tiers[-1]
+            if last or (relevance is not None and relevance >= self.escalation_min_relevance):
+                logger.info("Respuesta atendida", extra={"tier": tier.nombre, "modelo": tier.modelo, "relevancia": relevance})
+                yield from tier.rag_chain.stream(inputs)
+                return
+            response = tier.rag_chain.invoke(inputs)
+            if not self._needs_escalation(response, relevance):
+                logger.info("Respuesta atendida", extra={"tier": tier.nombre, "modelo": tier.modelo, "relevancia": relevance})
+                yield response
+                return
+            logger.info("Respuesta escalada", extra={"modelo": tier.modelo, "relevancia": relevance})
+
+    def _needs_escalation(self, response: str, relevance: Optional[float]) -> bool:
+        return is_no_answer(response) and (relevance is None or relevance < self.escalation_min_relevance)
+
+    def warmup(self) -> None:
+        # Cargar los modelos en Ollama (una petición sin prompt solo carga el modelo) y mantenerlos en memoria
+        payloads = [("/api/generate", {"model": tier.modelo, "keep_alive": self.keep_alive}) for tier in self.tiers]
+        payloads.append(("/api/embed", {"model": self.embedding_model, "input": "", "keep_alive": self.keep_alive}))
+        for endpoint, payload in payloads:
+            try:
+                requests.post(f"{self.base_url}{endpoint}", json=payload, timeout=300).raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error al precargar el modelo {payload['model']}: {e}")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> PipelineEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PipelineEngine()
+    return _engine
+
+
+def set_engine(engine: PipelineEngine) -> None:
+    # Sustituir el motor compartido (p. ej. por uno con modelos falsos para los benchmarks)
+    global _engine, _drug_index
+    with _engine_lock:
+        _engine, _drug_index = engine, None
+
 
-    rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | prompt
-    | llm
-    | StrOutputParser()
-    )
+def parameter_extractor(pydantic_class, user_query):
+    return get_engine().extract(pydantic_class, user_query)
+
+
+def format_docs(docs):
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+# Índice vectorial persistente compartido entre preguntas
+_drug_index = None
 
-    response = rag_chain.invoke({"question": user_query})
-  
-    return response
+
+def get_drug_index() -> DrugIndexStore:
+    global _drug_index
+    if _drug_index is None:
+        _drug_index = DrugIndexStore(get_engine().embedder)
+    return _drug_index
+
+
+# Nombre de cada tipo de documento para los mensajes de estado
+NOMBRES_DOCUMENTO = {1: "ficha técnica", 2: "prospecto", 3: "informe público de evaluación", 4: "plan de gestión de riesgos"}
+
+
+class StreamEvent(NamedTuple):
+    tipo: str  # "status" (etapa en curso), "token" (fragmento de la respuesta) o "sin_medicamento"
+    texto: str
+
+
+def stream_search_queries_about_drug(drug_info: ListaMedicamentos, user_query: str,
+                                     trace: Optional[Trace] = None) -> Iterator[StreamEvent]:
+    """
+    Streaming version of search_queries_about_drug.
+    Yields status events for the slow stages and the answer tokens as the model produces them.
+    The stages are recorded as spans of trace, activated only between yields because the
+    generator may be resumed from a different thread.
+    """
+    if not drug_info.docs:
+        yield StreamEvent("token", "No se han encontrado documentos asociados al medicamento.")
+        return
+
+    # Use only the first document (ficha técnica)
+    documento = drug_info.docs[0]
+
+    with activate(trace):
+        # La pregunta se embebe una sola vez: el vector sirve para la caché y para la recuperación
+        with span("embedding", consulta=True):
+            question_embedding = get_engine().embedder.embed_query(user_query)
+
+        # Seleccionar los apartados del documento relacionados con la pregunta (p. ej. embarazo -> 4.6)
+        # para descargar y embeber solo esos. Con poca confianza se usa el documento completo
+        target = SectionTarget([], 0.0)
+        if documento.secc and documento.tipo in TIPOS_DOC_SEGMENTADO:
+            def secciones_disponibles() -> Optional[List[Seccion]]:
+                # Solo se descargan si ninguna palabra clave identifica el apartado
+                secciones = get_doc_segmentado_secciones(DocSegmentadoSeccionesParams(tipoDoc=documento.tipo, nregistro=drug_info.nregistro))
+                return [Seccion(**seccion) for seccion in secciones] if isinstance(secciones, list) else None
+
+            with span("section_targeting") as current:
+                target = target_sections(user_query, documento.tipo, secciones_disponibles)
+                current.set(secciones=target.secciones, confianza=target.confianza)
+
+        # Caché semántica: una pregunta equivalente sobre los mismos apartados de la misma versión
+        # del documento ya respondida
+        answer_cache = get_answer_cache()
+        cached = None
+        if answer_cache is not None:
+            with span("answer_cache"):
+                cached = answer_cache.lookup(drug_info.nregistro, documento.tipo, documento.fecha, question_embedding, target.secciones)
+            record_cache("answer", cached is not None)
+    if cached is not None:
+        yield StreamEvent("token", cached.answer)
+        return
+
+    yield StreamEvent("status", f"Cargando {NOMBRES_DOCUMENTO.get(documento.tipo, 'documento')} de {drug_info.nombre}")
+
+    # La colección no se puede expulsar entre la ingesta y la recuperación
+    with activate(trace), get_drug_index().in_use(drug_info.nregistro, documento.tipo):
+        scored_docs = None
+        if target.secciones:
+            vectorstore = get_drug_index().get_vectorstore_secciones(
+                drug_info.nregistro, documento, target.secciones,
+                lambda apartados: load_secciones(drug_info.nregistro, documento.tipo, apartados),
+            )
+            # Si los apartados no tienen contenido se amplía la búsqueda al documento completo
+            with span("retrieval", secciones=target.secciones):
+                scored_docs = search_by_vector(
+                    vectorstore, question_embedding, k=2, filter={"apartado": {"$in": target.secciones}}
+                ) or None
+
+        if scored_docs is None:
+            # Recuperar el índice persistente del documento; solo se descarga y embebe si es nuevo o ha cambiado.
+            # El documento se construye a partir de sus secciones de docSegmentado (PDF solo si no las tiene)
+            vectorstore = get_drug_index().get_vectorstore(
+                drug_info.nregistro, documento, lambda: load_document(drug_info.nregistro, documento)
+            )
+            with span("retrieval"):
+                scored_docs = search_by_vector(vectorstore, question_embedding, k=2)
+
+    yield StreamEvent("status", "Generando respuesta")
+
+    # La relevancia de los fragmentos decide si un "no lo sé" del modelo pequeño se escala
+    context_docs = [doc for doc, _ in scored_docs]
+    relevance = max((score for _, score in scored_docs), default=None)
+    context = format_docs(context_docs)
+    tokens = []
+    start = time.perf_counter()
+    with span("generation", trace=trace, detached=True, relevancia=relevance) as current:
+        for token in get_engine().stream_answer(context, user_query, relevance):
+            if not tokens:
+                current.set(time_to_first_token=time.perf_counter() - start)
+            tokens.append(token)
+            yield StreamEvent("token", token)
+
+    response = "".join(tokens)
+    record_tokens("generation", estimate_tokens(context + user_query), estimate_tokens(response), trace)
+    if answer_cache is not None and not is_no_answer(response):
+        answer_cache.store(drug_info.nregistro, documento.tipo, documento.fecha, user_query, question_embedding, response, target.secciones)
+
+
+def search_queries_about_drug(drug_info: ListaMedicamentos, user_query: str):
+    """
+    Searches for queries related to a specific drug.
+    Args:
+        drug_info (ListaMedicamentos): Information about the drug, including documents.
+        user_query (str): The user's query.
+    Returns:
+        str: Answer generated from the drug's document.
+    """
+    events = stream_search_queries_about_drug(drug_info, user_query)
+    return "".join(event.texto for event in events if event.tipo == "token")
+
+
+def has_filters(params) -> bool:
+    # Los parámetros extraídos restringen la búsqueda (el extractor puede devolver None o todo vacío)
+    return params is not None and any(str(v).strip() for v in params.dict(exclude_none=True).values())
 
 
 class EndpointMedicamentoTool(BaseTool):
@@ -142,7 +351,13 @@ class EndpointMedicamentoTool(BaseTool):
 
     
     def _run(self, query: str) -> Medicamento:
-        knowledge = parameter_extractor(MedicamentoQueryParams, query)  # Extrae el código o registro del medicamento de la consulta
+        # Extrae el código o registro del medicamento de la consulta: por reglas si es posible y, si no, con el LLM
+        with span("parameter_extractor") as current:
+            knowledge = extract_medicamento_params(query)
+            current.set(metodo="reglas" if knowledge is not None else "llm")
+            knowledge = knowledge or parameter_extractor(MedicamentoQueryParams, query)
+        if not has_filters(knowledge):
+            return None  # Sin código ni registro no hay medicamento que consultar
         medicamento = get_medicamento(knowledge)  # Llama al servicio API de la AEMPS
         return medicamento
 
@@ -160,7 +375,18 @@ class EndpointMedicamentosTool(BaseTool):
     description = "Proporciona información detallada sobre medicamentos a partir de descripciones generales, como el nombre, la forma farmacéutica, la vía de administración u otras características, sin requerir el código nacional (CN) o número de registro."
 
     def _run(self, query: str) -> List[ListaMedicamentos]:
-        knowledge = parameter_extractor(MedicamentosQueryParamsV2, query)  # Extrae los parámetros de la consulta
+        # Extrae los parámetros de la consulta: por reglas, con el diccionario de nombres y, si no, con el LLM
+        with span("parameter_extractor") as current:
+            knowledge, metodo = extract_medicamentos_params(query), "reglas"
+            if knowledge is None:
+                knowledge, metodo = gazetteer_extract_params(query), "diccionario"
+            if knowledge is None:
+                knowledge, metodo = parameter_extractor(MedicamentosQueryParamsV2, query), "llm"
+            current.set(metodo=metodo)
+        if not has_filters(knowledge):
+            # Sin ningún filtro CIMA devolvería el catálogo entero y se respondería sobre un
+            # medicamento cualquiera (charla, preguntas ajenas): mejor indicar que no hay medicamento
+            return []
         medicamentos = get_medicamentos_v2(knowledge)  # Llama al servicio API de la AEMPS
         return medicamentos
 
@@ -172,7 +398,7 @@ class EndpointMedicamentosTool(BaseTool):
 def normalize_query(query: str) -> str:
     
     # Eliminar acentos y convertir a minúsculas
-    query = unicodedata.normalize('NFKD', query).encode('ascii', 'ignore').decode('utf-8').lower()
+    query = fold_text(query)
     # Eliminar puntuación y espacios
     query = query.translate(str.maketrans('', '', string.punctuation)).replace(" ", "")
     return query
@@ -190,21 +416,46 @@ def route(info):
         return EndpointMedicamentosTool()
 
 
-def answer_question(user_query: str) -> str:
-    # Crear la cadena principal utilizando RunnableLambda para enrutamiento
-    full_chain = {"query": lambda x: x["query"]} | RunnableLambda(route)
-    response = full_chain.invoke({"query": user_query}) # Response es un objeto Pydantic con las respuestas de la AEMPS
+def stream_answer_question(user_query: str) -> Iterator[StreamEvent]:
+    """
+    Versión en streaming de answer_question: emite el estado de cada etapa y los tokens de la
+    respuesta según se generan. Si no se encuentra ningún medicamento emite "sin_medicamento".
+    """
+    trace = Trace("answer")
+    trace.attrs["query"] = user_query
+    try:
+        yield StreamEvent("status", "Buscando medicamento")
 
-    if isinstance(response, list):
-        medicamento = response[0]
-    else:
-        medicamento = response
+        with activate(trace), span("route"):
+            # Crear la cadena principal utilizando RunnableLambda para enrutamiento
+            full_chain = {"query": lambda x: x["query"]} | RunnableLambda(route)
+            response = full_chain.invoke({"query": user_query}) # Response es un objeto Pydantic con las respuestas de la AEMPS
 
-    answer_question = search_queries_about_drug(medicamento, user_query)
+        if isinstance(response, list):
+            medicamento = response[0] if response else None
+        else:
+            medicamento = response
+
+        if medicamento is None:
+            yield StreamEvent("sin_medicamento", "No se ha encontrado ningún medicamento que coincida con la consulta.")
+            return
+
+        trace.attrs["nregistro"] = medicamento.nregistro
+        yield from stream_search_queries_about_drug(medicamento, user_query, trace)
+    finally:
+        finish_trace(trace)
+
+
+def answer_question(user_query: str) -> str:
+    answer_question = ""
+    for event in stream_answer_question(user_query):
+        if event.tipo in ("token", "sin_medicamento"):
+            answer_question += event.texto
     return answer_question
 
 if __name__ == "__main__":
-    
+    configure_logging()
+    get_engine().warmup()
     print(answer_question("Quiero obtener información general sobre el medicamento con código nacional 726684"))
     print(answer_question("¿Es el medicamento con codigo nacional 726684 apto para mujeres embarazadas?"))
     print(answer_question("¿Qué reacciones adversas puede tener la aspirina?"))
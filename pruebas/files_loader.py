@@ -1,34 +1,50 @@
-
 from lxml import etree
-import json
+import argparse, glob, json, os
+from typing import Any, Dict, Iterator, List
 
-# Cargar y parsear el archivo XML
-archivo_xml = '/app/docs/bbdd_completa_con_nomenclator_de_prescripcion/DICCIONARIO_ATC.xml'
-tree = etree.parse(archivo_xml)
-root = tree.getroot()
+# Carga en streaming de los diccionarios XML del nomenclátor de prescripción (ATC, principios
+# activos, formas farmacéuticas...). Cada fichero es una raíz con un elemento hijo por entrada;
+# con iterparse se convierte cada entrada a un diccionario en cuanto se cierra y después se
+# libera, de modo que la memoria no crece con el tamaño del fichero. Los registros se escriben
+# por lotes en un JSONL por diccionario.
+#
+#   python pruebas/files_loader.py /app/docs/bbdd_completa_con_nomenclator_de_prescripcion --salida /app/docs/jsonl
 
+DIRECTORIO_NOMENCLATOR = '/app/docs/bbdd_completa_con_nomenclator_de_prescripcion'
+TAMANIO_LOTE = 1000
+
+
+def _tag(element) -> str:
+    # Quitar el espacio de nombres: {http://schemas.aemps.es/...}codigoatc -> codigoatc
+    return etree.QName(element).localname
+
+
+# Función recursiva para convertir un elemento XML (una entrada, no el fichero completo) en un diccionario
+def xml_to_dict(element) -> Any:
+    result: Dict[str, Any] = {}
 
-#
-# Función recursiva para convertir el XML en un diccionario
-def xml_to_dict(element):
-    result = {}
-    
     # Si el elemento tiene hijos, recorremos los hijos y los convertimos a diccionario
-    if len(element):
-        for child in element:
-            child_result = xml_to_dict(child)
-            # Si el tag ya existe en el diccionario, lo convertimos en una lista
-            if child.tag in result:
-                if isinstance(result[child.tag], list):
-                    result[child.tag].append(child_result)
-                else:
-                    result[child.tag] = [result[child.tag], child_result]
+    for child in element:
+        if not isinstance(child.tag, str):  # Comentarios e instrucciones de procesamiento
+            continue
+        tag = _tag(child)
+        child_result = xml_to_dict(child)
+        # Si el tag ya existe en el diccionario, lo convertimos en una lista
+        if tag in result:
+            if isinstance(result[tag], list):
+                result[tag].append(child_result)
             else:
-                result[child.tag] = child_result
-    # Si no tiene hijos, guardamos los atributos y el texto
-    else:
-        result = element.text if element.text is not None else ''
-    
+                result[tag] = [result[tag], child_result]
+        else:
+            result[tag] = child_result
+
+    # Si no tiene hijos, el valor es el texto (o un diccionario con el texto si hay atributos)
+    if not result:
+        text = element.text.strip() if element.text is not None else ''
+        if not element.attrib:
+            return text
+        result['#text'] = text
+
     # Agregar atributos si los tiene, convirtiéndolos explícitamente a un diccionario estándar
     if element.attrib:
         result['@attributes'] = dict(element.attrib)
@@ -36,11 +52,66 @@ def xml_to_dict(element):
     return result
 
 
-# Convertir el árbol XML en un diccionario
-xml_dict = xml_to_dict(root)
+def iter_registros(archivo_xml: str) -> Iterator[Dict[str, Any]]:
+    """Devuelve una a una las entradas (hijos directos de la raíz) de un fichero XML como diccionarios."""
+    profundidad = 0
+    for evento, element in etree.iterparse(archivo_xml, events=('start', 'end'), huge_tree=True):
+        if evento == 'start':
+            profundidad += 1
+            continue
+        profundidad -= 1
+        if profundidad != 1 or not isinstance(element.tag, str):
+            continue
+
+        yield xml_to_dict(element)
+
+        # Liberar la entrada y las anteriores, que la raíz sigue referenciando
+        element.clear(keep_tail=False)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def iter_lotes(registros: Iterator[Dict[str, Any]], tamanio: int = TAMANIO_LOTE) -> Iterator[List[Dict[str, Any]]]:
+    lote = []
+    for registro in registros:
+        lote.append(registro)
+        if len(lote) >= tamanio:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def xml_to_jsonl(archivo_xml: str, archivo_jsonl: str, tamanio_lote: int = TAMANIO_LOTE) -> int:
+    # Escribe las entradas como JSONL (una por línea) y devuelve cuántas se han escrito.
+    # Se escribe en un fichero temporal para no dejar un JSONL a medias si la carga falla
+    total = 0
+    tmp = f"{archivo_jsonl}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for lote in iter_lotes(iter_registros(archivo_xml), tamanio_lote):
+            f.writelines(json.dumps(registro, ensure_ascii=False) + '\n' for registro in lote)
+            total += len(lote)
+    os.replace(tmp, archivo_jsonl)
+    return total
+
+
+def cargar_directorio(directorio: str, salida: str, patron: str = 'DICCIONARIO_*.xml', tamanio_lote: int = TAMANIO_LOTE) -> Dict[str, int]:
+    # Convierte a JSONL todos los diccionarios del directorio: <salida>/<NOMBRE>.jsonl
+    os.makedirs(salida, exist_ok=True)
+    totales = {}
+    for archivo_xml in sorted(glob.glob(os.path.join(directorio, patron))):
+        nombre = os.path.splitext(os.path.basename(archivo_xml))[0]
+        totales[nombre] = xml_to_jsonl(archivo_xml, os.path.join(salida, f"{nombre}.jsonl"), tamanio_lote)
+        print(f"{nombre}: {totales[nombre]} registros")
+    return totales
+
 
-# Convertir el diccionario a JSON
-json_data = json.dumps(xml_dict, indent=4, ensure_ascii=False)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convierte los diccionarios XML del nomenclátor a JSONL en streaming")
+    parser.add_argument('directorio', nargs='?', default=DIRECTORIO_NOMENCLATOR)
+    parser.add_argument('--salida', default=None, help="Directorio de los JSONL (por defecto <directorio>/jsonl)")
+    parser.add_argument('--patron', default='DICCIONARIO_*.xml', help="Ficheros a convertir (p. ej. '*.xml' para incluir Prescripcion.xml)")
+    parser.add_argument('--lote', type=int, default=TAMANIO_LOTE)
+    args = parser.parse_args()
 
-# Visualizar el JSON
-print(json_data)
+    cargar_directorio(args.directorio, args.salida or os.path.join(args.directorio, 'jsonl'), args.patron, args.lote)
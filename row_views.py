@@ -0,0 +1,124 @@
+import copy, json, typing
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type, Union
+from typing_extensions import NotRequired, Required, TypedDict
+from pydantic import ConfigDict, TypeAdapter
+from langchain.pydantic_v1 import BaseModel as BaseModelV1
+from fast_decoding import CompatModel, espejo, traducir_tipo
+from tracing import span
+
+# Vistas perezosas sobre los resultados de los endpoints de listado de CIMA (/medicamentos,
+# /presentaciones, buscarEnFichaTecnica). La mayoría de consumidores solo leen unos pocos campos
+# (nregistro, nombre, docs) del primer resultado, así que en lugar de validar cada fila completa:
+#   - los bytes de la página se validan con validate_json (núcleo de pydantic v2, sin json.loads)
+#     contra un TypedDict por modelo que comprueba los campos simples (obligatorios y tipos, igual
+#     que el espejo de fast_decoding) y deja los anidados como JSON sin validar;
+#   - los anidados (estado, docs, fotos, Items...) se validan con pydantic la primera vez que se
+#     leen y se guardan en la fila;
+#   - to_model() valida la fila completa y devuelve el objeto pydantic (espejo de fast_decoding).
+# Las vistas exponen los mismos atributos que el modelo, además de .dict() y .json().
+
+
+class RowView:
+    __slots__ = ("_raw", "_anidados")
+    _modelo: Type[BaseModelV1]  # Lo fija cada subclase generada por view_class
+
+    def __init__(self, raw: Dict[str, Any]):
+        self._raw = raw
+        self._anidados: Optional[Dict[str, Any]] = None  # Campos anidados ya materializados
+
+    def to_model(self) -> CompatModel:
+        """Valida la fila completa y devuelve el objeto pydantic equivalente."""
+        return espejo(self._modelo).model_validate(self._raw)
+
+    def dict(self, **kwargs) -> Dict[str, Any]:
+        return self.to_model().dict(**kwargs)
+
+    def json(self, **kwargs) -> str:
+        return self.to_model().json(**kwargs)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._raw!r})"
+
+
+class _Campo:
+    # Campo simple: se devuelve el valor del JSON tal cual
+    __slots__ = ("nombre", "default")
+
+    def __init__(self, nombre: str, default: Any):
+        self.nombre = nombre
+        self.default = default
+
+    def __get__(self, row: Optional[RowView], owner: type) -> Any:
+        if row is None:
+            return self
+        return row._raw.get(self.nombre, self.default)
+
+
+class _CampoAnidado:
+    # Campo con modelos anidados: se valida en el primer acceso y se guarda en la fila
+    __slots__ = ("nombre", "default", "adaptador")
+
+    def __init__(self, nombre: str, default: Any, adaptador: TypeAdapter):
+        self.nombre = nombre
+        self.default = default
+        self.adaptador = adaptador
+
+    def __get__(self, row: Optional[RowView], owner: type) -> Any:
+        if row is None:
+            return self
+        anidados = row._anidados
+        if anidados is None:
+            anidados = row._anidados = {}
+        if self.nombre not in anidados:
+            valor = row._raw.get(self.nombre)
+            anidados[self.nombre] = copy.copy(self.default) if valor is None else self.adaptador.validate_python(valor)
+        return anidados[self.nombre]
+
+
+@lru_cache(maxsize=None)
+def view_class(modelo: Type[BaseModelV1]) -> Type[RowView]:
+    """Devuelve (y memoiza) la clase de vista para un modelo de pydantic_api_models."""
+    atributos: Dict[str, Any] = {"__slots__": (), "_modelo": modelo, "__doc__": modelo.__doc__}
+    for nombre, field in modelo.__fields__.items():
+        default = None if field.required else field.default
+        anotacion = traducir_tipo(field.annotation)
+        if anotacion != field.annotation:
+            atributos[nombre] = _CampoAnidado(nombre, default, TypeAdapter(Optional[anotacion]))
+        else:
+            atributos[nombre] = _Campo(nombre, default)
+    return type(f"{modelo.__name__}View", (RowView,), atributos)
+
+
+@lru_cache(maxsize=None)
+def _adaptador_pagina(modelo: Type[BaseModelV1]) -> TypeAdapter:
+    # Página de CIMA cuyas filas son dicts con los campos simples validados y los anidados sin validar
+    campos = {}
+    for nombre, field in modelo.__fields__.items():
+        anotacion = field.annotation
+        if traducir_tipo(anotacion) != anotacion:
+            anotacion = Any  # Anidado: lo valida _CampoAnidado al leerlo
+        elif field.allow_none and type(None) not in typing.get_args(anotacion):
+            anotacion = Optional[anotacion]
+        campos[nombre] = Required[anotacion] if field.required else NotRequired[anotacion]
+    fila = TypedDict(f"Fila{modelo.__name__}", campos)
+    fila.__pydantic_config__ = ConfigDict(coerce_numbers_to_str=True)
+    pagina = TypedDict(f"PaginaFilas{modelo.__name__}", {"resultados": NotRequired[Optional[List[fila]]]})
+    return TypeAdapter(pagina)
+
+
+def decode_views(data: Union[str, bytes], modelo: Type[BaseModelV1]) -> List[RowView]:
+    """Decodifica los "resultados" de una página de CIMA como vistas perezosas del modelo indicado."""
+    with span("decoding", modelo=modelo.__name__, vistas=True) as current:
+        # pydantic.ValidationError (ValueError) si el cuerpo está vacío, no es JSON o le faltan campos
+        resultados = _adaptador_pagina(modelo).validate_json(data).get("resultados") or []
+        cls = view_class(modelo)
+        current.set(resultados=len(resultados))
+        return [cls(raw) for raw in resultados]
+
+
+def views_from_rows(rows: List[Union[str, bytes]], modelo: Type[BaseModelV1]) -> List[RowView]:
+    # Vistas a partir de objetos JSON sueltos ya validados al guardarlos (p. ej. las filas de la
+    # réplica local, serializadas desde el modelo): basta con json.loads
+    cls = view_class(modelo)
+    return [cls(json.loads(row)) for row in rows]
@@ -0,0 +1,108 @@
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+from pydantic_api_models import Seccion
+from text_normalization import fold_text
+
+# Palabras clave (sin acentos, en minúsculas) que identifican los apartados de la ficha técnica
+FICHA_TECNICA_KEYWORDS: Dict[str, List[str]] = {
+    "2": ["composicion", "cuanto contiene", "que contiene"],
+    "4.1": ["indicacion", "indicado", "para que sirve", "para que se usa", "para que se utiliza", "para que es"],
+    "4.2": ["posologia", "dosis", "dosific", "cuanto tomar", "como tomar", "como se toma", "cada cuantas horas", "cuantas veces"],
+    "4.3": ["contraindica", "no debe tomar", "no puede tomar", "alergi"],
+    "4.4": ["advertencia", "precaucion"],
+    "4.5": ["interaccion", "junto con", "alcohol", "combinar", "mezclar"],
+    "4.6": ["embaraz", "gestacion", "lactancia", "amamant", "fertilidad"],
+    "4.7": ["conducir", "conduccion", "maquina"],
+    "4.8": ["reacciones adversas", "reaccion adversa", "efectos secundarios", "efecto secundario", "efectos adversos", "efecto adverso"],
+    "4.9": ["sobredosis", "intoxicacion"],
+    "5.1": ["mecanismo de accion", "farmacodinam"],
+    "5.2": ["farmacocinet", "semivida", "vida media", "absorcion", "metaboli"],
+    "6.1": ["excipiente", "lactosa", "gluten"],
+    "6.3": ["caducidad", "caduca"],
+    "6.4": ["conservacion", "conservar", "nevera", "temperatura"],
+}
+
+# Las palabras clave son raíces: se buscan al principio de palabra ("dosis" no coincide con "sobredosis")
+_KEYWORD_PATTERNS = {
+    seccion: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + ")")
+    for seccion, keywords in FICHA_TECNICA_KEYWORDS.items()
+}
+
+# Equivalencia entre apartados de la ficha técnica y del prospecto
+FICHA_TECNICA_A_PROSPECTO: Dict[str, str] = {
+    "2": "6", "4.1": "1", "4.2": "3", "4.3": "2", "4.4": "2", "4.5": "2", "4.6": "2",
+    "4.7": "2", "4.8": "4", "4.9": "3", "6.1": "6", "6.3": "5", "6.4": "5",
+}
+
+# Palabras que no aportan información al comparar la pregunta con los títulos de sección
+STOPWORDS = {
+    "para", "como", "cual", "cuales", "cuando", "donde", "puede", "puedo", "pueden", "tiene",
+    "tengo", "sobre", "este", "esta", "estos", "medicamento", "medicamentos", "tomar", "quiero",
+    "saber", "informacion", "entre", "desde", "hasta", "codigo", "nacional", "registro",
+}
+
+# Confianza mínima para limitar la búsqueda a las secciones seleccionadas
+DEFAULT_MIN_CONFIDENCE = 0.6
+# Confianza que se pierde por cada apartado adicional activado por palabras clave: con tres o más
+# apartados la pregunta es poco específica y se busca en el documento completo
+PENALIZACION_POR_SECCION = 0.25
+
+
+class SectionTarget(NamedTuple):
+    secciones: List[str]  # Apartados seleccionados (vacío = documento completo)
+    confianza: float
+
+
+def apartado(seccion: str) -> str:
+    # Apartado de primer o segundo nivel al que pertenece una sección ("4.6.1" -> "4.6")
+    return ".".join(seccion.split(".")[:2])
+
+
+def _stems(text: str) -> set:
+    # Raíces aproximadas: las cinco primeras letras de cada palabra significativa
+    words = re.findall(r"[a-z]+", fold_text(text))
+    return {word[:5] for word in words if len(word) >= 4 and word not in STOPWORDS}
+
+
+def target_sections(user_query: str, tipo: Optional[int] = 1,
+                    secciones_disponibles: Union[List[Seccion], Callable[[], Optional[List[Seccion]]], None] = None,
+                    min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> SectionTarget:
+    """
+    Selecciona los apartados del documento que probablemente responden a la pregunta.
+    Primero busca palabras clave conocidas (p. ej. "embarazo" -> 4.6) y, si no hay ninguna,
+    compara la pregunta con los títulos de las secciones disponibles. secciones_disponibles
+    puede ser una función que las descargue: solo se llama si hace falta comparar títulos.
+    Si la confianza no alcanza min_confidence devuelve una lista vacía para buscar en el
+    documento completo.
+    """
+    query = fold_text(user_query)
+    secciones = [seccion for seccion, pattern in _KEYWORD_PATTERNS.items() if pattern.search(query)]
+    if secciones:
+        if tipo == 2:
+            secciones = list(dict.fromkeys(FICHA_TECNICA_A_PROSPECTO[s] for s in secciones if s in FICHA_TECNICA_A_PROSPECTO))
+        # Cuantas más secciones distintas se activan, menos específica es la pregunta
+        confianza = max(0.0, min(1.0, 1.0 - PENALIZACION_POR_SECCION * (len(secciones) - 1)))
+        return SectionTarget(secciones, confianza) if confianza >= min_confidence else SectionTarget([], confianza)
+
+    # Sin palabras clave: comparar con los títulos de las secciones del documento
+    query_stems = _stems(user_query)
+    if query_stems and callable(secciones_disponibles):
+        secciones_disponibles = secciones_disponibles()
+    if not query_stems or not secciones_disponibles:
+        return SectionTarget([], 0.0)
+    scores = {}
+    for seccion in secciones_disponibles:
+        if not seccion.seccion or not seccion.titulo:
+            continue
+        hits = len(query_stems & _stems(seccion.titulo))
+        if hits:
+            key = apartado(seccion.seccion)
+            scores[key] = max(scores.get(key, 0), hits)
+    if not scores:
+        return SectionTarget([], 0.0)
+
+    best = max(scores.values())
+    confianza = min(1.0, 0.4 * best)
+    if confianza < min_confidence:
+        return SectionTarget([], confianza)
+    return SectionTarget([s for s, hits in scores.items() if hits == best], confianza)
@@ -0,0 +1,195 @@
+import asyncio, logging, os
+import anyio
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool
+from api_calls import MedicamentoQueryParams, MedicamentosQueryParamsV2, sincronizar_cache
+from async_api_calls import AsyncCimaClient
+from cima_mirror import activar_mirror_desde_entorno
+from fast_extractor import extract_medicamentos_params
+from gazetteer import extract_params as gazetteer_extract_params
+from param_extractor import get_engine, parameter_extractor, stream_answer_question
+from tracing import configure_logging, render_prometheus
+
+# Servicio HTTP del pipeline. Pensado para ejecutarse con varios workers de uvicorn detrás de un
+# balanceador: cada worker limita por su cuenta las peticiones simultáneas hacia Ollama y rechaza
+# con 429 las que no caben en su cola, para que el balanceador pueda reintentar en otro worker.
+#
+#   uvicorn server:app --host 0.0.0.0 --port 9012 --workers 4
+
+# Peticiones que usan el LLM a la vez por worker, y cuántas más pueden esperar turno
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "16"))
+RETRY_AFTER_SECONDS = os.getenv("RETRY_AFTER_SECONDS", "5")
+# Cada cuánto (s) se aplican a la caché de CIMA los cambios publicados en registroCambios; 0 lo desactiva
+CIMA_SYNC_INTERVAL = int(os.getenv("CIMA_SYNC_INTERVAL", str(6 * 60 * 60)))
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaLimiter:
+    """
+    Semáforo con cola acotada hacia Ollama. reserve() reserva sitio de forma síncrona (o lanza
+    un 429 si la cola está llena) y el contexto devuelto espera turno y lo libera al salir.
+    """
+
+    def __init__(self, max_concurrency: int = OLLAMA_MAX_CONCURRENCY, max_queue: int = OLLAMA_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.pending = 0  # Peticiones en curso o esperando turno
+
+    def reserve(self) -> "OllamaSlot":
+        if self.pending >= self.max_concurrency + self.max_queue:
+            raise HTTPException(
+                status_code=429, detail="Servicio saturado, inténtelo de nuevo más tarde",
+                headers={"Retry-After": RETRY_AFTER_SECONDS},
+            )
+        self.pending += 1
+        return OllamaSlot(self)
+
+
+class OllamaSlot:
+    """
+    Reserva de un sitio en el limitador. release() es idempotente: se llama al salir del
+    contexto y, además, como tarea de fondo de la respuesta, para que la reserva se libere
+    aunque el cliente se desconecte antes de que empiece el streaming.
+    """
+
+    def __init__(self, limiter: OllamaLimiter):
+        self.limiter = limiter
+        self.acquired = False  # Tiene el semáforo
+        self.released = False
+
+    async def __aenter__(self):
+        try:
+            await self.limiter.semaphore.acquire()
+        except BaseException:
+            self.release()
+            raise
+        self.acquired = True
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        if self.acquired:
+            self.limiter.semaphore.release()
+        self.limiter.pending -= 1
+
+
+class AnswerRequest(BaseModel):
+    query: str
+
+
+def sincronizar(mirror=None) -> Optional[int]:
+    # Con la réplica cargada se aplican los cambios de CIMA (lo que ya invalida la caché); la carga
+    # completa no se lanza desde el servidor (python cima_mirror.py full-sync)
+    if mirror is not None and mirror.sincronizada():
+        return mirror.sync_incremental()
+    return sincronizar_cache()
+
+
+async def sincronizar_periodicamente(intervalo: float, mirror=None) -> None:
+    # Invalidar los medicamentos modificados en CIMA al arrancar y después cada intervalo segundos
+    while True:
+        try:
+            await run_in_threadpool(sincronizar, mirror)
+        except Exception:
+            logger.exception("Error al sincronizar la caché de CIMA")
+        await asyncio.sleep(intervalo)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    app.state.cima = AsyncCimaClient()
+    app.state.limiter = OllamaLimiter()
+    # Réplica local del catálogo, solo si se indica CIMA_MIRROR_PATH
+    mirror = activar_mirror_desde_entorno()
+    sincronizacion = asyncio.create_task(sincronizar_periodicamente(CIMA_SYNC_INTERVAL, mirror)) if CIMA_SYNC_INTERVAL > 0 else None
+    await run_in_threadpool(get_engine().warmup)
+    yield
+    if sincronizacion is not None:
+        sincronizacion.cancel()
+    await app.state.cima.aclose()
+
+
+app = FastAPI(title="SearchMed", lifespan=lifespan)
+
+
+@app.post("/answer")
+async def answer(request: AnswerRequest):
+    """Responde a una pregunta sobre un medicamento en streaming (SSE): eventos status, token y sin_medicamento."""
+    slot = app.state.limiter.reserve()  # 429 antes de empezar la respuesta si la cola está llena
+
+    async def events():
+        async with slot:
+            # El pipeline es síncrono: cada paso del generador se ejecuta en el threadpool.
+            # Si el cliente se desconecta se cierra el generador para que termine su traza
+            stream = stream_answer_question(request.query)
+            try:
+                async for event in iterate_in_threadpool(stream):
+                    yield {"event": event.tipo, "data": event.texto}
+            finally:
+                # Protegido de la cancelación: tras una desconexión cualquier await se cancelaría
+                with anyio.CancelScope(shield=True):
+                    await run_in_threadpool(stream.close)
+        yield {"event": "end", "data": ""}
+
+    # Si events() no llega a ejecutarse (desconexión previa al streaming), la reserva se libera aquí
+    return EventSourceResponse(events(), background=BackgroundTask(slot.release))
+
+
+@app.get("/medicamento/{cn}")
+async def medicamento(cn: str):
+    medicamento = await app.state.cima.get_medicamento(MedicamentoQueryParams(cn=cn))
+    if medicamento is None:
+        raise HTTPException(status_code=404, detail=f"No se ha encontrado el medicamento con código nacional {cn}")
+    return medicamento.dict()
+
+
+@app.get("/search")
+async def search(q: Optional[str] = Query(None, description="Consulta en lenguaje natural"),
+                 nombre: Optional[str] = None, laboratorio: Optional[str] = None, practiv1: Optional[str] = None):
+    """Búsqueda de medicamentos por parámetros explícitos o a partir de una consulta en lenguaje natural."""
+    params = MedicamentosQueryParamsV2(
+        **{k: v for k, v in {"nombre": nombre, "laboratorio": laboratorio, "practiv1": practiv1}.items() if v}
+    )
+    if q and not params.dict(exclude_none=True):
+        # Reglas y diccionario de nombres primero; el LLM solo si no bastan
+        params = extract_medicamentos_params(q) or gazetteer_extract_params(q)
+        if params is None:
+            async with app.state.limiter.reserve():
+                params = await run_in_threadpool(parameter_extractor, MedicamentosQueryParamsV2, q)
+    if not params.dict(exclude_none=True):
+        raise HTTPException(status_code=400, detail="Indique una consulta (q) o algún parámetro de búsqueda")
+
+    medicamentos = await app.state.cima.get_medicamentos_v2(params)
+    if medicamentos is None:
+        raise HTTPException(status_code=502, detail="Error al hacer la consulta a la API de CIMA")
+    return [medicamento.dict() for medicamento in medicamentos]
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Histogramas de latencia por etapa y contadores de caché y tokens (formato de texto de Prometheus)
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        "server:app", host="0.0.0.0", port=int(os.getenv("SERVER_PORT", "9012")),
+        workers=int(os.getenv("SERVER_WORKERS", "1")),
+    )
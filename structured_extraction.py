@@ -0,0 +1,127 @@
+import json
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from langchain_core.language_models import BaseLLM
+from langchain_core.prompts import ChatPromptTemplate
+from text_normalization import estimate_tokens
+from tracing import record_tokens
+
+# Extracción estructurada con salida JSON restringida.
+# En lugar de las instrucciones de formato completas de PydanticOutputParser (el esquema JSON con
+# todas las descripciones), el prompt incluye una lista mínima de campos y se pide a Ollama que
+# genere JSON válido (format="json"). La respuesta se valida campo a campo: los campos correctos
+# se conservan y, si alguno falla, se vuelve a preguntar una sola vez indicando solo esos campos.
+
+EXTRACTION_PROMPT = ChatPromptTemplate.from_template(
+    "Extrae de la consulta del usuario los parámetros de búsqueda de medicamentos del servicio SearchMed. "
+    "Usa solo la información que aparece explícitamente en la consulta, sin suponer ni inventar datos."
+    "\n\nResponde únicamente con un objeto JSON con estos campos (omite los que no aparezcan):\n{schema}"
+    "\n\nCONSULTA: {input}"
+)
+
+REASK_PROMPT = ChatPromptTemplate.from_template(
+    "Extrae de la consulta del usuario los parámetros de búsqueda de medicamentos del servicio SearchMed. "
+    "Usa solo la información que aparece explícitamente en la consulta, sin suponer ni inventar datos."
+    "\n\nResponde únicamente con un objeto JSON con estos campos (omite los que no aparezcan):\n{schema}"
+    "\n\nCONSULTA: {input}"
+    "\n\nTu respuesta anterior fue: {previous}"
+    "\nCorrige estos errores y devuelve el objeto JSON completo:\n{errors}"
+)
+
+_TYPE_NAMES = {str: "texto", int: "entero", float: "número", bool: "true/false"}
+
+
+class ExtractionResult(NamedTuple):
+    knowledge: Any  # Instancia de la clase pydantic con los campos válidos
+    errors: Dict[str, str]  # Campos que siguen siendo inválidos tras la re-pregunta
+
+
+@lru_cache(maxsize=None)
+def compact_schema(pydantic_class) -> str:
+    """Lista mínima de campos ("- nombre (texto): descripción") de una clase pydantic."""
+    lines = []
+    for name, field in pydantic_class.__fields__.items():
+        tipo = _TYPE_NAMES.get(field.type_, "texto")
+        # Descripción en una sola línea, sin la sangría de las descripciones multilínea
+        description = " ".join((field.field_info.description or "").split())
+        lines.append(f"- {name} ({tipo}): {description}" if description else f"- {name} ({tipo})")
+    return "\n".join(lines)
+
+
+def validate_fields(pydantic_class, data: Any) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Valida cada campo por separado. Devuelve los valores válidos y los errores por campo;
+    los campos desconocidos y los valores vacíos se ignoran.
+    """
+    if not isinstance(data, dict):
+        return {}, {"__root__": "la respuesta debe ser un objeto JSON"}
+    values, errors = {}, {}
+    for name, raw in data.items():
+        field = pydantic_class.__fields__.get(name)
+        if field is None or raw is None or raw == "" or raw == []:
+            continue
+        value, error = field.validate(raw, values, loc=name, cls=pydantic_class)
+        if error:
+            errors[name] = f"se esperaba {_TYPE_NAMES.get(field.type_, 'texto')}, no {json.dumps(raw, ensure_ascii=False)}"
+        else:
+            values[name] = value
+    return values, errors
+
+
+def parse_json(text: str) -> Tuple[Optional[Any], Optional[str]]:
+    try:
+        return json.loads(text), None
+    except json.JSONDecodeError as e:
+        # format="json" garantiza JSON salvo que la generación se corte: recuperar el último objeto cerrado
+        end = text.rfind("}")
+        if end != -1:
+            try:
+                return json.loads(text[text.find("{"):end + 1]), None
+            except json.JSONDecodeError:
+                pass
+        return None, f"JSON inválido ({e.msg})"
+
+
+class StructuredExtractor:
+    """
+    Extractor de parámetros para una clase pydantic con un LLM configurado con format="json".
+    El esquema compacto se calcula una sola vez por clase.
+    """
+
+    def __init__(self, pydantic_class, llm: BaseLLM, prompt: ChatPromptTemplate = EXTRACTION_PROMPT,
+                 reask_prompt: ChatPromptTemplate = REASK_PROMPT):
+        self.pydantic_class = pydantic_class
+        self.schema = compact_schema(pydantic_class)
+        self.chain = prompt | llm
+        self.reask_chain = reask_prompt | llm
+
+    def _invoke(self, chain, inputs: Dict[str, str]) -> str:
+        output = chain.invoke(inputs)
+        record_tokens("parameter_extractor", estimate_tokens("".join(inputs.values())), estimate_tokens(output))
+        return output
+
+    def _parse(self, text: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        data, error = parse_json(text)
+        if error:
+            return {}, {"__root__": error}
+        return validate_fields(self.pydantic_class, data)
+
+    def extract(self, user_query: str, reask: bool = True) -> ExtractionResult:
+        output = self._invoke(self.chain, {"schema": self.schema, "input": user_query})
+        values, errors = self._parse(output)
+
+        if errors and reask:
+            # Una única re-pregunta indicando solo los campos erróneos
+            errors_text = "\n".join(f"- {name}: {error}" for name, error in errors.items())
+            output = self._invoke(
+                self.reask_chain, {"schema": self.schema, "input": user_query, "previous": output, "errors": errors_text}
+            )
+            retry_values, errors = self._parse(output)
+            # Los campos ya validados se mantienen; la re-pregunta solo completa o corrige
+            values = {**values, **retry_values}
+            errors = {name: error for name, error in errors.items() if name not in values}
+
+        return ExtractionResult(self.pydantic_class(**values), errors)
+
+    def invoke(self, inputs: Dict[str, str]):
+        return self.extract(inputs["input"]).knowledge
@@ -0,0 +1,83 @@
+import sqlite3
+
+from answer_cache import SemanticAnswerCache, get_answer_cache, tune_threshold
+
+
+def _cache(tmp_path, **kwargs):
+    return SemanticAnswerCache(str(tmp_path / "answers.sqlite"), threshold=0.97, **kwargs)
+
+
+def test_reutiliza_solo_en_los_mismos_apartados(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("62917", 1, 10, "¿Puedo tomarlo embarazada?", [1.0, 0.0], "No se recomienda.", ["4.6"])
+    assert cache.lookup("62917", 1, 10, [1.0, 0.01], ["4.6"]).answer == "No se recomienda."
+    assert cache.lookup("62917", 1, 10, [1.0, 0.01], ["4.2"]) is None
+    assert cache.lookup("62917", 1, 10, [1.0, 0.01]) is None  # Documento completo
+    assert cache.lookup("62917", 2, 10, [1.0, 0.01], ["4.6"]) is None
+
+
+def test_umbral_y_fecha(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("62917", 1, 10, "pregunta", [1.0, 0.0], "respuesta")
+    assert cache.lookup("62917", 1, 10, [1.0, 0.5]) is None  # Similitud ~0.89
+    assert cache.lookup("62917", 1, 11, [1.0, 0.0]) is None  # Documento actualizado
+    assert cache.lookup("62917", 1, 10, [1.0, 0.0]) is None  # Las respuestas caducadas se borran
+
+
+def test_persistencia_e_invalidacion(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("62917", 1, 10, "pregunta", [0.0, 1.0], "respuesta", ["4.6", "4.2"])
+    cache.close()
+    cache = _cache(tmp_path)
+    assert cache.lookup("62917", 1, 10, [0.0, 1.0], ["4.2", "4.6"]).answer == "respuesta"
+    cache.invalidate("62917")
+    assert cache.lookup("62917", 1, 10, [0.0, 1.0], ["4.2", "4.6"]) is None
+
+
+def test_expulsion_lru(tmp_path):
+    cache = _cache(tmp_path, max_entries=1)
+    cache.store("1", 1, 1, "a", [1.0, 0.0], "a")
+    cache.store("2", 1, 1, "b", [1.0, 0.0], "b")
+    assert cache.lookup("1", 1, 1, [1.0, 0.0]) is None
+    assert cache.lookup("2", 1, 1, [1.0, 0.0]).answer == "b"
+
+
+def test_tabla_sin_apartados_se_descarta(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE answers (id INTEGER PRIMARY KEY, nregistro TEXT, tipo INTEGER, fecha INTEGER, "
+                 "question TEXT, embedding BLOB, answer TEXT, last_used REAL)")
+    conn.close()
+    cache = SemanticAnswerCache(path)
+    cache.store("62917", 1, 10, "pregunta", [1.0], "respuesta", ["4.6"])
+    assert cache.lookup("62917", 1, 10, [1.0], ["4.6"]).answer == "respuesta"
+
+
+def test_desactivada_por_defecto(monkeypatch):
+    monkeypatch.delenv("ANSWER_CACHE_PATH", raising=False)
+    assert get_answer_cache() is None
+
+
+def test_tune_threshold():
+    pares = [([1.0, 0.0], [1.0, 0.1], True), ([1.0, 0.0], [1.0, 0.3], False), ([1.0, 0.0], [1.0, 0.5], True)]
+    result = tune_threshold(pares)
+    assert 0.95 < result["umbral"] < 0.96
+    assert result["aciertos"] == 0.5
+
+
+def test_memoria_acotada(tmp_path):
+    cache = _cache(tmp_path, max_loaded=2)
+    for nregistro in ("1", "2", "3"):
+        cache.store(nregistro, 1, 1, "a", [1.0, 0.0], nregistro)
+    assert list(cache._loaded) == [("2", 1, ""), ("3", 1, "")]
+    assert cache.lookup("1", 1, 1, [1.0, 0.0]).answer == "1"  # Se vuelve a leer de disco
+    assert list(cache._loaded) == [("3", 1, ""), ("1", 1, "")]
+
+
+def test_memoria_sin_entradas_caducadas_ni_expulsadas(tmp_path):
+    cache = _cache(tmp_path, max_entries=1)
+    cache.store("1", 1, 1, "a", [1.0, 0.0], "a")
+    cache.store("2", 1, 1, "b", [1.0, 0.0], "b")
+    assert ("1", 1, "") not in cache._loaded  # Expulsada por LRU
+    assert cache.lookup("2", 1, 2, [1.0, 0.0]) is None
+    assert not cache._loaded  # Caducada al cambiar la fecha del documento
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("langchain")
+async_api_calls = pytest.importorskip("async_api_calls")
+from api_calls import PresentacionQueryParams
+
+
+def _client(handler):
+    client = async_api_calls.AsyncCimaClient(max_retries=0)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_get_json_cuerpo_no_valido():
+    async def main():
+        async with _client(lambda request: httpx.Response(200, content=b"")) as client:
+            return await client.get_presentacion(PresentacionQueryParams(codNacional="726684"))
+
+    assert asyncio.run(main()) is None
+
+
+def test_gather_aisla_los_errores():
+    async def fn(item):
+        if item == 2:
+            raise RuntimeError("fallo")
+        await asyncio.sleep(0)
+        return item * 10
+
+    async def main():
+        async with _client(lambda request: httpx.Response(200)) as client:
+            return await client.gather(fn, [1, 2, 3], max_concurrency=2)
+
+    assert asyncio.run(main()) == [10, None, 30]
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("langchain")
+atc_index = pytest.importorskip("atc_index")
+
+ENTRADAS = [
+    ("N", "Sistema nervioso"), ("N02", "Analgésicos"), ("N02B", "Otros analgésicos y antipiréticos"),
+    ("N02BE", "Anilidas"), ("N02BE01", "Paracetamol"), ("N02BE51", "Paracetamol, combinaciones excl. psicolépticos"),
+    ("M01", "Productos antiinflamatorios y antirreumáticos"), ("M01A", "Productos antiinflamatorios y antirreumáticos no esteroideos"),
+    ("M01AE01", "Ibuprofeno"),
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return atc_index.AtcIndex.build(ENTRADAS)
+
+
+def test_jerarquia(index):
+    assert index.ancestros("N02BE01") == ["N", "N02", "N02B", "N02BE"]
+    assert index.principios_activos("N02") == ["N02BE01", "N02BE51"]
+    assert "M01AE" in index  # Nivel intermedio creado sin nombre
+
+
+def test_resolver(index):
+    assert index.resolver("n02be01") == ["N02BE01"]
+    assert index.resolver("Paracetamol") == ["N02BE01"]
+    assert index.resolver("analgesico") == ["N02"]
+    assert index.resolver("antiinflamatorios no esteroideos") == ["M01A"]
+
+
+@pytest.mark.parametrize("texto", ["x", "a", "", "sobredosis"])
+def test_resolver_sin_coincidencias(index, texto):
+    assert index.resolver(texto) == []
+
+
+def test_find_y_persistencia(index, tmp_path):
+    path = str(tmp_path / "atc.pkl")
+    index.save(path)
+    cargado = atc_index.AtcIndex.load(path)
+    assert cargado.find("¿Qué analgésicos hay además del paracetamol?") == ["N02", "N02BE01"]
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+from catalog_snapshot import CatalogSnapshot, export_snapshot
+
+
+def _medicamento(nregistro, nombre, lab, psum, aut=None):
+    return SimpleNamespace(nregistro=nregistro, nombre=nombre, labtitular=lab, psum=psum, comerc=True,
+                           estado=SimpleNamespace(aut=aut) if aut else None)
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    medicamentos = [
+        _medicamento("1", "IBUPROFENO CINFA 600 mg", "Cinfa S.A.", True, 946681200000),
+        _medicamento("2", "PARACETAMOL CINFA 1 g", "Cinfa S.A.", False),
+        _medicamento("3", "ASPIRINA 500 mg", "Bayer Hispania, S.L.", True),
+    ]
+    presentaciones = [SimpleNamespace(cn="726684", nregistro="1", nombre="IBUPROFENO CINFA 600 mg 40 comprimidos")]
+    path = str(tmp_path / "snapshot")
+    meta = export_snapshot(path, iter(medicamentos), iter(presentaciones), {"1": "M01AE01", "3": "N02BA01"})
+    assert meta["tablas"]["medicamentos"]["filas"] == 3
+    return CatalogSnapshot(path)
+
+
+def test_ida_y_vuelta(snapshot):
+    medicamentos = snapshot.medicamentos
+    assert len(medicamentos) == 3 and len(snapshot.presentaciones) == 1
+    filas = medicamentos.rows(columnas=["nregistro", "labtitular", "psum", "aut", "atc", "dosis"])
+    assert filas[0] == {"nregistro": "1", "labtitular": "Cinfa S.A.", "psum": True, "aut": 946681200000,
+                        "atc": "M01AE01", "dosis": None}
+    assert filas[1]["aut"] is None and filas[1]["atc"] is None
+    assert snapshot.presentaciones.rows()[0]["cn"] == "726684"
+
+
+def test_consultas(snapshot):
+    medicamentos = snapshot.medicamentos
+    mask = medicamentos.where(psum=True, labtitular="Cinfa S.A.")
+    assert [fila["nregistro"] for fila in medicamentos.rows(mask, ["nregistro"])] == ["1"]
+    assert medicamentos.count_by("labtitular", medicamentos.where(psum=True)) == {"Cinfa S.A.": 1, "Bayer Hispania, S.L.": 1}
+    assert medicamentos["nombre"].contains("paracetamol").tolist() == [False, True, False]
+    assert medicamentos["atc"].startswith("N02").tolist() == [False, False, True]
+    assert not medicamentos.where(labtitular="Normon").any()
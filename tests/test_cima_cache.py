@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from cima_cache import DIA, CimaCache
+
+BASE = "https://cima.aemps.es/cima/rest"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = CimaCache(str(tmp_path / "cima.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_clave_normaliza_parametros(cache):
+    url = f"{BASE}/medicamentos"
+    key = cache.make_key("get", url, {"nombre": " Aspirina ", "laboratorio": None})
+    assert key == cache.make_key("GET", url, {"nombre": "aspirina"})
+    assert key != cache.make_key("GET", url, {"nombre": "ibuprofeno"})
+    assert key != cache.make_key("GET", url, {"nombre": "aspirina"}, headers={"Accept": "text/html"})
+
+
+def test_ttl_por_endpoint(cache):
+    assert cache.ttl_for(f"{BASE}/medicamento?cn=726684") == 7 * DIA
+    assert cache.ttl_for(f"{BASE}/medicamentos?nombre=aspirina") == DIA
+    assert not cache.cacheable(f"{BASE}/registroCambios")
+    assert cache.ttl_for("https://otro.example/recurso") == cache.default_ttl
+
+
+def test_entrada_caducada_se_sirve_como_no_fresca(cache):
+    url = f"{BASE}/medicamentos"
+    key = cache.make_key("GET", url, {"nombre": "aspirina"})
+    cache.put(key, url, b"{}", "application/json", None)
+    assert cache.get(key).fresh
+    with cache.conn:
+        cache.conn.execute("UPDATE entries SET created = created - ?", (2 * DIA,))
+    entry = cache.get(key)
+    assert entry.body == b"{}" and not entry.fresh
+
+
+def test_invalidacion_por_nregistro(cache):
+    listado = json.dumps({"resultados": [{"nregistro": "62917"}, {"nregistro": "70000"}]}).encode()
+    url = f"{BASE}/medicamentos"
+    k_listado = cache.make_key("GET", url, {"nombre": "aspirina"})
+    cache.put(k_listado, url, listado, "application/json", None)
+    k_params = cache.make_key("GET", f"{BASE}/presentaciones", {"nregistro": "80000"})
+    cache.put(k_params, f"{BASE}/presentaciones", b"[]", "application/json", None, {"nregistro": "80000"})
+    doc = "https://cima.aemps.es/cima/dochtml/ft/80000/FichaTecnica.html"
+    k_doc = cache.make_key("GET", doc)
+    cache.put(k_doc, doc, b"<html></html>", "text/html", None)
+
+    assert cache.invalidate_nregistros(["70000"]) == 1
+    assert cache.get(k_listado) is None
+    assert cache.invalidate_nregistros(["80000"]) == 2
+    assert cache.get(k_params) is None and cache.get(k_doc) is None
+    assert cache.invalidate_nregistros([]) == 0
+
+
+def test_expulsion_lru(tmp_path):
+    cache = CimaCache(str(tmp_path / "cima.sqlite"), max_entries=2)
+    url = f"{BASE}/medicamento"
+    keys = [cache.make_key("GET", url, {"cn": str(i)}) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, url, b"{}", "application/json", None)
+        with cache.conn:
+            cache.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (i, key))
+    with cache._lock, cache.conn:
+        cache._evict_lru()
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
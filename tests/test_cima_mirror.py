@@ -0,0 +1,180 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain")
+cima_mirror = pytest.importorskip("cima_mirror")
+atc_index = pytest.importorskip("atc_index")
+from pydantic_api_models import ListaMedicamentos, ListaPresentaciones, Medicamento, RegistroCambios
+
+
+def test_map_por_tandas_no_adelanta_el_iterable():
+    producidos, lock = [], threading.Lock()
+    adelanto = []
+
+    def items():
+        for i in range(100):
+            producidos.append(i)
+            yield i
+
+    def fn(i):
+        with lock:
+            adelanto.append(len(producidos) - i)
+
+    cima_mirror._map_por_tandas(fn, items(), max_workers=2)
+    assert len(producidos) == 100 and len(adelanto) == 100
+    assert max(adelanto) <= 2 * cima_mirror.TAREAS_POR_WORKER
+
+
+def test_map_por_tandas_propaga_errores():
+    def fn(i):
+        if i == 5:
+            raise RuntimeError("fallo")
+
+    with pytest.raises(RuntimeError):
+        cima_mirror._map_por_tandas(fn, range(10), max_workers=2)
+
+
+#================================================================================================
+# Réplica con CIMA simulada
+
+ATCS = [("N02", "Analgésicos"), ("N02BE01", "Paracetamol"), ("M01AE01", "Ibuprofeno")]
+
+
+def _lista(nregistro, nombre, lab="Cinfa S.A.", rev=None, **indicadores):
+    datos = dict(nregistro=nregistro, nombre=nombre, labtitular=lab, estado={"aut": 1, "rev": rev}, cpresc="",
+                 comerc=True, receta=False, conduc=False, triangulo=False, huerfano=False, biosimilar=False,
+                 psum=False, ema=False, notas=False, materialesInf=False)
+    datos.update(indicadores)
+    return ListaMedicamentos.parse_obj(datos)
+
+
+def _detalle(lista, principio, atc):
+    return Medicamento.parse_obj(dict(
+        nregistro=lista.nregistro, nombre=lista.nombre, pactivos=principio, comerc=lista.comerc, receta=lista.receta,
+        conduc=False, triangulo=False, huerfano=False, biosimilar=False, ema=False, psum=False, notas=False,
+        materialesInf=False, principiosActivos=[{"nombre": principio}], atcs=[{"codigo": atc}],
+    ))
+
+
+def _presentacion(nregistro, cn, nombre):
+    return ListaPresentaciones.parse_obj(dict(nregistro=nregistro, cn=cn, nombre=nombre, pactivos="", comerc=True,
+                                              conduc=False, triangulo=False, huerfano=False, ema=False, psum=False, notas=False))
+
+
+class _Cache:
+    def __init__(self):
+        self.invalidados = []
+
+    def invalidate_nregistros(self, nregistros):
+        self.invalidados.extend(nregistros)
+
+
+@pytest.fixture
+def cima(monkeypatch):
+    # Estado de CIMA: listado, detalle (principio activo, ATC), presentaciones y registroCambios
+    estado = {
+        "medicamentos": {
+            "1": (_lista("1", "Ibuprofeno Cinfa 600 mg"), "IBUPROFENO", "M01AE01"),
+            "2": (_lista("2", "Paracetamol Cinfa 1 g", receta=True), "PARACETAMOL", "N02BE01"),
+        },
+        "presentaciones": {"1": [_presentacion("1", "726684", "IBUPROFENO CINFA 600 mg 40 comprimidos")]},
+        "cambios": [],
+        "cache": _Cache(),
+    }
+    medicamentos = estado["medicamentos"]
+    monkeypatch.setattr(cima_mirror, "iter_medicamentos",
+                        lambda params: iter([med[0] for n, med in medicamentos.items() if params.nregistro in (None, n)]))
+    monkeypatch.setattr(cima_mirror, "get_medicamento",
+                        lambda params, usar_mirror=True: _detalle(*medicamentos[params.nregistro]))
+    monkeypatch.setattr(cima_mirror, "iter_presentaciones",
+                        lambda params: iter([p for n, ps in estado["presentaciones"].items()
+                                             if getattr(params, "nregistro", None) in (None, n) for p in ps]))
+    monkeypatch.setattr(cima_mirror, "_iter_paginas", lambda url, params, modelo=None: iter([estado["cambios"]]))
+    monkeypatch.setattr(cima_mirror, "get_default_client", lambda: SimpleNamespace(cache=estado["cache"]))
+    index = atc_index.AtcIndex.build(ATCS)
+    monkeypatch.setattr(cima_mirror, "resolve_atc", index.resolver)
+    return estado
+
+
+@pytest.fixture
+def mirror(tmp_path, cima):
+    mirror = cima_mirror.CimaMirror(str(tmp_path / "mirror.sqlite"))
+    mirror.sync_completo(max_workers=2)
+    yield mirror
+    mirror.close()
+
+
+def _nregistros(mirror, **filtros):
+    return [med.nregistro for med in mirror.buscar_medicamentos(cima_mirror.MedicamentosQueryParams(**filtros))]
+
+
+def test_soporta(tmp_path, cima):
+    mirror = cima_mirror.CimaMirror(str(tmp_path / "mirror.sqlite"))
+    params = cima_mirror.MedicamentosQueryParams(nombre="ibuprofeno")
+    assert not mirror.soporta(params)  # Sin cargar, todo va a CIMA
+    mirror.sync_completo(max_workers=2)
+    assert mirror.soporta(params)
+    assert mirror.soporta(cima_mirror.MedicamentosQueryParams(atc="N02", comerc=True))
+    assert not mirror.soporta(cima_mirror.MedicamentosQueryParams(nombre="ibuprofeno", vmp="1"))
+
+
+def test_filtros(mirror):
+    assert _nregistros(mirror) == ["1", "2"]
+    assert _nregistros(mirror, nombre="IBUPROFENO") == ["1"]
+    assert _nregistros(mirror, laboratorio="cinfa") == ["1", "2"]
+    assert _nregistros(mirror, practiv1="paracetamol") == ["2"]
+    assert _nregistros(mirror, cn="726684") == ["1"]
+    assert _nregistros(mirror, nregistro="2") == ["2"]
+    assert _nregistros(mirror, receta=True) == ["2"]
+    assert _nregistros(mirror, npactiv=1, comerc=True) == ["1", "2"]
+
+
+def test_filtro_atc_expande_grupos(mirror):
+    assert _nregistros(mirror, atc="M01AE01") == ["1"]
+    assert _nregistros(mirror, atc="analgesicos") == ["2"]  # Descripción del grupo -> N02
+    assert _nregistros(mirror, atc="N02") == ["2"]  # Prefijo del código
+
+
+def test_sync_incremental(mirror, cima):
+    cima["medicamentos"]["3"] = (_lista("3", "Aspirina 500 mg", lab="Bayer"), "ACIDO ACETILSALICILICO", "N02BA01")
+    cima["presentaciones"]["3"] = [_presentacion("3", "712729", "ASPIRINA 500 mg 20 comprimidos")]
+    cima["medicamentos"]["1"] = (_lista("1", "Ibuprofeno Cinfa 600 mg", comerc=False), "IBUPROFENO", "M01AE01")
+    cima["medicamentos"]["2"] = (_lista("2", "Paracetamol Cinfa 1 g", rev=2), "PARACETAMOL", "N02BE01")
+    cima["cambios"] = [
+        RegistroCambios(nregistro="3", tipoCambio=1, cambios=[]),
+        RegistroCambios(nregistro="2", tipoCambio=2, cambios=["estado"]),
+        RegistroCambios(nregistro="1", tipoCambio=3, cambios=["comerc"]),
+    ]
+    assert mirror.sync_incremental(max_workers=2) == 3
+    assert sorted(cima["cache"].invalidados) == ["1", "2", "3"]
+
+    # Nuevo, con sus presentaciones
+    assert _nregistros(mirror, cn="712729") == ["3"]
+    # Modificado
+    assert _nregistros(mirror, comerc=False) == ["1"]
+    # Baja: se conserva (CIMA sigue devolviéndolo) y queda marcado
+    assert _nregistros(mirror, nregistro="2") == ["2"]
+    bajas = mirror.conn.execute("SELECT nregistro FROM medicamentos WHERE baja = 1").fetchall()
+    assert bajas == [("2",)]
+
+
+def test_baja_sin_datos_en_cima(mirror, cima):
+    del cima["medicamentos"]["2"]
+    cima["cambios"] = [RegistroCambios(nregistro="2", tipoCambio=2, cambios=["estado"])]
+    mirror.sync_incremental(max_workers=2)
+    assert _nregistros(mirror, practiv1="paracetamol") == ["2"]
+    assert mirror.conn.execute("SELECT baja FROM medicamentos WHERE nregistro = '2'").fetchone() == (1,)
+
+
+def test_activacion_opcional(tmp_path, monkeypatch):
+    monkeypatch.setattr(cima_mirror.api_calls, "_mirror", None)
+    monkeypatch.delenv("CIMA_MIRROR_PATH", raising=False)
+    assert cima_mirror.activar_mirror_desde_entorno() is None
+    assert cima_mirror.api_calls._mirror is None
+
+    monkeypatch.setenv("CIMA_MIRROR_PATH", str(tmp_path / "mirror.sqlite"))
+    mirror = cima_mirror.activar_mirror_desde_entorno()
+    assert cima_mirror.api_calls._mirror is mirror
+    mirror.close()
@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+pytest.importorskip("langchain")
+from langchain_core.language_models.fake import FakeListLLM
+from langchain.schema import HumanMessage, SystemMessage
+from conversation_memory import ConversationMemory
+from text_normalization import estimate_tokens
+
+RESUMEN_LARGO = json.dumps({"running_summary": "el usuario pregunta por el ibuprofeno " * 20, "medicamentos": ["ibuprofeno"]})
+
+
+def test_turnos_cortos_se_envian_literales():
+    memory = ConversationMemory(FakeListLLM(responses=[RESUMEN_LARGO]), token_budget=200)
+    history = [("hola", "hola, ¿en qué puedo ayudarte?")]
+    messages = memory.messages("s", history, "¿y el paracetamol?")
+    assert [type(m) for m in messages] == [HumanMessage, type(messages[1]), HumanMessage]
+    assert messages[-1].content == "¿y el paracetamol?"
+
+
+def test_resumen_acotado_y_ventana_recalculada():
+    memory = ConversationMemory(FakeListLLM(responses=[RESUMEN_LARGO]), token_budget=100, max_summary_tokens=20)
+    history = [("pregunta " * 20, "respuesta " * 20)] * 4
+    messages = memory.messages("s", history, "¿y en niños?")
+    assert isinstance(messages[0], SystemMessage)
+    assert estimate_tokens(messages[0].content) <= 20
+    assert "ibuprofeno" in messages[0].content
+    assert sum(estimate_tokens(m.content) for m in messages) <= 100
@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("pydantic", minversion="2")
+pytest.importorskip("langchain")
+api_calls = pytest.importorskip("api_calls")
+from fast_decoding import decode, decode_pagina
+from pydantic_api_models import ListaMedicamentos, Medicamento
+from row_views import decode_views
+
+LISTA = {
+    "nregistro": "62917", "nombre": "ASPIRINA 500 mg COMPRIMIDOS", "labtitular": "Bayer Hispania, S.L.",
+    "estado": {"aut": 946681200000}, "cpresc": "Sin Receta", "comerc": True, "receta": False, "conduc": False,
+    "triangulo": False, "huerfano": False, "biosimilar": False, "psum": False, "ema": False, "notas": False,
+    "materialesInf": False, "docs": [{"tipo": 1, "url": "https://cima.aemps.es/ft.pdf", "secc": True, "fecha": 1}],
+}
+
+
+@pytest.mark.parametrize("body", [b"", b"<html>Error</html>", b"{", b"null"])
+def test_decode_cuerpo_no_valido(body):
+    with pytest.raises(ValueError):
+        decode(body, Medicamento)
+    with pytest.raises(ValueError):
+        decode_views(body, ListaMedicamentos)
+
+
+def test_decode_views_lazy_y_to_model():
+    import json
+    rows = decode_views(json.dumps({"resultados": [LISTA], "totalFilas": 1}).encode(), ListaMedicamentos)
+    assert rows[0].nregistro == "62917"
+    assert rows[0]._anidados is None  # Nada anidado validado todavía
+    assert rows[0].docs[0].tipo == 1
+    assert rows[0].to_model().estado.aut == 946681200000
+    assert decode_pagina(json.dumps({"resultados": [LISTA], "totalFilas": 1}), ListaMedicamentos).totalFilas == 1
+
+
+class _Response:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+class _Client:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def get(self, url, **kwargs):
+        return _Response(self.content)
+
+    post = get
+
+
+@pytest.mark.parametrize("body", [b"", b"not json"])
+def test_endpoints_devuelven_none_con_cuerpo_no_valido(monkeypatch, body):
+    monkeypatch.setattr(api_calls, "get_default_client", lambda: _Client(body))
+    monkeypatch.setattr(api_calls, "_mirror", None)
+    assert api_calls.get_medicamento(api_calls.MedicamentoQueryParams(cn="000000")) is None
+    assert api_calls.get_medicamentos_v2(api_calls.MedicamentosQueryParamsV2(nombre="x")) is None
+    assert api_calls.get_presentaciones(api_calls.PresentacionesQueryParams(cn="000000")) is None
+
+
+def test_decode_views_valida_los_campos_simples():
+    import json
+    fila = dict(LISTA, nregistro=62917)
+    rows = decode_views(json.dumps({"resultados": [fila]}), ListaMedicamentos)
+    assert rows[0].nregistro == "62917"  # Como el espejo: números en campos de texto
+    assert isinstance(rows[0]._raw["docs"], list) and rows[0]._anidados is None
+    sin_nombre = {k: v for k, v in LISTA.items() if k != "nombre"}
+    for fila in (sin_nombre, dict(LISTA, comerc="quizá")):
+        with pytest.raises(ValueError):
+            decode_views(json.dumps({"resultados": [fila]}), ListaMedicamentos)
+    assert decode_views(b'{"totalFilas": 0}', ListaMedicamentos) == []
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_chroma")
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from drug_index import INDEX_VERSION, DrugIndexStore
+from pydantic_api_models import Documento
+
+FICHA = Documento(tipo=1, fecha=1700000000000, secc=True)
+
+
+def _store(tmp_path, **kwargs):
+    return DrugIndexStore(DeterministicFakeEmbedding(size=16), persist_directory=str(tmp_path), **kwargs)
+
+
+def _loader(texto):
+    return lambda: [Document(page_content=texto, metadata={"seccion": "4.6"})]
+
+
+def test_no_expulsa_colecciones_en_uso(tmp_path):
+    store = _store(tmp_path, max_collections=1)
+    with store.in_use("1", 1):
+        store.get_vectorstore("1", FICHA, _loader("uno"))
+        store.get_vectorstore("2", FICHA, _loader("dos"))
+        assert store.collection_name("1", 1) in store.manifest
+    store.get_vectorstore("3", FICHA, _loader("tres"))
+    assert list(store.manifest) == [store.collection_name("3", 1)]
+    assert len(store._handles) <= 1
+
+
+def test_manifiesto_versionado_con_last_used(tmp_path):
+    store = _store(tmp_path)
+    store.get_vectorstore("1", FICHA, _loader("uno"))
+    with open(tmp_path / "manifest.json", encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["version"] == INDEX_VERSION
+    assert saved["colecciones"][store.collection_name("1", 1)]["last_used"] > 0
+    assert _store(tmp_path).is_current("1", FICHA)
+
+
+def test_manifiesto_antiguo_se_descarta(tmp_path):
+    store = _store(tmp_path)
+    store.get_vectorstore("1", FICHA, _loader("uno"))
+    with open(tmp_path / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(store.manifest, f)  # Formato anterior, sin versión
+    assert _store(tmp_path).manifest == {}
+
+
+def test_documento_sin_fecha_caduca(tmp_path):
+    sin_fecha = Documento(tipo=1, secc=True)
+    store = _store(tmp_path, undated_ttl=3600)
+    store.get_vectorstore("1", sin_fecha, _loader("uno"))
+    assert store.is_current("1", sin_fecha)
+    store.manifest[store.collection_name("1", 1)]["indexed_at"] -= 7200
+    assert not store.is_current("1", sin_fecha)
+    assert not store.is_current("1", FICHA)
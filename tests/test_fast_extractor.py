@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("langchain")
+fast_extractor = pytest.importorskip("fast_extractor")
+from fast_extractor import cn_check_digit, extract_medicamento_params, extract_medicamentos_params
+
+
+@pytest.mark.parametrize("cn, digito", [("726684", 6), ("712729", 1), ("650788", 9)])
+def test_digito_de_control(cn, digito):
+    assert cn_check_digit(cn) == digito
+
+
+@pytest.mark.parametrize("consulta, cn", [
+    ("Quiero información del medicamento con código nacional 726684", "726684"),
+    ("CN: 726684.6", "726684"),
+    ("¿Qué es el 7266846?", "726684"),
+])
+def test_codigo_nacional(consulta, cn):
+    assert extract_medicamento_params(consulta).cn == cn
+
+
+@pytest.mark.parametrize("consulta", [
+    "CN 726684.5",  # Dígito de control incorrecto
+    "cn 726684 y cn 712729",  # Más de un identificador
+    "¿Para qué sirve la aspirina?",
+])
+def test_sin_identificador_valido(consulta):
+    assert extract_medicamento_params(consulta) is None
+
+
+def test_numero_de_registro():
+    assert extract_medicamento_params("número de registro 62917").nregistro == "62917"
+
+
+def test_laboratorio():
+    assert extract_medicamentos_params("Medicamentos del laboratorio Cinfa").laboratorio == "Cinfa"
+    assert extract_medicamentos_params("ibuprofeno del laboratorio Cinfa") is None
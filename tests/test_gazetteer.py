@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("langchain")
+gazetteer = pytest.importorskip("gazetteer")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return gazetteer.Gazetteer.build(
+        principios_activos=["IBUPROFENO", "ACETONA", "ACETINA", "HEMOL"],
+        laboratorios=["LABORATORIOS CINFA, S.A."],
+        nombres=["IBUPROFENO CINFA 600 mg COMPRIMIDOS RECUBIERTOS CON PELICULA EFG"],
+    )
+
+
+def test_prefiere_la_mencion_mas_larga(index):
+    assert index.extract_params("¿Para qué sirve el Ibuprofeno Cinfa?").nombre == "IBUPROFENO CINFA"
+    assert index.extract_params("medicamentos de cinfa").laboratorio == "LABORATORIOS CINFA, S.A."
+
+
+def test_corrige_erratas_sin_ambiguedad(index):
+    assert index.extract_params("dosis de ibuprofeo").practiv1 == "IBUPROFENO"
+    assert index.extract_params("dosis de ibuporfeno").practiv1 == "IBUPROFENO"  # Letras transpuestas
+
+
+def test_no_adivina_con_empates_ni_palabras_cortas(index):
+    assert index._correct("acetena") is None  # ACETONA y ACETINA a la misma distancia
+    assert index._correct("hemok") is None
+    assert index.extract_params("¿qué es la acetena?") is None
+
+
+def test_distancia():
+    assert gazetteer._distance("ibuprofeno", "ibuporfeno") == 1
+    assert gazetteer._distance("acetena", "acetona") == 1
+    assert gazetteer._distance("abc", "abc") == 0
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("langchain")
+from pydantic_api_models import Seccion
+from section_targeting import DEFAULT_MIN_CONFIDENCE, target_sections
+
+
+@pytest.mark.parametrize("pregunta, esperado", [
+    ("¿Puedo tomarlo si estoy embarazada?", ["4.6"]),
+    ("¿Cuál es la dosis recomendada?", ["4.2"]),
+    ("¿Qué hago en caso de sobredosis?", ["4.9"]),
+    ("¿Tiene lactosa entre los excipientes?", ["6.1"]),
+])
+def test_palabras_clave(pregunta, esperado):
+    assert target_sections(pregunta).secciones == esperado
+
+
+def test_prospecto_usa_sus_apartados():
+    assert target_sections("¿Puedo tomarlo durante la lactancia?", tipo=2).secciones == ["2"]
+
+
+def test_pregunta_poco_especifica_usa_el_documento_completo():
+    # Dos apartados siguen siendo una pregunta concreta; con tres o más se amplía al documento completo
+    target = target_sections("¿Qué dosis puedo tomar si estoy embarazada?")
+    assert target.secciones == ["4.2", "4.6"] and target.confianza >= DEFAULT_MIN_CONFIDENCE
+    for pregunta in ("dosis, embarazo y conducir", "dosis, embarazo, conducir y alcohol"):
+        target = target_sections(pregunta)
+        assert target.secciones == [] and target.confianza < DEFAULT_MIN_CONFIDENCE
+
+
+def test_secciones_solo_se_descargan_sin_palabras_clave():
+    llamadas = []
+
+    def secciones():
+        llamadas.append(1)
+        return [Seccion(seccion="4.4.2", titulo="Uso en pacientes pediátricos"), Seccion(seccion="6.6", titulo="Eliminación")]
+
+    assert target_sections("¿Cuál es la dosis?", 1, secciones).secciones == ["4.2"]
+    assert llamadas == []
+    target = target_sections("¿Se puede usar en pacientes pediátricos?", 1, secciones, min_confidence=0.5)
+    assert target.secciones == ["4.4"]
+    assert llamadas == [1]
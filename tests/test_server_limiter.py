@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+
+pytest.importorskip("fastapi")
+server = pytest.importorskip("server")
+from fastapi import HTTPException
+
+
+def test_reserva_sin_usar_se_libera():
+    # Desconexión antes del streaming: solo se ejecuta la tarea de fondo
+    limiter = server.OllamaLimiter(max_concurrency=1, max_queue=0)
+    slot = limiter.reserve()
+    assert limiter.pending == 1
+    slot.release()
+    assert limiter.pending == 0
+    limiter.reserve().release()
+
+
+def test_cola_llena_devuelve_429():
+    limiter = server.OllamaLimiter(max_concurrency=1, max_queue=1)
+    slots = [limiter.reserve(), limiter.reserve()]
+    with pytest.raises(HTTPException) as error:
+        limiter.reserve()
+    assert error.value.status_code == 429
+    assert "Retry-After" in error.value.headers
+    for slot in slots:
+        slot.release()
+    assert limiter.pending == 0
+
+
+def test_release_idempotente_tras_el_contexto():
+    async def run():
+        limiter = server.OllamaLimiter(max_concurrency=1, max_queue=0)
+        slot = limiter.reserve()
+        async with slot:
+            assert limiter.semaphore.locked()
+        slot.release()  # Tarea de fondo tras el streaming
+        assert limiter.pending == 0
+        assert not limiter.semaphore.locked()
+        async with limiter.reserve():
+            pass
+        assert limiter.pending == 0
+
+    asyncio.run(run())
+
+
+def test_cancelacion_esperando_turno_libera_la_reserva():
+    async def run():
+        limiter = server.OllamaLimiter(max_concurrency=1, max_queue=1)
+        first = limiter.reserve()
+        await first.__aenter__()
+        second = limiter.reserve()
+        task = asyncio.ensure_future(second.__aenter__())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        second.release()
+        await first.__aexit__(None, None, None)
+        assert limiter.pending == 0
+        assert not limiter.semaphore.locked()
+
+    asyncio.run(run())
@@ -0,0 +1,95 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain")
+api_calls = pytest.importorskip("api_calls")
+from cima_cache import CimaCache
+
+BASE = api_calls.CIMA_BASE_URL
+
+
+class _Response:
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _Client:
+    # Cliente de CIMA falso: registroCambios devuelve los cambios indicados y la caché es real
+    def __init__(self, cache, cambios):
+        self.cache = cache
+        self.cambios = cambios
+        self.peticiones = []
+
+    def get(self, url, params=None, **kwargs):
+        self.peticiones.append((url, params))
+        assert url == f"{BASE}/registroCambios"
+        return _Response({"resultados": self.cambios, "totalFilas": len(self.cambios), "tamanioPagina": 25})
+
+
+def _put(cache, nregistro):
+    url = f"{BASE}/medicamento"
+    key = cache.make_key("GET", url, {"nregistro": nregistro})
+    cache.put(key, url, json.dumps({"nregistro": nregistro}).encode(), "application/json", None)
+    return key
+
+
+def test_sincronizar_cache_invalida_los_cambiados(monkeypatch, tmp_path):
+    cache = CimaCache(str(tmp_path / "cima.sqlite"))
+    cambiado, intacto = _put(cache, "62917"), _put(cache, "70000")
+    client = _Client(cache, [{"nregistro": "62917", "tipoCambio": 3}, {"nregistro": "99999", "tipoCambio": 1}])
+    monkeypatch.setattr(api_calls, "get_default_client", lambda: client)
+
+    assert api_calls.sincronizar_cache() == 1
+    assert cache.get(cambiado) is None
+    assert cache.get(intacto) is not None
+    assert client.peticiones[0][1]["fecha"]  # Desde la entrada más antigua
+    assert cache.get_meta("last_sync") is not None
+
+    # La siguiente sincronización parte de last_sync
+    client.cambios = [{"nregistro": "70000", "tipoCambio": 2}]
+    assert api_calls.sincronizar_cache() == 1
+    assert cache.get(intacto) is None
+
+
+def test_sincronizar_cache_sin_cache(monkeypatch):
+    monkeypatch.setattr(api_calls, "get_default_client", lambda: _Client(None, []))
+    assert api_calls.sincronizar_cache() == 0
+
+
+def test_el_servidor_sincroniza_periodicamente(monkeypatch):
+    server = pytest.importorskip("server")
+    import asyncio
+    llamadas = []
+
+    def sincronizar():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            raise RuntimeError("CIMA no responde")  # Un fallo no detiene la tarea
+
+    monkeypatch.setattr(server, "sincronizar_cache", sincronizar)
+
+    async def main():
+        tarea = asyncio.create_task(server.sincronizar_periodicamente(0.01))
+        await asyncio.sleep(0.2)
+        tarea.cancel()
+
+    asyncio.run(main())
+    assert len(llamadas) >= 2
+
+
+def test_el_servidor_sincroniza_la_replica_si_esta_cargada(monkeypatch):
+    server = pytest.importorskip("server")
+    monkeypatch.setattr(server, "sincronizar_cache", lambda: "cache")
+    cargada = SimpleNamespace(sincronizada=lambda: True, sync_incremental=lambda: "mirror")
+    vacia = SimpleNamespace(sincronizada=lambda: False, sync_incremental=lambda: pytest.fail("sync completo"))
+    assert server.sincronizar(cargada) == "mirror"
+    assert server.sincronizar(vacia) == "cache"  # La carga completa no se lanza desde el servidor
+    assert server.sincronizar(None) == "cache"
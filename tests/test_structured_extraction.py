@@ -0,0 +1,37 @@
+from typing import Optional
+
+import pytest
+
+pytest.importorskip("langchain")
+from langchain.pydantic_v1 import BaseModel, Field
+from structured_extraction import compact_schema, parse_json, validate_fields
+
+
+class Params(BaseModel):
+    nombre: Optional[str] = Field(None, description="Nombre del medicamento")
+    comerc: Optional[int] = Field(None, description="""
+        1 comercializados, 0 no comercializados""")
+
+
+def test_compact_schema():
+    assert compact_schema(Params) == (
+        "- nombre (texto): Nombre del medicamento\n- comerc (entero): 1 comercializados, 0 no comercializados"
+    )
+
+
+def test_validate_fields_conserva_los_campos_validos():
+    values, errors = validate_fields(Params, {"nombre": "aspirina", "comerc": "si", "otro": 1})
+    assert values == {"nombre": "aspirina"}
+    assert list(errors) == ["comerc"] and "entero" in errors["comerc"]
+
+
+def test_validate_fields_ignora_vacios_y_rechaza_no_objetos():
+    assert validate_fields(Params, {"nombre": "", "comerc": None}) == ({}, {})
+    assert validate_fields(Params, ["aspirina"])[1] == {"__root__": "la respuesta debe ser un objeto JSON"}
+
+
+def test_parse_json_recupera_salida_cortada():
+    assert parse_json('{"nombre": "aspirina"}') == ({"nombre": "aspirina"}, None)
+    assert parse_json('texto {"nombre": "aspirina"} {"nom') == ({"nombre": "aspirina"}, None)
+    data, error = parse_json('{"nom')
+    assert data is None and error.startswith("JSON inválido")
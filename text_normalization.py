@@ -0,0 +1,12 @@
+import math, unicodedata
+
+
+# Eliminar acentos, pasar a minúsculas y compactar espacios
+def fold_text(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('utf-8').lower()
+    return " ".join(text.split())
+
+
+# Nº aproximado de tokens de un texto sin tokenizador: unos 4 caracteres por token
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
@@ -0,0 +1,223 @@
+import bisect, contextvars, json, logging, os, threading, time, uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Trazas por petición y métricas de latencia por etapa del pipeline.
+# Cada etapa se mide con span(nombre): la duración se acumula en un histograma por etapa y, si hay
+# una traza activa (activate), se añade a la traza de la petición. Las trazas se pueden escribir
+# como JSON (una por petición) en TRACE_DIR y las métricas se exponen en formato de texto de
+# Prometheus con render_prometheus(). Las métricas son por proceso: con varios workers de uvicorn
+# cada uno expone las suyas.
+
+TRACE_DIR = os.getenv("TRACE_DIR", "")  # Vacío = no escribir trazas JSON
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Límites de los buckets de latencia (segundos): de peticiones HTTP a generaciones largas
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+logger = logging.getLogger(__name__)
+
+
+#================================================================================================
+# Métricas
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series: Dict[Tuple[Tuple[str, str], ...], List] = {}  # labels -> [counts por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total}")
+                lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in key)
+                lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+STAGE_LATENCY = Histogram("searchmed_stage_duration_seconds", "Duración de cada etapa del pipeline")
+REQUEST_LATENCY = Histogram("searchmed_request_duration_seconds", "Duración total de cada petición")
+CACHE_REQUESTS = Counter("searchmed_cache_requests_total", "Consultas a las cachés por resultado (hit/miss)")
+TOKENS = Counter("searchmed_tokens_total", "Tokens procesados por el LLM por etapa (prompt/completion, estimados)")
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in (REQUEST_LATENCY, STAGE_LATENCY, CACHE_REQUESTS, TOKENS):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+#================================================================================================
+# Trazas
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.start = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.attrs: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id, "name": self.name, "start": self.start,
+            "duration": time.time() - self.start, "attrs": self.attrs, "spans": self.spans,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+class Span:
+    def __init__(self, name: str, trace: Optional[Trace], parent: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.parent = parent
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name: str, trace: Optional[Trace] = None, detached: bool = False, **attrs: Any) -> Iterator[Span]:
+    """
+    Mide una etapa. Usa la traza indicada o la activa; sin ninguna solo se actualiza el
+    histograma. Con detached=True no se modifica el contexto, de modo que el span puede abarcar
+    un yield de un generador que se reanuda en otro hilo.
+    """
+    trace = trace or _current_trace.get()
+    current = Span(name, trace, None if detached else _current_span.get(), dict(attrs))
+    token = None if detached else _current_span.set(name)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if token is not None:
+            _current_span.reset(token)
+        STAGE_LATENCY.observe(duration, stage=name)
+        if trace is not None:
+            trace.add({"name": name, "parent": current.parent, "duration": duration, **current.attrs})
+
+
+@contextmanager
+def activate(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Activa la traza en el contexto actual (para las etapas anidadas que usan span() sin trace)."""
+    if trace is None:
+        yield None
+        return
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def finish_trace(trace: Trace) -> None:
+    duration = time.time() - trace.start
+    REQUEST_LATENCY.observe(duration, name=trace.name)
+    logger.info("Petición completada", extra={"trace_id": trace.trace_id, "request": trace.name, "duration": duration})
+    if TRACE_DIR:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(os.path.join(TRACE_DIR, f"{int(trace.start)}_{trace.trace_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(trace.to_dict(), f, ensure_ascii=False, default=str)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.setdefault("cache", {})[cache] = "hit" if hit else "miss"
+
+
+def record_tokens(stage: str, prompt: int = 0, completion: int = 0, trace: Optional[Trace] = None) -> None:
+    TOKENS.inc(prompt, stage=stage, kind="prompt")
+    TOKENS.inc(completion, stage=stage, kind="completion")
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        tokens = trace.attrs.setdefault("tokens", {}).setdefault(stage, {"prompt": 0, "completion": 0})
+        tokens["prompt"] += prompt
+        tokens["completion"] += completion
+
+
+#================================================================================================
+# Logging estructurado: una línea JSON por mensaje con la traza activa
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace = _current_trace.get()
+        if trace is not None:
+            entry["trace_id"] = trace.trace_id
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def configure_logging(level: str = LOG_LEVEL) -> None:
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)